@@ -0,0 +1,41 @@
+"""Allow one open incident per website
+
+Revision ID: 1f5a9c3e7d20
+Revises: 6e2f8b3c9a17
+Create Date: 2026-10-20 10:12:06.381552
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "1f5a9c3e7d20"
+down_revision: Union[str, None] = "6e2f8b3c9a17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # concurrent writers may have opened several: keep the latest open
+    op.execute(
+        """
+        UPDATE incident SET ended_at = started_at, duration_seconds = 0
+        WHERE ended_at IS NULL AND id NOT IN (
+            SELECT max(id) FROM incident WHERE ended_at IS NULL GROUP BY website_id
+        )
+        """
+    )
+    op.create_index(
+        "ix_incident_open_website_id",
+        "incident",
+        ["website_id"],
+        unique=True,
+        postgresql_where=sa.text("ended_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_incident_open_website_id", table_name="incident")
@@ -0,0 +1,54 @@
+"""Add website ring_position
+
+Revision ID: 3a8d5f1c7b42
+Revises: 1f5a9c3e7d20
+Create Date: 2026-10-20 14:27:45.910236
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3a8d5f1c7b42"
+down_revision: Union[str, None] = "1f5a9c3e7d20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def _position(key: str) -> int:
+    # app.probe.ring.position as of this revision
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+def upgrade() -> None:
+    op.add_column("website", sa.Column("ring_position", sa.BigInteger(), nullable=True))
+    website = sa.table(
+        "website", sa.column("id", sa.Uuid()), sa.column("ring_position")
+    )
+    connection = op.get_bind()
+    ids = connection.execute(sa.select(website.c.id)).scalars().all()
+    for start in range(0, len(ids), BATCH_SIZE):
+        connection.execute(
+            website.update()
+            .where(website.c.id == sa.bindparam("website_id"))
+            .values(ring_position=sa.bindparam("position")),
+            [
+                {"website_id": website_id, "position": _position(str(website_id))}
+                for website_id in ids[start : start + BATCH_SIZE]  # noqa: E203
+            ],
+        )
+    op.create_index(
+        op.f("ix_website_ring_position"), "website", ["ring_position"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_website_ring_position"), table_name="website")
+    op.drop_column("website", "ring_position")
@@ -0,0 +1,40 @@
+"""Add latency_estimate table
+
+Revision ID: 4b7d1e9a2c58
+Revises: 9c4e2a7d1b63
+Create Date: 2026-10-19 15:02:17.448310
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4b7d1e9a2c58"
+down_revision: Union[str, None] = "9c4e2a7d1b63"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "latency_estimate",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("website_id", sa.Uuid(), nullable=False),
+        sa.Column("mean_ms", sa.Float(), nullable=False),
+        sa.Column("variance_ms2", sa.Float(), nullable=False),
+        sa.Column("sample_count", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["website_id"],
+            ["website.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("website_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("latency_estimate")
@@ -0,0 +1,38 @@
+"""Add fingerprint and last_seen to ssllog
+
+Revision ID: 5b7e0c14a9d3
+Revises: 8e23c9664e1d
+Create Date: 2026-10-19 15:11:08.402917
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5b7e0c14a9d3"
+down_revision: Union[str, None] = "8e23c9664e1d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "ssllog",
+        sa.Column(
+            "fingerprint", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True
+        ),
+    )
+    op.add_column(
+        "ssllog", sa.Column("last_seen", sa.DateTime(timezone=True), nullable=True)
+    )
+    # existing rows each stand for a single check
+    op.execute("UPDATE ssllog SET last_seen = timestamp")
+
+
+def downgrade() -> None:
+    op.drop_column("ssllog", "last_seen")
+    op.drop_column("ssllog", "fingerprint")
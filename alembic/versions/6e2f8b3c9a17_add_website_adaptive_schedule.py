@@ -0,0 +1,35 @@
+"""Add website check_interval and next_check_at
+
+Revision ID: 6e2f8b3c9a17
+Revises: 4b7d1e9a2c58
+Create Date: 2026-10-19 16:40:52.113094
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6e2f8b3c9a17"
+down_revision: Union[str, None] = "4b7d1e9a2c58"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("website", sa.Column("check_interval", sa.Integer(), nullable=True))
+    op.add_column(
+        "website",
+        sa.Column("next_check_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(
+        op.f("ix_website_next_check_at"), "website", ["next_check_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_website_next_check_at"), table_name="website")
+    op.drop_column("website", "next_check_at")
+    op.drop_column("website", "check_interval")
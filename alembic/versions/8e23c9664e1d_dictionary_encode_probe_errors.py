@@ -0,0 +1,139 @@
+"""Dictionary-encode probe errors and compact uptimelog columns
+
+Revision ID: 8e23c9664e1d
+Revises: d1a2249c606e
+Create Date: 2026-10-19 14:02:41.730215
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8e23c9664e1d"
+down_revision: Union[str, None] = "d1a2249c606e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+checktype_enum = postgresql.ENUM("HTTP", "PING", name="checktype", create_type=False)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "error_class",
+        sa.Column("id", sa.SmallInteger(), sa.Identity(), nullable=False),
+        sa.Column(
+            "message", sqlmodel.sql.sqltypes.AutoString(length=500), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("message"),
+    )
+    op.execute(
+        """
+        INSERT INTO error_class (message)
+        SELECT DISTINCT LEFT(message, 500) FROM (
+            SELECT error_message AS message FROM uptimelog
+            WHERE error_message IS NOT NULL
+            UNION
+            SELECT error AS message FROM ssllog WHERE error IS NOT NULL
+        ) AS messages
+        """
+    )
+
+    op.add_column("uptimelog", sa.Column("error_id", sa.SmallInteger(), nullable=True))
+    op.add_column(
+        "uptimelog", sa.Column("response_time_us", sa.Integer(), nullable=True)
+    )
+    op.add_column("uptimelog", sa.Column("check_type", checktype_enum, nullable=True))
+    op.execute(
+        """
+        UPDATE uptimelog SET error_id = error_class.id
+        FROM error_class WHERE error_class.message = LEFT(uptimelog.error_message, 500)
+        """
+    )
+    # Response times were recorded in seconds until the latency sketches
+    # (37c0d964dbe1) switched the uptime task to milliseconds; rows older than
+    # a website's first sketch bucket, or of a website with no sketch at all,
+    # still hold seconds
+    op.execute(
+        """
+        UPDATE uptimelog SET response_time_us = CASE
+            WHEN uptimelog.timestamp >= (
+                SELECT MIN(latency_sketch.bucket_start) FROM latency_sketch
+                WHERE latency_sketch.website_id = uptimelog.website_id
+            ) THEN response_time * 1000
+            ELSE response_time * 1000000
+        END
+        WHERE response_time IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        UPDATE uptimelog SET check_type = COALESCE(website.check_type, 'HTTP')
+        FROM website WHERE website.id = uptimelog.website_id
+        """
+    )
+    op.alter_column(
+        "uptimelog",
+        "status_code",
+        existing_type=sa.Integer(),
+        type_=sa.SmallInteger(),
+        existing_nullable=True,
+    )
+    op.create_foreign_key(None, "uptimelog", "error_class", ["error_id"], ["id"])
+    op.drop_column("uptimelog", "error_message")
+    op.drop_column("uptimelog", "response_time")
+
+    op.add_column("ssllog", sa.Column("error_id", sa.SmallInteger(), nullable=True))
+    op.execute(
+        """
+        UPDATE ssllog SET error_id = error_class.id
+        FROM error_class WHERE error_class.message = LEFT(ssllog.error, 500)
+        """
+    )
+    op.create_foreign_key(None, "ssllog", "error_class", ["error_id"], ["id"])
+    op.drop_column("ssllog", "error")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "ssllog",
+        sa.Column("error", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    )
+    op.execute(
+        """
+        UPDATE ssllog SET error = error_class.message
+        FROM error_class WHERE error_class.id = ssllog.error_id
+        """
+    )
+    op.drop_constraint("ssllog_error_id_fkey", "ssllog", type_="foreignkey")
+    op.drop_column("ssllog", "error_id")
+
+    op.add_column(
+        "uptimelog",
+        sa.Column("error_message", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    )
+    op.add_column("uptimelog", sa.Column("response_time", sa.Integer(), nullable=True))
+    op.execute(
+        """
+        UPDATE uptimelog SET error_message = error_class.message
+        FROM error_class WHERE error_class.id = uptimelog.error_id
+        """
+    )
+    op.execute("UPDATE uptimelog SET response_time = response_time_us / 1000")
+    op.drop_constraint("uptimelog_error_id_fkey", "uptimelog", type_="foreignkey")
+    op.alter_column(
+        "uptimelog",
+        "status_code",
+        existing_type=sa.SmallInteger(),
+        type_=sa.Integer(),
+        existing_nullable=True,
+    )
+    op.drop_column("uptimelog", "check_type")
+    op.drop_column("uptimelog", "response_time_us")
+    op.drop_column("uptimelog", "error_id")
+    op.drop_table("error_class")
@@ -0,0 +1,55 @@
+"""Add DNS check type and website DNS check settings
+
+Revision ID: f0a7d3b95c21
+Revises: c41f8a2d6e07
+Create Date: 2026-10-19 16:48:12.271906
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f0a7d3b95c21"
+down_revision: Union[str, None] = "c41f8a2d6e07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # enum values can't be added inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE checktype ADD VALUE IF NOT EXISTS 'DNS'")
+    op.add_column(
+        "website",
+        sa.Column(
+            "dns_record_type", sqlmodel.sql.sqltypes.AutoString(length=5), nullable=True
+        ),
+    )
+    op.add_column(
+        "website",
+        sa.Column(
+            "dns_expected_value",
+            sqlmodel.sql.sqltypes.AutoString(length=255),
+            nullable=True,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("website", "dns_expected_value")
+    op.drop_column("website", "dns_record_type")
+    # Postgres can't drop an enum value: rebuild the type without it
+    op.execute("UPDATE website SET check_type = 'HTTP' WHERE check_type = 'DNS'")
+    op.execute("UPDATE uptimelog SET check_type = NULL WHERE check_type = 'DNS'")
+    op.execute("ALTER TYPE checktype RENAME TO checktype_old")
+    op.execute("CREATE TYPE checktype AS ENUM ('HTTP', 'PING')")
+    for table in ("website", "uptimelog"):
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN check_type "
+            "TYPE checktype USING check_type::text::checktype"
+        )
+    op.execute("DROP TYPE checktype_old")
@@ -1,10 +1,23 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID, uuid4
 
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    Index,
+    Integer,
+    LargeBinary,
+    SmallInteger,
+    UniqueConstraint,
+    text,
+)
 from sqlmodel import Field, Relationship, SQLModel
 
+from app.probe.ring import position
+
 
 class NotificationType(str, Enum):
     EMAIL = "email"
@@ -15,6 +28,7 @@ class NotificationType(str, Enum):
 class CheckType(str, Enum):
     HTTP = "http"
     PING = "ping"
+    DNS = "dns"
 
 
 class User(SQLModel, table=True):
@@ -31,6 +45,10 @@ class User(SQLModel, table=True):
     refresh_tokens: list["RefreshToken"] = Relationship(back_populates="user")
 
 
+def _ring_position(context) -> int:
+    return position(str(UUID(str(context.get_current_parameters()["id"]))))
+
+
 class Website(SQLModel, table=True):
     id: UUID = Field(default_factory=lambda: uuid4(), primary_key=True)
     user_id: UUID = Field(..., foreign_key="user.id", index=True)
@@ -61,9 +79,39 @@ class Website(SQLModel, table=True):
         default=30
     )  # configurable number of days for warning on ssl expiry
     uptime_last_checked: datetime | None = Field(default=None)
+    # adaptive scheduling state (app.utils.frequency): seconds between checks
+    # and when the next one is due
+    check_interval: int | None = Field(default=None)
+    next_check_at: datetime | None = Field(default=None, index=True)
+    # position of the website's id on the probe daemons' hash ring, so each
+    # daemon selects its share by range
+    ring_position: int | None = Field(
+        default=None,
+        index=True,
+        sa_type=BigInteger,
+        sa_column_kwargs={"default": _ring_position},
+    )
     check_type: Optional[CheckType] = Field(
         default=CheckType.HTTP
     )  # type of check to perform (HTTP, PING, etc.)
+    dns_record_type: str | None = Field(
+        default=None, max_length=5
+    )  # record queried by DNS checks (A when unset)
+    dns_expected_value: str | None = Field(
+        default=None, max_length=255
+    )  # value one of the records must match, any answer passes when unset
+    probe_method: str | None = Field(
+        default=None, max_length=4
+    )  # HTTP checks: "head", "get" or "auto" (HEAD, GET if unsupported) when unset
+    max_body_bytes: int | None = Field(
+        default=None
+    )  # body bytes read when the content is checked, settings default when unset
+    content_assertions: List[Dict[str, str]] | None = Field(
+        default=None, sa_type=JSON
+    )  # [{"type": "contains", "value": "Add to cart"}, ...], HTTP checks only
+    deleted_at: datetime | None = Field(
+        default=None, index=True
+    )  # set when deletion is requested; rows are purged in the background
     user: User | None = Relationship(back_populates="websites")
 
 
@@ -77,27 +125,138 @@ class NotificationPreference(SQLModel, table=True):
     user: Optional[User] = Relationship(back_populates="notification_preferences")
 
 
+class ErrorClass(SQLModel, table=True):
+    """
+    Distinct probe error messages, referenced from log rows by a small id
+    instead of repeating the full message on every failed check
+    """
+
+    __tablename__ = "error_class"
+
+    # SQLite only autoincrements INTEGER primary keys
+    id: int | None = Field(
+        default=None,
+        primary_key=True,
+        sa_type=SmallInteger().with_variant(Integer, "sqlite"),
+    )
+    message: str = Field(..., unique=True, nullable=False, max_length=500)
+
+
 class UptimeLog(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     # TODO: add index to website_id and timestamp
     website_id: UUID = Field(..., foreign_key="website.id")
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), index=True
+    )
     is_up: bool
-    response_time: int | None  # milliseconds
-    status_code: int | None
-    error_message: str | None
+    response_time_us: int | None = Field(default=None)  # microseconds
+    # phases of response_time_us, for HTTP checks (dns_us for ping checks too)
+    dns_us: int | None = Field(default=None)  # host name resolution, microseconds
+    connect_us: int | None = Field(default=None)  # TCP handshake
+    tls_us: int | None = Field(default=None)  # TLS handshake
+    ttfb_us: int | None = Field(default=None)  # request sent to response headers
+    bytes_downloaded: int | None = Field(default=None)  # response bytes received
+    tls_resumed: bool | None = Field(default=None)  # TLS session resumed, HTTPS only
+    status_code: int | None = Field(default=None, sa_type=SmallInteger)
+    error_id: int | None = Field(
+        default=None, foreign_key="error_class.id", sa_type=SmallInteger
+    )
+    check_type: Optional[CheckType] = Field(default=CheckType.HTTP)
+
+
+class Incident(SQLModel, table=True):
+    __table_args__ = (
+        # at most one open incident per website
+        Index(
+            "ix_incident_open_website_id",
+            "website_id",
+            unique=True,
+            postgresql_where=text("ended_at IS NULL"),
+            sqlite_where=text("ended_at IS NULL"),
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    website_id: UUID = Field(..., foreign_key="website.id", index=True)
+    started_at: datetime = Field(..., index=True)  # timestamp of the first failure
+    ended_at: datetime | None = Field(
+        default=None, index=True
+    )  # timestamp of the recovery; None while the incident is open
+    duration_seconds: int | None = Field(default=None)
+    failure_count: int = Field(default=1)  # failed checks seen during the incident
+    cause: str | None = None  # error message of the first failed check
+
+
+class LatencySketch(SQLModel, table=True):
+    __tablename__ = "latency_sketch"
+    __table_args__ = (UniqueConstraint("website_id", "bucket_start"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    website_id: UUID = Field(..., foreign_key="website.id", index=True)
+    bucket_start: datetime = Field(..., index=True)  # start of the hourly bucket
+    sample_count: int = Field(default=0)
+    sketch: bytes = Field(
+        sa_column=Column(LargeBinary, nullable=False)
+    )  # serialised QuantileSketch of response times in milliseconds
+
+
+class LatencyEstimate(SQLModel, table=True):
+    """
+    Running estimate of a website's HTTP response time, updated by every up
+    check, from which its probes' timeouts are derived
+    """
+
+    __tablename__ = "latency_estimate"
+
+    id: int | None = Field(default=None, primary_key=True)
+    website_id: UUID = Field(..., foreign_key="website.id", unique=True)
+    mean_ms: float = Field(default=0.0)  # exponentially weighted moving average
+    variance_ms2: float = Field(default=0.0)  # exponentially weighted variance
+    sample_count: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class UptimeDay(SQLModel, table=True):
+    __tablename__ = "uptime_day"
+    __table_args__ = (UniqueConstraint("website_id", "day"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    website_id: UUID = Field(..., foreign_key="website.id", index=True)
+    day: date = Field(..., index=True)
+    # one bit per check slot of the day; see app.utils.bitmap
+    up_bits: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    known_bits: bytes = Field(
+        sa_column=Column(LargeBinary, nullable=False)
+    )  # slots for which a check result exists
 
 
 class SSLLog(SQLModel, table=True):
+    """
+    One row per certificate state of a website: a new row is only written when
+    the certificate, its validity or the check error changes, otherwise
+    last_seen is moved forward
+    """
+
     id: int | None = Field(default=None, primary_key=True)
     website_id: UUID = Field(..., foreign_key="website.id")
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), index=True
+    )  # first check that saw this state
+    last_seen: datetime | None = Field(
+        default_factory=lambda: datetime.now(timezone.utc)
+    )  # latest check that saw this state
+    fingerprint: str | None = Field(
+        default=None, max_length=64
+    )  # SHA-256 of the DER certificate
     valid_until: Optional[datetime] = Field(
         default=None
     )  # Expiry date of the SSL certificate
     issuer: str | None = None  # Certificate issuer (e.g., "Let's Encrypt") or None
     is_valid: bool  # Whether the certificate is valid
-    error: str | None = None  # Store error messages if the check fails
+    error_id: int | None = Field(
+        default=None, foreign_key="error_class.id", sa_type=SmallInteger
+    )  # error of a failed check, see ErrorClass
 
 
 class RefreshToken(SQLModel, table=True):
@@ -105,7 +264,7 @@ class RefreshToken(SQLModel, table=True):
     id: UUID = Field(default_factory=lambda: uuid4(), primary_key=True)
     user_id: UUID = Field(foreign_key="user.id", index=True)
     token_hash: str = Field(max_length=128, index=True)  # Hashed token
-    expires_at: datetime
+    expires_at: datetime = Field(index=True)
     issued_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     user: Optional[User] = Relationship(back_populates="refresh_tokens")
 
@@ -124,7 +283,7 @@ class AdHocSSLLog(SQLModel, table=True):
     is_valid: bool = Field(nullable=False)
     error: Optional[str] = Field(default=None, nullable=True)
     timestamp: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False, index=True
     )
 
 
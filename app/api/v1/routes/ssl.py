@@ -69,6 +69,9 @@ def get_ssl_logs(
     limit: int = Query(10, ge=1, le=100, description="Number of logs to return"),
     cursor: int
     | None = Query(None, ge=0, description="ID of the last log from the previous page"),
+    expand: bool = Query(
+        False, description="Return one entry per check instead of per certificate"
+    ),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> PaginatedSSLLogResponse:
@@ -83,6 +86,6 @@ def get_ssl_logs(
         )
 
     ssl_logs = fetch_ssl_logs(
-        db, website_id, is_valid=is_valid, limit=limit, cursor=cursor
+        db, website_id, is_valid=is_valid, limit=limit, cursor=cursor, expand=expand
     )
     return PaginatedSSLLogResponse(**ssl_logs)
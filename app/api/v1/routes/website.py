@@ -1,5 +1,6 @@
-from datetime import datetime
-from typing import Optional
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
@@ -7,8 +8,13 @@ from sqlmodel import Session
 
 from app.api.v1.models import User
 from app.api.v1.schemas import (
+    AvailabilityResponse,
+    IncidentStatsResponse,
+    LatencyPercentilesResponse,
+    PaginatedIncidentResponse,
     PaginatedUptimeLogResponse,
     PaginatedWebsiteReadResponse,
+    UptimeSummaryResponse,
     WebsiteCreate,
     WebsiteRead,
     WebsiteSearchResponse,
@@ -16,19 +22,59 @@ from app.api.v1.schemas import (
 )
 from app.auth import get_current_user
 from app.dependencies.db import get_db
+from app.tasks.retention import purge_website
 from app.utils.crud import (
     create_website,
     delete_website,
+    fetch_incidents,
     fetch_uptime_logs,
     get_all_websites,
+    get_daily_availability,
+    get_incident_stats,
+    get_latency_percentiles,
+    get_uptime_summary,
+    get_user_website_ids,
     get_website_by_id,
     get_website_by_url,
     search_websites,
     update_website,
 )
+from app.utils.generic import as_utc
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/websites", tags=["websites"])
 
+LATENCY_DEFAULT_WINDOW = timedelta(days=7)
+INCIDENT_STATS_DEFAULT_WINDOW = timedelta(days=30)
+
+
+def resolve_website_ids(
+    db: Session, website_ids: Optional[List[UUID]], user_id: UUID
+) -> List[UUID]:
+    """
+    Check that the requested websites belong to the user; no selection means all
+    of the user's websites
+    """
+    owned_ids = get_user_website_ids(db, user_id)
+    if not website_ids:
+        return owned_ids
+    missing = set(website_ids) - set(owned_ids)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Websites not found: {', '.join(map(str, missing))}",
+        )
+    return list(dict.fromkeys(website_ids))
+
+
+def validate_quantiles(quantiles: List[float]) -> None:
+    if any(not 0 <= q <= 1 for q in quantiles):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Quantiles must be between 0 and 1",
+        )
+
 
 @router.post("/", response_model=WebsiteRead, status_code=status.HTTP_201_CREATED)
 def create_website_endpoint(
@@ -83,6 +129,47 @@ def search_websites_endpoint(
     return WebsiteSearchResponse(**result)
 
 
+@router.get("/availability", response_model=AvailabilityResponse)
+def get_availability_endpoint(
+    website_ids: Optional[List[UUID]] = Query(
+        None, description="Websites to include; defaults to all of the user's sites"
+    ),
+    days: int = Query(90, ge=1, le=366),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> AvailabilityResponse:
+    """
+    Daily availability bars for many websites (e.g. a 90-day status page)
+    """
+    website_ids = resolve_website_ids(db, website_ids, current_user.id)
+    end_day = datetime.now(timezone.utc).date()
+    start_day = end_day - timedelta(days=days - 1)
+    result = get_daily_availability(db, website_ids, start_day, end_day)
+    return AvailabilityResponse(**result)
+
+
+@router.get("/latency", response_model=LatencyPercentilesResponse)
+def get_fleet_latency_endpoint(
+    website_ids: Optional[List[UUID]] = Query(
+        None, description="Websites to include; defaults to all of the user's sites"
+    ),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    q: List[float] = Query([0.5, 0.95, 0.99], description="Quantiles in [0, 1]"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> LatencyPercentilesResponse:
+    """
+    Response time percentiles merged across several websites
+    """
+    website_ids = resolve_website_ids(db, website_ids, current_user.id)
+    validate_quantiles(q)
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - LATENCY_DEFAULT_WINDOW
+    result = get_latency_percentiles(db, website_ids, start, end, quantiles=q)
+    return LatencyPercentilesResponse(website_ids=website_ids, **result)
+
+
 @router.get("/{website_id}", response_model=WebsiteRead)
 def get_single_website_endpoint(
     website_id: UUID,
@@ -118,6 +205,103 @@ def get_uptime_logs(
     return PaginatedUptimeLogResponse(**result)
 
 
+@router.get("/{website_id}/uptime-logs/summary", response_model=UptimeSummaryResponse)
+def get_uptime_summary_endpoint(
+    website_id: UUID,
+    start: datetime = Query(...),
+    end: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> UptimeSummaryResponse:
+    """
+    Check counts, availability and mean response time over a window, including
+    checks that have been moved to the archive
+    """
+    website = get_website_by_id(db, website_id, current_user.id)
+    if not website:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Website not found"
+        )
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    result = get_uptime_summary(db, website_id, as_utc(start), end)
+    return UptimeSummaryResponse(website_id=website_id, **result)
+
+
+@router.get("/{website_id}/latency", response_model=LatencyPercentilesResponse)
+def get_latency_endpoint(
+    website_id: UUID,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    q: List[float] = Query([0.5, 0.95, 0.99], description="Quantiles in [0, 1]"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> LatencyPercentilesResponse:
+    """
+    Response time percentiles for a website, computed from latency sketches
+    """
+    website = get_website_by_id(db, website_id, current_user.id)
+    if not website:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Website not found"
+        )
+    validate_quantiles(q)
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - LATENCY_DEFAULT_WINDOW
+    result = get_latency_percentiles(db, [website_id], start, end, quantiles=q)
+    return LatencyPercentilesResponse(website_ids=[website_id], **result)
+
+
+@router.get("/{website_id}/incidents", response_model=PaginatedIncidentResponse)
+def get_incidents_endpoint(
+    website_id: UUID,
+    start: Optional[datetime] = Query(None, description="Only incidents after this"),
+    end: Optional[datetime] = Query(None, description="Only incidents before this"),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> PaginatedIncidentResponse:
+    """
+    List outages of a website, oldest first
+    """
+    website = get_website_by_id(db, website_id, current_user.id)
+    if not website:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Website not found"
+        )
+    result = fetch_incidents(
+        db, website_id, start=start, end=end, limit=limit, cursor=cursor
+    )
+    return PaginatedIncidentResponse(**result)
+
+
+@router.get("/{website_id}/incidents/stats", response_model=IncidentStatsResponse)
+def get_incident_stats_endpoint(
+    website_id: UUID,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> IncidentStatsResponse:
+    """
+    Downtime, MTTR and MTBF of a website over a window (default: last 30 days)
+    """
+    website = get_website_by_id(db, website_id, current_user.id)
+    if not website:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Website not found"
+        )
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - INCIDENT_STATS_DEFAULT_WINDOW
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end",
+        )
+    result = get_incident_stats(db, website_id, start, end)
+    return IncidentStatsResponse(website_id=website_id, **result)
+
+
 @router.patch("/{website_id}", response_model=WebsiteRead)
 def update_website_endpoint(
     website_id: UUID,
@@ -155,4 +339,9 @@ def delete_website_endpoint(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Website with id {website_id} not found",
         )
+    try:
+        purge_website.delay(str(website_id))
+    except Exception as exc:
+        # the website is marked deleted: requeue_stale_purges will purge it
+        logger.warning(f"Can't queue the purge of website {website_id}: {exc}")
     return None
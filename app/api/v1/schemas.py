@@ -1,10 +1,11 @@
-from datetime import datetime
+import re
+from datetime import date, datetime
 from enum import Enum
 from re import fullmatch
-from typing import List, Optional, Union
+from typing import Dict, List, Literal, Optional, Union
 from uuid import UUID
 
-from pydantic import BaseModel, EmailStr, HttpUrl, field_validator
+from pydantic import BaseModel, EmailStr, Field, HttpUrl, field_validator
 
 
 class NotificationType(str, Enum):
@@ -13,6 +14,58 @@ class NotificationType(str, Enum):
     SLACK = "slack"
 
 
+CHECK_TYPES = ("http", "ping", "dns")
+DNS_RECORD_TYPES = ("A", "AAAA", "CNAME", "MX", "NS", "TXT")
+PROBE_METHODS = ("auto", "head", "get")
+MAX_BODY_BYTES_LIMIT = 1024 * 1024
+MAX_CONTENT_ASSERTIONS = 20
+
+
+def validate_check_type(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return value
+    value = value.lower()
+    if value not in CHECK_TYPES:
+        raise ValueError(f"check_type must be one of {', '.join(CHECK_TYPES)}")
+    return value
+
+
+def validate_dns_record_type(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return value
+    value = value.upper()
+    if value not in DNS_RECORD_TYPES:
+        raise ValueError(
+            f"dns_record_type must be one of {', '.join(DNS_RECORD_TYPES)}"
+        )
+    return value
+
+
+def validate_probe_method(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return value
+    value = value.lower()
+    if value not in PROBE_METHODS:
+        raise ValueError(f"probe_method must be one of {', '.join(PROBE_METHODS)}")
+    return value
+
+
+class ContentAssertion(BaseModel):
+    """A substring or regex the body of an HTTP check must (not) contain"""
+
+    type: Literal["contains", "not_contains", "regex", "not_regex"]
+    value: str = Field(min_length=1, max_length=255)
+
+    @field_validator("value")
+    def validate_regex(cls, value: str, info) -> str:
+        if info.data.get("type", "").endswith("regex"):
+            try:
+                re.compile(value)
+            except re.error as exc:
+                raise ValueError(f"Invalid regex: {exc}")
+        return value
+
+
 class UserBase(BaseModel):
     email: EmailStr
     slack_webhook: str | None
@@ -89,12 +142,23 @@ class WebsiteBase(BaseModel):
     is_active: Union[int, bool] = True  # Accept int or bool, normalize later
     ssl_check_enabled: Union[int, bool] = True
     check_type: Optional[str] = "http"  # Default to HTTP check
+    dns_record_type: Optional[str] = None  # DNS checks only, defaults to A
+    dns_expected_value: Optional[str] = None
+    probe_method: Optional[str] = None  # HTTP checks only, defaults to auto
+    max_body_bytes: Optional[int] = Field(default=None, gt=0, le=MAX_BODY_BYTES_LIMIT)
+    content_assertions: Optional[List[ContentAssertion]] = Field(
+        default=None, max_length=MAX_CONTENT_ASSERTIONS
+    )
 
     @field_validator("is_active", "ssl_check_enabled", mode="before")
     def normalize_bool(cls, v):
         """Convert int (0/1) to bool if needed"""
         return bool(v) if isinstance(v, int) else v
 
+    _check_type = field_validator("check_type")(validate_check_type)
+    _dns_record_type = field_validator("dns_record_type")(validate_dns_record_type)
+    _probe_method = field_validator("probe_method")(validate_probe_method)
+
 
 class WebsiteCreate(WebsiteBase):
     url: HttpUrl
@@ -126,11 +190,22 @@ class WebsiteUpdate(BaseModel):
     is_active: Optional[Union[int, bool]] = None
     ssl_check_enabled: Optional[Union[int, bool]] = None
     check_type: Optional[str] = "http"
+    dns_record_type: Optional[str] = None
+    dns_expected_value: Optional[str] = None
+    probe_method: Optional[str] = None  # HTTP checks only, defaults to auto
+    max_body_bytes: Optional[int] = Field(default=None, gt=0, le=MAX_BODY_BYTES_LIMIT)
+    content_assertions: Optional[List[ContentAssertion]] = Field(
+        default=None, max_length=MAX_CONTENT_ASSERTIONS
+    )
 
     @field_validator("is_active", "ssl_check_enabled", mode="before")
     def normalize_bool(cls, v):
         return bool(v) if isinstance(v, int) else v
 
+    _check_type = field_validator("check_type")(validate_check_type)
+    _dns_record_type = field_validator("dns_record_type")(validate_dns_record_type)
+    _probe_method = field_validator("probe_method")(validate_probe_method)
+
 
 class WebsiteSearchResponse(BaseModel):
     data: List[WebsiteRead]
@@ -158,6 +233,8 @@ class SSLLogResponse(BaseModel):
     is_valid: bool
     error: str | None = None
     timestamp: datetime
+    last_seen: datetime | None = None
+    fingerprint: str | None = None
 
     class Config:
         from_attributes = True
@@ -170,14 +247,27 @@ class PaginatedSSLLogResponse(BaseModel):
     has_next: bool = False
 
 
+class ProbePhases(BaseModel):
+    """Time spent in each phase of a check, in milliseconds"""
+
+    dns: Optional[float] = None
+    connect: Optional[float] = None
+    tls: Optional[float] = None
+    ttfb: Optional[float] = None  # request sent to first response byte
+
+
 class UptimeLogResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None for checks read back from the archive
     website_id: UUID
     timestamp: datetime
     is_up: bool
     status_code: Optional[int]
-    response_time: Optional[float]
+    response_time: Optional[float]  # milliseconds
+    phases: Optional[ProbePhases] = None  # breakdown of response_time
+    bytes_downloaded: Optional[int] = None
+    tls_resumed: Optional[bool] = None  # HTTPS checks: TLS session resumed
     error_message: Optional[str]
+    check_type: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -189,6 +279,67 @@ class PaginatedUptimeLogResponse(BaseModel):
     has_next: bool = False  # More logs available?
 
 
+class UptimeSummaryResponse(BaseModel):
+    website_id: UUID
+    start: datetime
+    end: datetime
+    checks: int
+    up_checks: int
+    availability: Optional[float] = None
+    avg_response_time: Optional[float] = None  # milliseconds
+
+
+class IncidentResponse(BaseModel):
+    id: int
+    website_id: UUID
+    started_at: datetime
+    ended_at: Optional[datetime] = None
+    duration_seconds: Optional[int] = None
+    failure_count: int
+    cause: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PaginatedIncidentResponse(BaseModel):
+    data: List[IncidentResponse]
+    next_cursor: Optional[int] = None
+    has_next: bool = False
+
+
+class IncidentStatsResponse(BaseModel):
+    website_id: UUID
+    start: datetime
+    end: datetime
+    incident_count: int
+    downtime_seconds: int
+    availability: Optional[float] = None
+    mttr_seconds: Optional[float] = None  # mean time to recover
+    mtbf_seconds: Optional[float] = None  # mean time between failures
+
+
+class WebsiteAvailability(BaseModel):
+    website_id: UUID
+    availability: Optional[float] = None  # over the whole range
+    checks: int
+    days: List[Optional[float]]  # one entry per day, oldest first
+
+
+class AvailabilityResponse(BaseModel):
+    start_day: date
+    end_day: date
+    data: List[WebsiteAvailability]
+
+
+class LatencyPercentilesResponse(BaseModel):
+    website_ids: List[UUID]
+    start: datetime
+    end: datetime
+    sample_count: int
+    percentiles: Dict[str, Optional[float]]  # e.g. {"p50": 120.4} in milliseconds
+
+
 class APIKeyResponse(BaseModel):
     key: str
     created_at: datetime
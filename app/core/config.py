@@ -1,3 +1,5 @@
+from typing import Dict
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -9,5 +11,41 @@ class Settings(BaseSettings):
     db_port: str
     secret_key: str
     encryption_algo: str
+    archive_dir: str = "/var/lib/pulsecheck/archive"  # columnar uptime archives
+    spool_dir: str = "/var/lib/pulsecheck/spool"  # results kept while the DB is down
+    redis_url: str = "redis://redis:6379/0"
+    # where probe workers send results: "db" writes them directly, "stream"
+    # publishes them to Redis for the ingest service (python -m app.ingest)
+    results_sink: str = "db"
+    # probe politeness: concurrent probes and seconds between probe starts
+    probe_host_concurrency: int = 2
+    probe_host_min_spacing: float = 1.0
+    probe_ip_concurrency: int = 8
+    probe_ip_min_spacing: float = 0.1
+    # share of each dispatch window a tenant (user id) gets relative to the
+    # others, e.g. {"<user id>": 2.0} on a JSON env var; tenants not listed get 1
+    probe_tenant_weights: Dict[str, float] = {}
+    # body bytes read by HTTP probes that inspect the content, unless overridden
+    probe_max_body_bytes: int = 65536
+    # bounds (seconds) of the HTTP probe timeouts adapted to each website's
+    # response times; websites without enough history get the ceiling
+    probe_timeout_floor: float = 2.0
+    probe_timeout_ceiling: float = 10.0
+    # "fixed" checks every website every 5 minutes; "adaptive" checks down and
+    # flapping websites more often, down to the floor (seconds), and relaxes
+    # back to 5 minutes once they are stable
+    uptime_schedule: str = "fixed"
+    uptime_interval_floor: int = 60
+    # most probe tasks one scheduler tick may publish, however idle the workers
+    uptime_dispatch_max_per_tick: int = 20000
+    # standalone probe daemon (python -m app.probe): its name (the host name
+    # when unset), the comma separated names of all daemons sharing the
+    # websites, probes in flight at once, websites claimed per poll and
+    # seconds between polls
+    probe_daemon_name: str = ""
+    probe_daemon_members: str = ""
+    probe_daemon_concurrency: int = 2000
+    probe_daemon_batch_size: int = 5000
+    probe_daemon_poll_interval: float = 5.0
 
     model_config = SettingsConfigDict(env_file="../.env")
@@ -1,7 +1,8 @@
 import os
 
-from celery import Celery
+from celery import Celery, signals
 from celery.schedules import crontab
+from kombu import Exchange, Queue
 
 BROKER_URL = os.getenv("CELERY_BROKER_URL")
 RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
@@ -10,27 +11,217 @@ celery_app = Celery(
     "worker",
     broker=BROKER_URL,
     backend=RESULT_BACKEND,
-    include=["app.tasks"],
+    include=[
+        "app.tasks.retention",
+        "app.tasks.ssl_checker",
+        "app.tasks.uptime_monitor",
+    ],
 )
 
+MAX_PRIORITY = 9  # RabbitMQ priorities 0 (lowest) to 9
+
+# One queue per workload, so each can be served by its own worker pool
+# (celery worker -Q uptime) and a burst in one doesn't delay the others:
+#   scheduling     periodic dispatchers, quick and never retried by the broker
+#   uptime         uptime probes, every 5 minutes and latency sensitive
+#   ssl            certificate checks: the midnight sweep and API triggered ones
+#   ingest         bulk database work: retention and purges
+QUEUES = ("scheduling", "uptime", "ssl", "ingest")
+
+# Uptime workers also consume a queue of their own, named after the worker:
+# the scheduler routes each probe target to one of them by consistent hashing
+# (app.utils.sharding), so a target meets the same warm DNS cache every time.
+# A shard queue left by its worker is deleted once unused for an hour; its
+# probes would have expired by then
+SHARD_EXCHANGE = "uptime"
+SHARD_QUEUE_EXPIRES_MS = 3600 * 1000
+
+# Tasks prefetched per worker process. Probes mostly wait on the network, so a
+# few in hand keep the pool busy; long tasks take one at a time so they don't
+# sit behind each other on one process while other processes are idle
+QUEUE_PREFETCH = {
+    "scheduling": 1,
+    "uptime": 4,
+    "ssl": 1,
+    "ingest": 1,
+}
+
+# Routing and delivery policy per task:
+#   acks_late      acknowledge once done, so a task lost with its worker is
+#                  redelivered; only for tasks safe to run twice
+#   ignore_result  fire-and-forget: nobody reads the result
+#   priority       default priority within the queue, callers may override it
+TASK_POLICIES = {
+    "app.tasks.uptime_monitor.schedule_uptime_checks": {
+        "queue": "scheduling",
+        "ignore_result": True,
+    },
+    "app.tasks.ssl_checker.periodic_ssl_check": {
+        "queue": "scheduling",
+        "ignore_result": True,
+    },
+    "app.tasks.retention.requeue_stale_purges": {
+        "queue": "scheduling",
+        "ignore_result": True,
+    },
+    "app.tasks.uptime_monitor.replay_spools": {
+        "queue": "scheduling",
+        "ignore_result": True,
+    },
+    "app.tasks.uptime_monitor.check_target_uptime": {
+        "queue": "uptime",
+        "acks_late": True,
+        "ignore_result": True,
+    },
+    "app.tasks.uptime_monitor.check_ping_targets": {
+        "queue": "uptime",
+        "acks_late": True,
+        "ignore_result": True,
+    },
+    "app.tasks.uptime_monitor.check_dns_targets": {
+        "queue": "uptime",
+        "acks_late": True,
+        "ignore_result": True,
+    },
+    "app.tasks.uptime_monitor.check_website_uptime": {
+        "queue": "uptime",
+        "acks_late": True,
+    },
+    # API triggered checks come first, the nightly sweep lowers its priority
+    "app.tasks.ssl_checker.check_ssl_status_task": {
+        "queue": "ssl",
+        "acks_late": True,
+        "ignore_result": True,
+        "priority": MAX_PRIORITY,
+    },
+    # results are spooled on the probe workers' hosts, so they replay them:
+    # replay_spools sends it to each shard queue, this is the unsharded default
+    "app.tasks.uptime_monitor.replay_spooled_results": {
+        "queue": "uptime",
+        "ignore_result": True,
+    },
+    "app.tasks.retention.purge_expired_rows": {
+        "queue": "ingest",
+        "acks_late": True,
+        "ignore_result": True,
+    },
+    "app.tasks.retention.purge_website": {
+        "queue": "ingest",
+        "acks_late": True,
+        "ignore_result": True,
+    },
+}
+
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
     result_serializer="json",
     timezone="UTC",
     result_expires=3600,
+    # each queue bound under its own name: without an exchange, every queue
+    # would share the default one and routing key, and get every task
+    task_queues=[
+        Queue(
+            name,
+            Exchange(name),
+            routing_key=name,
+            queue_arguments={"x-max-priority": MAX_PRIORITY},
+        )
+        for name in QUEUES
+    ],
+    task_default_queue="scheduling",
+    task_default_priority=5,
+    task_queue_max_priority=MAX_PRIORITY,
+    task_routes={
+        name: {"queue": policy["queue"]} for name, policy in TASK_POLICIES.items()
+    },
+    task_annotations={
+        name: {key: value for key, value in policy.items() if key != "queue"}
+        for name, policy in TASK_POLICIES.items()
+    },
+    # a late-acknowledged task whose worker died goes back to the queue
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
 )
 
+
+def shard_queue(shard: str) -> Queue:
+    """Queue of an uptime worker's shard, declared alike by worker and scheduler"""
+    name = f"uptime.{shard}"
+    return Queue(
+        name,
+        Exchange(SHARD_EXCHANGE),
+        routing_key=name,
+        queue_arguments={
+            "x-max-priority": MAX_PRIORITY,
+            "x-expires": SHARD_QUEUE_EXPIRES_MS,
+        },
+    )
+
+
+@signals.celeryd_init.connect
+def set_prefetch(conf=None, options=None, **kwargs):
+    """
+    Prefetch for the queues this worker consumes (-Q), the lowest when it
+    serves several
+    """
+    queues = (options or {}).get("queues") or QUEUES
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    conf.worker_prefetch_multiplier = min(
+        QUEUE_PREFETCH.get(queue, 1) for queue in queues
+    )
+
+
+@signals.celeryd_after_setup.connect
+def add_shard_queue(sender=None, instance=None, **kwargs):
+    """Workers consuming the uptime queue also consume their shard queue"""
+    queues = instance.app.amqp.queues
+    if "uptime" in queues.consume_from:
+        queues.select_add(shard_queue(sender))
+
+
+@signals.worker_ready.connect
+def join_shards(sender=None, **kwargs):
+    from app.utils.sharding import start_heartbeat
+
+    if shard_queue(sender.hostname).name in sender.app.amqp.queues.consume_from:
+        start_heartbeat(sender.hostname)
+
+
+@signals.worker_shutdown.connect
+def leave_shards(sender=None, **kwargs):
+    from app.utils.sharding import stop_heartbeat
+
+    stop_heartbeat()
+
+
 celery_app.conf.beat_schedule = {
     # SSL Check Task (runs daily at midnight)
     "periodic-ssl-check": {
         "task": "app.tasks.ssl_checker.periodic_ssl_check",
         "schedule": crontab(hour=0, minute=0),  # Run daily at midnight
     },
-    # Uptime check task (runs every 5 minutes)
+    # Uptime check dispatcher (runs every minute; each website is checked
+    # every 5 minutes, or more often in the adaptive schedule)
     "schedule-uptime-checks-every-minute": {
-        "task": "app.tasks.uptime_checker.schedule_uptime_checks",
-        "schedule": crontab(minute="*/5"),
+        "task": "app.tasks.uptime_monitor.schedule_uptime_checks",
+        "schedule": crontab(minute="*"),
+    },
+    # Load probe results spooled by workers during a database outage
+    "replay-spooled-results": {
+        "task": "app.tasks.uptime_monitor.replay_spools",
+        "schedule": crontab(minute="*"),
+    },
+    # Retention task (runs daily at 02:30, away from the midnight SSL sweep)
+    "purge-expired-rows": {
+        "task": "app.tasks.retention.purge_expired_rows",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    # Purges of deleted websites that were lost or never sent
+    "requeue-stale-purges": {
+        "task": "app.tasks.retention.requeue_stale_purges",
+        "schedule": crontab(minute=45),
     },
 }
 
@@ -0,0 +1,5 @@
+class DNSResolutionError(Exception):
+    """Raised when a probe target's host name cannot be resolved"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
@@ -0,0 +1,251 @@
+"""
+Bulk ingest service: reads probe results published by the workers to a Redis
+stream and writes them to the database in batches.
+
+    python -m app.ingest
+"""
+
+import logging
+import os
+import signal
+import socket
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import redis
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from app.api.v1.models import Website
+from app.dependencies.settings import get_settings
+from app.probe.results import decode_result
+from app.utils.crud import record_uptime_log
+
+logger = logging.getLogger(__name__)
+
+RESULTS_STREAM = "probe-results"
+DEAD_LETTER_STREAM = "probe-results-dead"  # entries that can't be ingested
+INGEST_GROUP = "ingest"
+MAX_STREAM_LENGTH = 1_000_000  # entries kept (approximately) for slow consumers
+BATCH_SIZE = 500  # entries written per transaction
+BLOCK_MS = 5000  # how long a read waits for new entries
+CLAIM_IDLE_MS = 60_000  # entries of a consumer idle this long are taken over
+LAG_LOG_INTERVAL = 60  # seconds between stream lag reports
+RETRY_DELAY = 5  # seconds to wait after a database error
+
+
+@lru_cache
+def get_redis() -> redis.Redis:
+    return redis.Redis.from_url(get_settings().redis_url)
+
+
+def publish_results(records: Iterable[bytes], client: Optional[redis.Redis] = None):
+    """Append encoded probe results to the results stream in one round trip"""
+    pipeline = (client or get_redis()).pipeline(transaction=False)
+    for record in records:
+        pipeline.xadd(
+            RESULTS_STREAM, {"r": record}, maxlen=MAX_STREAM_LENGTH, approximate=True
+        )
+    pipeline.execute()
+
+
+def stream_lag(client: Optional[redis.Redis] = None) -> dict:
+    """Entries published but not yet read, and read but not yet acknowledged"""
+    client = client or get_redis()
+    for group in client.xinfo_groups(RESULTS_STREAM):
+        if group["name"].decode() == INGEST_GROUP:
+            return {"lag": group.get("lag"), "pending": group["pending"]}
+    return {"lag": client.xlen(RESULTS_STREAM), "pending": 0}
+
+
+def record_result(
+    db: Session,
+    website_id: str,
+    result: dict,
+    check_type: str,
+    timestamp: datetime,
+    **kwargs,
+):
+    """Save one probe result of a website, as measured at timestamp"""
+    record_uptime_log(
+        db,
+        website_id=UUID(website_id),
+        is_up=result["is_up"],
+        status_code=result["status_code"],
+        response_time_us=result["response_time_us"],
+        dns_us=result.get("dns_us"),
+        connect_us=result.get("connect_us"),
+        tls_us=result.get("tls_us"),
+        ttfb_us=result.get("ttfb_us"),
+        bytes_downloaded=result.get("bytes_downloaded"),
+        tls_resumed=result.get("tls_resumed"),
+        error_message=result["error_message"],
+        check_type=check_type,
+        timestamp=timestamp,
+        **kwargs,
+    )
+
+
+def write_records(db: Session, records: List[bytes]) -> int:
+    """
+    Write encoded probe results in a single transaction. Returns the number of
+    uptime logs written
+    """
+    decoded = [decode_result(record) for record in records]
+    website_ids = {UUID(i) for ids, *_ in decoded for i in ids}
+    # websites may have been purged since they were probed
+    existing = {
+        str(website_id)
+        for website_id in db.exec(
+            select(Website.id).where(Website.id.in_(website_ids))
+        ).all()
+    }
+    written = 0
+    for ids, result, check_type, timestamp in decoded:
+        for website_id in ids:
+            if website_id in existing:
+                record_result(
+                    db, website_id, result, check_type, timestamp, commit=False
+                )
+                written += 1
+    db.commit()
+    return written
+
+
+class Ingester:
+    """
+    Consumer of the results stream in the ingest consumer group. Each batch is
+    written in one transaction and acknowledged after the commit, so results
+    are delivered at least once; entries of a crashed consumer are claimed
+    after CLAIM_IDLE_MS. A batch that fails for any reason but the database
+    being unavailable is written entry by entry, and the entries that still
+    fail are moved to DEAD_LETTER_STREAM, so one bad entry can't stall the
+    stream
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        session_factory,
+        consumer: Optional[str] = None,
+        batch_size: int = BATCH_SIZE,
+    ):
+        self.client = client
+        self.session_factory = session_factory
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.running = True
+
+    def ensure_group(self) -> None:
+        try:
+            self.client.xgroup_create(
+                RESULTS_STREAM, INGEST_GROUP, id="0", mkstream=True
+            )
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    def read(self, pending: bool) -> List[Tuple[bytes, dict]]:
+        """
+        Next batch: this consumer's unacknowledged entries when pending is set,
+        new entries otherwise
+        """
+        response = self.client.xreadgroup(
+            INGEST_GROUP,
+            self.consumer,
+            {RESULTS_STREAM: "0" if pending else ">"},
+            count=self.batch_size,
+            block=None if pending else BLOCK_MS,
+        )
+        return response[0][1] if response else []
+
+    def claim_abandoned(self) -> int:
+        """Take over entries left unacknowledged by consumers that went away"""
+        _, claimed, *_ = self.client.xautoclaim(
+            RESULTS_STREAM,
+            INGEST_GROUP,
+            self.consumer,
+            CLAIM_IDLE_MS,
+            count=self.batch_size,
+        )
+        return len(claimed)
+
+    def ingest(self, entries: List[Tuple[bytes, dict]]) -> int:
+        """Write a batch to the database, then acknowledge it"""
+        # entries deleted by stream trimming come back without fields
+        records = [fields[b"r"] for _, fields in entries if fields]
+        try:
+            with self.session_factory() as db:
+                written = write_records(db, records) if records else 0
+        except OperationalError:
+            raise
+        except Exception as exc:
+            logger.warning(f"Can't ingest a batch of results ({exc}), retrying each")
+            written = sum(
+                self.ingest_one(entry_id, fields) for entry_id, fields in entries
+            )
+        self.client.xack(
+            RESULTS_STREAM, INGEST_GROUP, *(entry_id for entry_id, _ in entries)
+        )
+        return written
+
+    def ingest_one(self, entry_id: bytes, fields: dict) -> int:
+        """Write one entry, moving it to the dead-letter stream if it fails"""
+        if not fields:
+            return 0
+        try:
+            with self.session_factory() as db:
+                return write_records(db, [fields[b"r"]])
+        except OperationalError:
+            raise
+        except Exception as exc:
+            logger.error(f"Can't ingest result {entry_id!r}, dead-lettered: {exc}")
+            self.client.xadd(
+                DEAD_LETTER_STREAM,
+                {**fields, b"id": entry_id, b"error": str(exc)},
+                maxlen=MAX_STREAM_LENGTH,
+                approximate=True,
+            )
+            return 0
+
+    def run(self) -> None:
+        self.ensure_group()
+        pending = True  # first finish what a previous run of ours left
+        reported_at = 0.0
+        while self.running:
+            if time.monotonic() - reported_at >= LAG_LOG_INTERVAL:
+                reported_at = time.monotonic()
+                logger.info(f"Results stream lag: {stream_lag(self.client)}")
+                pending = pending or bool(self.claim_abandoned())
+            entries = self.read(pending)
+            if not entries:
+                pending = False
+                continue
+            try:
+                written = self.ingest(entries)
+            except OperationalError as exc:
+                logger.error(f"Database error ingesting results: {exc}")
+                pending = True
+                time.sleep(RETRY_DELAY)
+                continue
+            logger.info(f"Ingested {len(entries)} results ({written} uptime logs)")
+
+    def stop(self, *_) -> None:
+        self.running = False
+
+
+def main() -> None:
+    from app.dependencies.db import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    ingester = Ingester(get_redis(), SessionLocal)
+    signal.signal(signal.SIGTERM, ingester.stop)
+    signal.signal(signal.SIGINT, ingester.stop)
+    ingester.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Standalone probe daemon: claims due websites straight from the database and
+probes them on one event loop, instead of the Celery scheduler publishing a
+message per check. Run one per host, listing them all in
+PROBE_DAEMON_MEMBERS so they share the websites, and disable the
+schedule-uptime-checks beat entry.
+
+    python -m app.probe
+"""
+
+import asyncio
+import logging
+import signal
+
+from app.probe.daemon import ProbeDaemon
+
+
+async def main() -> None:
+    from app.dependencies.db import SessionLocal
+
+    daemon = ProbeDaemon(SessionLocal)
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, daemon.stop)
+    loop.add_signal_handler(signal.SIGINT, daemon.stop)
+    await daemon.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import math
+import ssl
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.api.v1.models import CheckType, LatencyEstimate, Website
+from app.dependencies.settings import get_settings
+from app.probe.content import compile_assertions
+from app.probe.dns import CachingResolver
+from app.probe.http import http_get
+from app.probe.tls import certificate_details, certificate_error
+from app.utils.generic import validate_url
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = 10.0  # seconds allowed for each request of an HTTP probe
+# Adaptive timeouts: a multiple of a high percentile of the website's response
+# times, estimated as the mean plus a few standard deviations
+TIMEOUT_DEVIATIONS = 4
+TIMEOUT_HEADROOM = 3
+MIN_LATENCY_SAMPLES = 5  # up checks before a website's timeout adapts
+HEDGE_AFTER = 0.5  # share of a confirmation's timeout before it is hedged
+
+
+def _tls_error(exc: BaseException) -> Optional[ssl.SSLError]:
+    """The TLS failure (an invalid certificate, say) behind a request error"""
+    while exc is not None:
+        if isinstance(exc, ssl.SSLError):
+            return exc
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def adaptive_timeout(estimate: Optional[LatencyEstimate]) -> float:
+    """
+    Seconds an HTTP probe of a website waits, from its latency estimate and
+    within the configured floor and ceiling. Websites without enough history
+    get the ceiling
+    """
+    settings = get_settings()
+    if estimate is None or estimate.sample_count < MIN_LATENCY_SAMPLES:
+        return settings.probe_timeout_ceiling
+    high_ms = estimate.mean_ms + TIMEOUT_DEVIATIONS * math.sqrt(estimate.variance_ms2)
+    return min(
+        max(TIMEOUT_HEADROOM * high_ms / 1000, settings.probe_timeout_floor),
+        settings.probe_timeout_ceiling,
+    )
+
+
+def probe_options(website: Website, check_type: str) -> Dict[str, Any]:
+    """
+    Per-website settings changing how its target is probed. Websites sharing
+    a target are only probed together when their options match
+    """
+    if check_type == CheckType.DNS:
+        return {
+            "record_type": website.dns_record_type or "A",
+            "expected": website.dns_expected_value,
+        }
+    if check_type != CheckType.HTTP:
+        return {}
+    options = {"method": website.probe_method or "auto"}
+    if website.content_assertions:
+        options["assertions"] = website.content_assertions
+        options["max_body_bytes"] = (
+            website.max_body_bytes or get_settings().probe_max_body_bytes
+        )
+    return options
+
+
+async def http_check(
+    target: str,
+    options: Optional[Dict[str, Any]] = None,
+    timeout: float = HTTP_TIMEOUT,
+    resolver: Optional[CachingResolver] = None,
+) -> dict:
+    """
+    HTTP uptime check of a target: it is up when it answers 200 and its body
+    passes the content assertions. Timeouts are raised to the caller (see
+    confirmed_http_check), other request errors count as the target being down.
+
+    With the "certificate" option, an HTTPS check also reports the server's
+    certificate as seen on its connection (or why the handshake failed) under
+    "certificate", sparing a separate SSL check
+    """
+    options = options or {}
+    validate_url(target)
+    scan = None
+    if options.get("assertions"):
+        scan = compile_assertions(options["assertions"]).start()
+    try:
+        response, phases = await http_get(
+            target,
+            timeout=timeout,
+            resolver=resolver,
+            method=options.get("method", "auto"),
+            max_body_bytes=options.get("max_body_bytes", 0),
+            scan=scan,
+            # the daily certificate check sees the certificate served now, not
+            # the one a resumed session was verified with
+            resume=not options.get("certificate"),
+        )
+    except httpx.TimeoutException:
+        raise
+    except httpx.RequestError as exc:
+        logger.warning(f"Uptime check failed for {target}: {exc}")
+        result = {
+            "is_up": False,
+            "status_code": None,
+            "response_time_us": None,
+            "dns_us": None,
+            "connect_us": None,
+            "tls_us": None,
+            "ttfb_us": None,
+            "bytes_downloaded": None,
+            "tls_resumed": None,
+            "error_message": str(exc),
+        }
+        tls_error = _tls_error(exc)
+        if options.get("certificate") and tls_error is not None:
+            result["certificate"] = certificate_error(str(tls_error))
+        return result
+    if response.status_code != 200:
+        error_message = f"Unexpected status code {response.status_code}"
+    else:
+        error_message = scan.failure() if scan else None
+    result = {
+        "is_up": error_message is None,
+        "status_code": response.status_code,
+        "response_time_us": phases["total_us"],
+        "dns_us": phases.get("dns_us"),
+        "connect_us": phases.get("connect_us"),
+        "tls_us": phases.get("tls_us"),
+        "ttfb_us": phases.get("ttfb_us"),
+        "bytes_downloaded": phases.get("bytes_downloaded"),
+        "tls_resumed": phases.get("tls_resumed"),
+        "error_message": error_message,
+    }
+    if options.get("certificate") and phases.get("peer_certificate"):
+        result["certificate"] = certificate_details(phases["peer_certificate"])
+    return result
+
+
+def _timed_out() -> dict:
+    return {
+        "is_up": False,
+        "status_code": None,
+        "response_time_us": None,
+        "dns_us": None,
+        "connect_us": None,
+        "tls_us": None,
+        "ttfb_us": None,
+        "bytes_downloaded": None,
+        "tls_resumed": None,
+        # the timeout adapts to each website: it's logged, not part of the
+        # message, which is stored once per distinct text (ErrorClass)
+        "error_message": "Timed out",
+    }
+
+
+async def _attempt(
+    target: str,
+    options: Dict[str, Any],
+    timeout: float,
+    resolver: Optional[CachingResolver],
+) -> dict:
+    try:
+        return await http_check(target, options, timeout, resolver)
+    except httpx.TimeoutException:
+        logger.info(f"Uptime check of {target} timed out after {timeout:g}s")
+        return _timed_out()
+
+
+async def _hedged_attempt(
+    target: str,
+    options: Dict[str, Any],
+    timeout: float,
+    resolver: Optional[CachingResolver],
+) -> dict:
+    """
+    One attempt, and a second one racing it when the first hasn't finished
+    after HEDGE_AFTER of the timeout: the first to find the target up wins,
+    otherwise the last to fail is returned
+    """
+    attempts = [asyncio.create_task(_attempt(target, options, timeout, resolver))]
+    done, _ = await asyncio.wait(attempts, timeout=timeout * HEDGE_AFTER)
+    if not done:
+        attempts.append(
+            asyncio.create_task(_attempt(target, options, timeout, resolver))
+        )
+    try:
+        for attempt in asyncio.as_completed(attempts):
+            result = await attempt
+            if result["is_up"]:
+                break
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+    return result
+
+
+async def confirmed_http_check(
+    target: str,
+    options: Optional[Dict[str, Any]] = None,
+    resolver: Optional[CachingResolver] = None,
+) -> dict:
+    """
+    HTTP check within the "timeout" option's seconds (HTTP_TIMEOUT without
+    it), confirming in-process that a target which didn't answer is down.
+    After a timeout or connection error (an error status is an answer) it is
+    probed again with twice the timeout, hedged by a second request; it's only
+    reported down if all of them fail. The whole check takes no longer than
+    the ceiling (or the timeout, if longer): the confirmation gets what is
+    left, and is skipped when that is less than the timeout. Timeouts are
+    results here, not raised, so nothing is requeued to retry
+    """
+    options = options or {}
+    timeout = options.get("timeout", HTTP_TIMEOUT)
+    deadline = time.monotonic() + max(get_settings().probe_timeout_ceiling, timeout)
+    result = await _attempt(target, options, timeout, resolver)
+    if result["is_up"] or result["status_code"] is not None:
+        return result
+    confirm_timeout = min(2 * timeout, deadline - time.monotonic())
+    if confirm_timeout < timeout:
+        return result
+    return await _hedged_attempt(target, options, confirm_timeout, resolver)
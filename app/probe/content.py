@@ -0,0 +1,146 @@
+import json
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+
+class AhoCorasick:
+    """
+    Multi-pattern byte string matcher. The automaton is built once and then
+    fed a stream chunk by chunk, carrying its state across chunk boundaries,
+    so a pattern split between two chunks is still found
+    """
+
+    def __init__(self, patterns: Sequence[bytes]):
+        self._goto: List[Dict[int, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for byte in pattern:
+                if byte not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][byte] = len(self._goto) - 1
+                state = self._goto[state][byte]
+            self._out[state] += (index,)
+        # breadth first, so the failure state of a node is always done before it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for byte, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and byte not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(byte, 0)
+                self._out[child] += self._out[self._fail[child]]
+
+    def scan(self, data: bytes, state: int = 0) -> Tuple[int, Set[int]]:
+        """
+        Feed data to the automaton from a state. Returns the state reached and
+        the indexes of the patterns ending in the data
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[int] = set()
+        for byte in data:
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+            if out[state]:
+                found.update(out[state])
+        return state, found
+
+
+class ContentMatcher:
+    """
+    Compiled content assertions of a website: substrings go through one
+    Aho-Corasick automaton, regexes are searched in the body read so far.
+    Immutable, so one instance is shared by every probe with these assertions
+    """
+
+    def __init__(self, assertions: Sequence[dict]):
+        self.assertions = list(assertions)
+        substrings = [
+            index
+            for index, assertion in enumerate(self.assertions)
+            if assertion["type"] in ("contains", "not_contains")
+        ]
+        self.substring_assertions = substrings
+        self.automaton = AhoCorasick(
+            [self.assertions[index]["value"].encode() for index in substrings]
+        )
+        self.regexes = {
+            index: re.compile(assertion["value"].encode())
+            for index, assertion in enumerate(self.assertions)
+            if assertion["type"] in ("regex", "not_regex")
+        }
+
+    def start(self) -> "ContentScan":
+        return ContentScan(self)
+
+
+class ContentScan:
+    """
+    Progress of a ContentMatcher over one response body. Call it with each
+    chunk; it returns True once every assertion is decided, and reading can stop
+    """
+
+    def __init__(self, matcher: ContentMatcher):
+        self.matcher = matcher
+        self.found: Set[int] = set()  # assertions whose pattern was seen
+        self._state = 0
+        self._buffer = bytearray() if matcher.regexes else None
+
+    def __call__(self, chunk: bytes) -> bool:
+        matcher = self.matcher
+        self._state, found = matcher.automaton.scan(chunk, self._state)
+        self.found.update(matcher.substring_assertions[index] for index in found)
+        if self._buffer is not None:
+            self._buffer += chunk
+            for index, regex in matcher.regexes.items():
+                if index not in self.found and regex.search(self._buffer):
+                    self.found.add(index)
+        return self.decided
+
+    @property
+    def decided(self) -> bool:
+        """
+        Whether reading more of the body can't change the outcome: a forbidden
+        pattern was seen, or every pattern was and none is forbidden
+        """
+        if self.failure(complete=False):
+            return True
+        return len(self.found) == len(self.matcher.assertions)
+
+    def failure(self, complete: bool = True) -> Optional[str]:
+        """
+        Why the body fails its assertions, None if it passes. Required patterns
+        not seen yet only count as missing once the body was fully read
+        (or read up to the byte cap). The message names the assertion by its
+        position, never the pattern, so it stays one error class per website
+        """
+        assertions = self.matcher.assertions
+        for index, assertion in enumerate(assertions):
+            if assertion["type"].startswith("not_") and index in self.found:
+                return f"Forbidden content found (assertion {index + 1})"
+        if complete:
+            for index, assertion in enumerate(assertions):
+                if not assertion["type"].startswith("not_") and index not in self.found:
+                    return f"Required content not found (assertion {index + 1})"
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _compile(assertions_json: str) -> ContentMatcher:
+    return ContentMatcher(json.loads(assertions_json))
+
+
+def compile_assertions(assertions: Sequence[dict]) -> ContentMatcher:
+    """
+    Matcher for a list of assertions, compiled once and cached: websites with
+    the same assertions share it across probes
+    """
+    return _compile(json.dumps(list(assertions), sort_keys=True))
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import socket
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from uuid import UUID
+
+import dns.asyncresolver
+from redis.exceptions import RedisError
+from sqlalchemy import and_, false, or_, true
+from sqlalchemy.exc import OperationalError
+from sqlmodel import select
+
+from app.api.v1.models import CheckType, Website
+from app.dependencies.settings import get_settings
+from app.ingest import publish_results, write_records
+from app.probe.checks import adaptive_timeout, confirmed_http_check, probe_options
+from app.probe.dns import check_record, get_resolver
+from app.probe.icmp import ping_targets
+from app.probe.results import encode_result
+from app.probe.ring import HashRing
+from app.probe.spool import Spool
+from app.probe.tls import check_certificate
+from app.utils.crud import (
+    get_latency_estimates,
+    record_website_certificate,
+    ssl_check_due,
+)
+from app.utils.frequency import mark_dispatched, uptime_check_due, uptime_check_order
+from app.utils.generic import normalize_probe_target
+from app.utils.politeness import ProbeJob, build_limiters, plan_dispatch
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 1000  # results buffered before they are written
+FLUSH_INTERVAL = 1.0  # seconds a result may wait in the buffer
+
+
+def default_name() -> str:
+    return get_settings().probe_daemon_name or socket.gethostname()
+
+
+def default_members(name: str) -> List[str]:
+    members = get_settings().probe_daemon_members
+    return [member.strip() for member in members.split(",") if member.strip()] or [name]
+
+
+class ProbeDaemon:
+    """
+    Long-running prober of the websites it owns on a hash ring of daemons, as
+    an alternative to the Celery scheduler and workers. Each poll claims a
+    batch of due websites (locking their rows with SKIP LOCKED and advancing
+    their last checked times), then probes them on one event loop, up to
+    `concurrency` at once and within the per-host and per-IP politeness
+    limits. Results are buffered and written in batches, through the
+    configured results sink, and spooled while it is unavailable
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        name: Optional[str] = None,
+        members: Optional[List[str]] = None,
+        concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        settings = get_settings()
+        self.session_factory = session_factory
+        self.name = name or default_name()
+        self.ring = HashRing(members or default_members(self.name))
+        self.concurrency = concurrency or settings.probe_daemon_concurrency
+        self.batch_size = batch_size or settings.probe_daemon_batch_size
+        self.poll_interval = poll_interval or settings.probe_daemon_poll_interval
+        self.spool = Spool(Path(settings.spool_dir))
+        self.running = True
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        # kept across polls: probes planned by the last poll still hold their
+        # host's and IP's slots
+        self._limiters = build_limiters()
+        self._dns_resolver = dns.asyncresolver.Resolver()
+        self._in_flight: Set[asyncio.Task] = set()
+        self._results: List[bytes] = []
+        self._certificates: List[Tuple[str, dict, datetime]] = []
+        self._flushed_at = 0.0
+
+    def owned(self):
+        """Condition on Website of the websites this daemon's arcs of the ring hold"""
+        return or_(
+            *(
+                and_(
+                    Website.ring_position >= start if start is not None else true(),
+                    Website.ring_position < end if end is not None else true(),
+                )
+                for start, end in self.ring.arcs(self.name)
+            ),
+            false(),
+        )
+
+    def claim(self, now: datetime) -> List[ProbeJob]:
+        """
+        Claim up to batch_size of this daemon's due websites and group them
+        into probe jobs, one per distinct target (and options) as the Celery
+        scheduler does. Once a day the certificate of a website is checked
+        too: by its HTTPS uptime probe, or a TLS probe for other check types
+        """
+        due = uptime_check_due(now) & self.owned()
+        jobs: Dict[Tuple[str, str, str], ProbeJob] = {}
+        with self.session_factory() as db:
+            # another daemon (or the scheduler) may have claimed some meanwhile
+            websites = db.exec(
+                select(Website)
+                .where(due)
+                .order_by(*uptime_check_order())
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not websites:
+                return []
+            estimates = get_latency_estimates(db, [website.id for website in websites])
+            for website in websites:
+                check_type = CheckType(website.check_type or CheckType.HTTP).value
+                checks = [(check_type, normalize_probe_target(website.url, check_type))]
+                certificate_due = urlsplit(
+                    website.url
+                ).scheme == "https" and ssl_check_due(website, now)
+                # ssl_last_checked is only set once the certificate is recorded
+                if certificate_due and check_type != CheckType.HTTP:
+                    checks.append(("ssl", urlsplit(website.url).hostname))
+                for check_type, target in checks:
+                    options = probe_options(website, check_type)
+                    key = (target, check_type, json.dumps(options, sort_keys=True))
+                    if key not in jobs:
+                        jobs[key] = ProbeJob(
+                            target=target,
+                            check_type=check_type,
+                            website_ids=[],
+                            tenant=str(website.user_id),
+                            host=urlsplit(target).hostname or target,
+                            options=options,
+                        )
+                    jobs[key].website_ids.append(str(website.id))
+                    if check_type == CheckType.HTTP:
+                        jobs[key].options["timeout"] = max(
+                            jobs[key].options.get("timeout", 0.0),
+                            adaptive_timeout(estimates.get(website.id)),
+                        )
+                        if certificate_due:
+                            jobs[key].options["certificate"] = True
+                mark_dispatched(website, now)
+                db.add(website)
+            db.commit()
+        return list(jobs.values())
+
+    async def dispatch(self, jobs: List[ProbeJob]) -> None:
+        """Start the probes of claimed jobs, spread by the politeness limits"""
+        ips = await get_resolver().resolve_many(job.host for job in jobs)
+        for job in jobs:
+            job.ip = ips.get(job.host)
+        # pings starting in the same second share one ICMP socket
+        pings: Dict[int, List[ProbeJob]] = defaultdict(list)
+        now = time.monotonic()
+        for limiter in self._limiters:
+            limiter.prune(now)
+        for job in plan_dispatch(jobs, *self._limiters, now=now):
+            if job.check_type == CheckType.PING:
+                pings[int(job.countdown)].append(job)
+            else:
+                self._start(self.probe(job))
+        for countdown, batch in pings.items():
+            self._start(self.ping(countdown, batch))
+
+    def _start(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def probe(self, job: ProbeJob) -> None:
+        await asyncio.sleep(job.countdown)
+        try:
+            async with self._semaphore:
+                if job.check_type == "ssl":
+                    result = await check_certificate(job.host)
+                    for website_id in job.website_ids:
+                        self._certificates.append(
+                            (website_id, result, datetime.now(timezone.utc))
+                        )
+                    return
+                if job.check_type == CheckType.DNS:
+                    result = await check_record(
+                        job.target,
+                        job.options["record_type"],
+                        job.options["expected"],
+                        self._dns_resolver,
+                    )
+                else:
+                    result = await confirmed_http_check(job.target, job.options)
+        except Exception as exc:
+            logger.error(
+                f"Error probing {job.target} ({job.check_type}): {exc}", exc_info=True
+            )
+            return
+        certificate = result.pop("certificate", None)
+        if certificate is not None:
+            for website_id in job.website_ids:
+                self._certificates.append(
+                    (website_id, certificate, datetime.now(timezone.utc))
+                )
+        self._collect(job.website_ids, result, job.check_type)
+
+    async def ping(self, countdown: float, jobs: List[ProbeJob]) -> None:
+        await asyncio.sleep(countdown)
+        try:
+            async with self._semaphore:  # one batch, one socket
+                results = await ping_targets(job.target for job in jobs)
+        except Exception as exc:
+            logger.error(f"Error pinging {len(jobs)} hosts: {exc}", exc_info=True)
+            return
+        for job in jobs:
+            self._collect(job.website_ids, results[job.target], "ping")
+
+    def _collect(self, website_ids: List[str], result: dict, check_type: str):
+        self._results.append(
+            encode_result(website_ids, result, check_type, datetime.now(timezone.utc))
+        )
+
+    def write_results(self, records: List[bytes]) -> None:
+        if get_settings().results_sink == "stream":
+            publish_results(records)
+            return
+        with self.session_factory() as db:
+            write_records(db, records)
+
+    def save_results(self, records: List[bytes]) -> None:
+        """
+        Write a batch of results, after any spooled during an outage. While the
+        sink is unavailable they are spooled in turn
+        """
+        try:
+            if self.spool.pending():
+                self.spool.replay(self.write_results)
+            self.write_results(records)
+        except Exception as exc:
+            logger.error(
+                f"Error saving probe results: {exc}, spooling {len(records)}",
+                exc_info=not isinstance(exc, (OperationalError, RedisError)),
+            )
+            self.spool.append(records)
+
+    def save_certificates(self, certificates: List[Tuple[str, dict, datetime]]):
+        with self.session_factory() as db:
+            for website_id, certificate, timestamp in certificates:
+                website = db.get(Website, UUID(website_id))
+                # purged since it was probed, or sharing a target with one that
+                # monitors SSL
+                if website is None or not website.ssl_check_enabled:
+                    continue
+                record_website_certificate(db, website, certificate, timestamp)
+
+    async def flush(self, force: bool = False) -> None:
+        """Write the buffered results when there are enough or they waited long"""
+        due = force or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+        if self._results and (due or len(self._results) >= FLUSH_SIZE):
+            records, self._results = self._results, []
+            await asyncio.to_thread(self.save_results, records)
+        if self._certificates and due:
+            certificates, self._certificates = self._certificates, []
+            try:
+                await asyncio.to_thread(self.save_certificates, certificates)
+            except Exception as exc:
+                # checked again tomorrow
+                logger.error(
+                    f"Error saving {len(certificates)} SSL results: {exc}",
+                    exc_info=not isinstance(exc, OperationalError),
+                )
+        if due:
+            self._flushed_at = time.monotonic()
+
+    async def poll(self) -> int:
+        """Claim due websites and start their probes. Returns the probes started"""
+        try:
+            jobs = await asyncio.to_thread(self.claim, datetime.now(timezone.utc))
+        except OperationalError as exc:
+            logger.error(f"Database error claiming websites: {exc}")
+            return 0
+        if jobs:
+            await self.dispatch(jobs)
+            logger.info(
+                f"Claimed {sum(len(job.website_ids) for job in jobs)} websites "
+                f"({len(jobs)} probes), {len(self._in_flight)} probes in flight"
+            )
+        return len(jobs)
+
+    async def drain(self) -> None:
+        """Wait for the probes in flight and write their results"""
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight)
+        await self.flush(force=True)
+
+    async def run(self) -> None:
+        logger.info(
+            f"Probe daemon {self.name} started, sharing websites with "
+            f"{', '.join(self.ring.members)}"
+        )
+        polled_at = 0.0
+        while self.running:
+            # claimed websites wait in memory: only claim more once those drain
+            if (
+                time.monotonic() - polled_at >= self.poll_interval
+                and len(self._in_flight) < self.concurrency
+            ):
+                polled_at = time.monotonic()
+                await self.poll()
+            await self.flush()
+            await asyncio.sleep(min(FLUSH_INTERVAL, self.poll_interval))
+        # claimed websites are only due again next interval: finish them
+        await self.drain()
+        self.spool.seal()
+
+    def stop(self, *_) -> None:
+        self.running = False
@@ -0,0 +1,248 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.message
+import dns.rdatatype
+import dns.resolver
+
+from app.exceptions.probe import DNSResolutionError
+
+MIN_POSITIVE_TTL = 5  # seconds, so a zero TTL doesn't mean a query per probe
+MAX_POSITIVE_TTL = 3600
+DEFAULT_NEGATIVE_TTL = 60  # when the negative answer carries no SOA record
+MAX_NEGATIVE_TTL = 300
+LOOKUP_LIFETIME = 5.0  # seconds allowed for one lookup, retries included
+SUPPORTED_RECORD_TYPES = ("A", "AAAA", "CNAME", "MX", "NS", "TXT")
+DNS_CHECK_CONCURRENCY = 200  # queries in flight at once in a batch of DNS checks
+
+
+@dataclass
+class CacheEntry:
+    expires_at: float
+    addresses: List[str]  # empty for a cached negative answer
+    error: Optional[str] = None
+
+
+def _negative_ttl(message: Optional[dns.message.Message]) -> int:
+    """TTL of a negative answer: the SOA's TTL capped by its minimum (RFC 2308)"""
+    if message is not None:
+        for rrset in message.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum, MAX_NEGATIVE_TTL)
+    return DEFAULT_NEGATIVE_TTL
+
+
+class CachingResolver:
+    """
+    Asynchronous resolver for probe targets. Answers are cached for their TTL and
+    negative answers (NXDOMAIN, no address records) for their SOA minimum, so
+    probing a dead domain doesn't query it again on every check. Failures of
+    the lookup itself (timeouts, SERVFAIL) are not cached.
+    """
+
+    def __init__(
+        self,
+        resolver: Optional[dns.asyncresolver.Resolver] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._resolver = resolver or dns.asyncresolver.Resolver()
+        self._clock = clock
+        self._cache: Dict[str, CacheEntry] = {}
+        # lookups answered from the cache and sent to the resolver
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str) -> List[str]:
+        """
+        Addresses of a host, IPv4 first, raising DNSResolutionError when there
+        are none
+        """
+        host = host.rstrip(".").lower()
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+        if "." not in host or host.endswith(".local"):
+            # localhost and mDNS names are only known to the system resolver
+            return await self._resolve_with_system(host)
+
+        entry = self._cache.get(host)
+        if entry is None or entry.expires_at <= self._clock():
+            self.misses += 1
+            entry = await self._lookup(host)
+            if entry is not None:
+                self._cache[host] = entry
+            else:
+                raise DNSResolutionError(f"DNS lookup failed for {host}")
+        else:
+            self.hits += 1
+        if not entry.addresses:
+            raise DNSResolutionError(entry.error)
+        return entry.addresses
+
+    async def resolve_many(self, hosts: Iterable[str]) -> Dict[str, Optional[str]]:
+        """First address of each host, None for those that don't resolve"""
+        hosts = sorted(set(hosts))
+        results = await asyncio.gather(
+            *(self.resolve(host) for host in hosts), return_exceptions=True
+        )
+        return {
+            host: None if isinstance(result, Exception) else result[0]
+            for host, result in zip(hosts, results)
+        }
+
+    async def _lookup(self, host: str) -> Optional[CacheEntry]:
+        addresses: List[str] = []
+        ttl: Optional[int] = None
+        negative_ttl = DEFAULT_NEGATIVE_TTL
+        try:
+            for rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
+                answer = await self._resolver.resolve(
+                    host,
+                    rdtype,
+                    search=False,
+                    raise_on_no_answer=False,
+                    lifetime=LOOKUP_LIFETIME,
+                )
+                if answer.rrset is None:
+                    negative_ttl = _negative_ttl(answer.response)
+                    continue
+                addresses.extend(rdata.address for rdata in answer.rrset)
+                ttl = answer.rrset.ttl if ttl is None else min(ttl, answer.rrset.ttl)
+        except dns.resolver.NXDOMAIN as exc:
+            responses = list(exc.responses().values())
+            return CacheEntry(
+                expires_at=self._clock()
+                + _negative_ttl(responses[0] if responses else None),
+                addresses=[],
+                error=f"Domain {host} does not exist",
+            )
+        except dns.exception.DNSException:
+            return None
+
+        now = self._clock()
+        if not addresses:
+            return CacheEntry(
+                expires_at=now + negative_ttl,
+                addresses=[],
+                error=f"No address records for {host}",
+            )
+        ttl = max(MIN_POSITIVE_TTL, min(ttl, MAX_POSITIVE_TTL))
+        return CacheEntry(expires_at=now + ttl, addresses=addresses)
+
+    async def _resolve_with_system(self, host: str) -> List[str]:
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+        except socket.gaierror as exc:
+            raise DNSResolutionError(f"DNS lookup failed for {host}: {exc}")
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+@lru_cache
+def get_resolver() -> CachingResolver:
+    """Resolver shared by every probe of the process"""
+    return CachingResolver()
+
+
+def resolve(host: str) -> List[str]:
+    """Blocking helper for synchronous callers"""
+    return asyncio.run(get_resolver().resolve(host))
+
+
+def _normalize_record_value(record_type: str, value: str) -> str:
+    if record_type in ("A", "AAAA"):
+        try:
+            return str(ipaddress.ip_address(value))
+        except ValueError:
+            return value
+    if record_type == "TXT":
+        return value
+    return value.rstrip(".").lower()
+
+
+def _record_values(record_type: str, rrset) -> Set[str]:
+    values = set()
+    for rdata in rrset:
+        if record_type == "MX":
+            value = rdata.exchange.to_text(omit_final_dot=True)
+        elif record_type in ("CNAME", "NS"):
+            value = rdata.target.to_text(omit_final_dot=True)
+        elif record_type == "TXT":
+            value = b"".join(rdata.strings).decode(errors="replace")
+        else:
+            value = rdata.to_text()
+        values.add(_normalize_record_value(record_type, value))
+    return values
+
+
+async def check_record(
+    host: str,
+    record_type: str = "A",
+    expected: Optional[str] = None,
+    resolver: Optional[dns.asyncresolver.Resolver] = None,
+) -> dict:
+    """
+    DNS uptime check: the host must have records of the given type and, when
+    an expected value is set, one of them must match it. The answer is always
+    queried, never served from the probe cache
+    """
+    resolver = resolver or dns.asyncresolver.Resolver()
+    error_message = None
+    started = time.perf_counter()
+    try:
+        answer = await resolver.resolve(
+            host, record_type, search=False, lifetime=LOOKUP_LIFETIME
+        )
+    except dns.resolver.NXDOMAIN:
+        error_message = f"Domain {host} does not exist"
+    except dns.resolver.NoAnswer:
+        error_message = f"No {record_type} records for {host}"
+    except dns.exception.DNSException as exc:
+        return {
+            "is_up": False,
+            "status_code": None,
+            "response_time_us": None,
+            "dns_us": None,
+            "error_message": f"DNS query failed for {host}: {exc}",
+        }
+    else:
+        values = _record_values(record_type, answer.rrset)
+        if expected and _normalize_record_value(record_type, expected) not in values:
+            # one message per record type, whatever was resolved, so record
+            # values don't become error classes of their own
+            error_message = f"No {record_type} record matches the expected value"
+    return {
+        "is_up": error_message is None,
+        "status_code": None,
+        "response_time_us": round((time.perf_counter() - started) * 1e6),
+        "dns_us": None,
+        "error_message": error_message,
+    }
+
+
+async def check_records(
+    checks: Iterable[Tuple[str, str, Optional[str]]],
+    resolver: Optional[dns.asyncresolver.Resolver] = None,
+    concurrency: int = DNS_CHECK_CONCURRENCY,
+) -> List[dict]:
+    """
+    Run many (host, record type, expected value) checks concurrently on one
+    resolver, returning their results in order
+    """
+    resolver = resolver or dns.asyncresolver.Resolver()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(host: str, record_type: str, expected: Optional[str]) -> dict:
+        async with semaphore:
+            return await check_record(host, record_type, expected, resolver)
+
+    return await asyncio.gather(*(run(*check) for check in checks))
@@ -0,0 +1,191 @@
+import ssl
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import httpcore
+import httpx
+
+from app.exceptions.probe import DNSResolutionError
+from app.probe.dns import CachingResolver, get_resolver
+from app.probe.tls import get_probe_context, offer_sessions
+
+PROBE_METHODS = ("auto", "head", "get")
+HEAD_UNSUPPORTED = (405, 501)  # statuses sent by servers not implementing HEAD
+
+
+class ResolvingBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend resolving host names through the probe's caching resolver
+    instead of getaddrinfo, and timing how long resolution took. TLS still
+    uses the original host name for SNI and certificate checks.
+    """
+
+    def __init__(
+        self,
+        resolver: CachingResolver,
+        backend: Optional[httpcore.AsyncNetworkBackend] = None,
+    ):
+        self._resolver = resolver
+        self._backend = backend or httpcore.AnyIOBackend()
+        self.dns_ns = 0
+
+    async def connect_tcp(
+        self,
+        host,
+        port,
+        timeout=None,
+        local_address=None,
+        socket_options=None,
+    ) -> httpcore.AsyncNetworkStream:
+        started = time.perf_counter_ns()
+        try:
+            addresses = await self._resolver.resolve(host)
+        except DNSResolutionError as exc:
+            # surfaced by httpx as a ConnectError, like a getaddrinfo failure
+            raise httpcore.ConnectError(str(exc)) from exc
+        finally:
+            self.dns_ns += time.perf_counter_ns() - started
+        return await self._backend.connect_tcp(
+            addresses[0], port, timeout, local_address, socket_options
+        )
+
+    async def connect_unix_socket(
+        self, path, timeout=None, socket_options=None
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class ProbeTransport(httpx.AsyncHTTPTransport):
+    """httpx transport whose connections go through a ResolvingBackend"""
+
+    def __init__(self, backend: ResolvingBackend, **kwargs):
+        super().__init__(**kwargs)
+        # httpx doesn't expose the pool's network backend as an option
+        self._pool._network_backend = backend
+
+
+class PhaseTimer:
+    """
+    httpcore trace hook recording when each step of a request started and
+    completed, to split a probe's latency into DNS, TCP connect, TLS handshake
+    and time to first byte
+    """
+
+    def __init__(self):
+        self.events: Dict[str, int] = {}
+        self.ssl_object: Optional[ssl.SSLObject] = None  # of the TLS connection
+
+    async def __call__(self, event_name: str, info: dict) -> None:
+        # event names look like "connection.connect_tcp.started"
+        event = event_name.split(".", 1)[1]
+        self.events[event] = time.perf_counter_ns()
+        if event == "start_tls.complete":
+            self.ssl_object = info["return_value"].get_extra_info("ssl_object")
+
+    def _duration_ns(self, start: str, end: str) -> Optional[int]:
+        if start in self.events and end in self.events:
+            return self.events[end] - self.events[start]
+        return None
+
+    def phases(self, dns_ns: int, total_ns: int) -> Dict[str, Optional[int]]:
+        """Phase durations in microseconds, None for phases that didn't happen"""
+        connect_ns = self._duration_ns("connect_tcp.started", "connect_tcp.complete")
+        if connect_ns is not None:
+            connect_ns -= dns_ns  # the backend resolves inside connect_tcp
+        durations = {
+            "dns_us": dns_ns,
+            "connect_us": connect_ns,
+            "tls_us": self._duration_ns("start_tls.started", "start_tls.complete"),
+            "ttfb_us": self._duration_ns(
+                "send_request_headers.started", "receive_response_headers.complete"
+            ),
+            "total_us": total_ns,
+        }
+        return {
+            phase: None if ns is None else ns // 1000 for phase, ns in durations.items()
+        }
+
+
+async def http_get(
+    url: str,
+    timeout: float = 10.0,
+    resolver: Optional[CachingResolver] = None,
+    method: str = "auto",
+    max_body_bytes: int = 0,
+    scan: Optional[Callable[[bytes], bool]] = None,
+    resume: bool = True,
+) -> Tuple[httpx.Response, Dict[str, Optional[int]]]:
+    """
+    Probe a target on a fresh connection without downloading more than needed.
+
+    "head" sends a HEAD request, "get" a streamed GET closed as soon as the
+    response headers arrive, and "auto" a HEAD falling back to GET when the
+    server doesn't support it. When a scan callback is given, a GET is always
+    used and the (decoded) body is fed to it chunk by chunk, until it returns
+    True or max_body_bytes were read; the connection is then dropped.
+
+    HTTPS connections resume the host's TLS session from the previous probe
+    when the server allows it, saving both sides most of the handshake. With
+    resume unset a full handshake is made, verifying the certificate afresh;
+    its session is still kept for the next probes.
+
+    Returns the response (its body unread) and the duration of each phase of
+    the probe in microseconds (dns_us, connect_us, tls_us, ttfb_us and
+    total_us) with the bytes received (bytes_downloaded), whether the TLS
+    session was resumed (tls_resumed, None without TLS) and the server's
+    certificate in DER form (peer_certificate, None without TLS)
+    """
+    if method not in PROBE_METHODS:
+        raise ValueError(f"Unknown probe method {method}")
+    backend = ResolvingBackend(resolver or get_resolver())
+    timer = PhaseTimer()
+    downloaded = 0
+    context = get_probe_context()
+    token = offer_sessions.set(resume)
+    try:
+        async with httpx.AsyncClient(
+            transport=ProbeTransport(backend, verify=context), timeout=timeout
+        ) as client:
+            started = time.perf_counter_ns()
+            if method != "get" and scan is None:
+                response = await client.head(url, extensions={"trace": timer})
+                downloaded += response.num_bytes_downloaded
+            if (
+                method == "get"
+                or scan is not None
+                or (method == "auto" and response.status_code in HEAD_UNSUPPORTED)
+            ):
+                async with client.stream(
+                    "GET", url, extensions={"trace": timer}
+                ) as response:
+                    if scan is not None:
+                        size = 0
+                        async for chunk in response.aiter_bytes():
+                            end = max_body_bytes - size if max_body_bytes else None
+                            size += len(chunk)
+                            if scan(chunk[:end]) or (
+                                max_body_bytes and size >= max_body_bytes
+                            ):
+                                break
+                    downloaded += response.num_bytes_downloaded
+                    # leaving the block unread closes the connection mid-body
+            total_ns = time.perf_counter_ns() - started
+    finally:
+        offer_sessions.reset(token)
+    phases = timer.phases(backend.dns_ns, total_ns)
+    tls_resumed = peer_certificate = None
+    if timer.ssl_object is not None:
+        tls_resumed = timer.ssl_object.session_reused
+        # a resumed session still carries the certificate it was verified with
+        peer_certificate = timer.ssl_object.getpeercert(binary_form=True)
+        # read after the response: TLS 1.3 tickets arrive after the handshake
+        context.sessions.put(response.url.host, timer.ssl_object.session)
+    return response, {
+        **phases,
+        "bytes_downloaded": downloaded,
+        "tls_resumed": tls_resumed,
+        "peer_certificate": peer_certificate,
+    }
@@ -0,0 +1,215 @@
+import asyncio
+import errno
+import ipaddress
+import itertools
+import logging
+import random
+import socket
+import struct
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app.exceptions.probe import DNSResolutionError
+from app.probe.dns import CachingResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+PING_TIMEOUT = 10.0  # seconds to wait for every echo reply of a batch
+TCP_PROBE_PORT = 443  # fallback probe when ICMP sockets aren't allowed
+PAYLOAD = b"pulsecheck-ping"
+
+_ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+_ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+_PROTOCOL = {
+    socket.AF_INET: socket.IPPROTO_ICMP,
+    socket.AF_INET6: socket.IPPROTO_ICMPV6,
+}
+_HEADER = struct.Struct("!BBHHH")  # type, code, checksum, identifier, sequence
+# Errors meaning the kernel won't give us an ICMP datagram socket
+_UNAVAILABLE = {errno.EACCES, errno.EPERM, errno.EPROTONOSUPPORT, errno.EAFNOSUPPORT}
+
+# Sequence numbers tell apart the replies arriving on a shared socket
+_sequence = itertools.count(random.randrange(1 << 16))
+_icmp_available: Optional[bool] = None
+
+
+def checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071)"""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def echo_request(family: int, sequence: int, payload: bytes = PAYLOAD) -> bytes:
+    """
+    ICMP echo request. The kernel sets the identifier of datagram ICMP sockets
+    (and the ICMPv6 checksum) itself
+    """
+    header = _HEADER.pack(_ECHO_REQUEST[family], 0, 0, 0, sequence)
+    if family == socket.AF_INET:
+        header = _HEADER.pack(
+            _ECHO_REQUEST[family], 0, checksum(header + payload), 0, sequence
+        )
+    return header + payload
+
+
+def _family(address: str) -> int:
+    version = ipaddress.ip_address(address).version
+    return socket.AF_INET if version == 4 else socket.AF_INET6
+
+
+def _same_address(source: str, address: str) -> bool:
+    # IPv6 sources may carry a zone index ("fe80::1%eth0")
+    return ipaddress.ip_address(source.split("%")[0]) == ipaddress.ip_address(address)
+
+
+async def icmp_ping(
+    addresses: Iterable[str], timeout: float = PING_TIMEOUT
+) -> Dict[str, Optional[float]]:
+    """
+    Ping many addresses at once over unprivileged ICMP datagram sockets (one
+    per address family), matching replies to requests by sequence number.
+    Returns each address' round trip time in seconds, None when it didn't
+    answer. Raises OSError when the kernel doesn't allow ICMP sockets
+    (see net.ipv4.ping_group_range)
+    """
+    loop = asyncio.get_running_loop()
+    addresses = list(dict.fromkeys(addresses))
+    results: Dict[str, Optional[float]] = dict.fromkeys(addresses)
+    pending: Dict[tuple, tuple] = {}  # (family, sequence) -> (address, sent at)
+    answered = asyncio.Event()
+    sockets: Dict[int, socket.socket] = {}
+
+    def on_readable(family: int, sock: socket.socket) -> None:
+        while True:
+            try:
+                packet, source = sock.recvfrom(1024)
+            except OSError:  # nothing left to read
+                break
+            if len(packet) < _HEADER.size:
+                continue
+            icmp_type, _, _, _, sequence = _HEADER.unpack_from(packet)
+            entry = pending.get((family, sequence))
+            if icmp_type != _ECHO_REPLY[family] or entry is None:
+                continue
+            address, sent_at = entry
+            if not _same_address(source[0], address):
+                continue
+            del pending[(family, sequence)]
+            results[address] = time.perf_counter() - sent_at
+        if not pending:
+            answered.set()
+
+    try:
+        for address in addresses:
+            family = _family(address)
+            if family not in sockets:
+                sock = socket.socket(family, socket.SOCK_DGRAM, _PROTOCOL[family])
+                sock.setblocking(False)
+                sockets[family] = sock
+                loop.add_reader(sock.fileno(), on_readable, family, sock)
+        for address in addresses:
+            family = _family(address)
+            sequence = next(_sequence) & 0xFFFF
+            pending[(family, sequence)] = (address, time.perf_counter())
+            try:
+                sockets[family].sendto(echo_request(family, sequence), (address, 0))
+            except OSError as exc:
+                # e.g. no route to the host: it counts as not answering
+                logger.debug(f"Echo request to {address} failed: {exc}")
+                del pending[(family, sequence)]
+        if pending:
+            try:
+                await asyncio.wait_for(answered.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for sock in sockets.values():
+            loop.remove_reader(sock.fileno())
+            sock.close()
+    return results
+
+
+async def tcp_ping(
+    address: str, timeout: float = PING_TIMEOUT, port: int = TCP_PROBE_PORT
+) -> Optional[float]:
+    """
+    Reachability probe without ICMP: time a TCP handshake. A refused
+    connection still proves the host is up, so it counts as an answer
+    """
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(address, port), timeout
+        )
+    except ConnectionRefusedError:
+        return time.perf_counter() - started
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = time.perf_counter() - started
+    writer.close()
+    return elapsed
+
+
+async def ping(
+    addresses: Iterable[str], timeout: float = PING_TIMEOUT
+) -> Dict[str, Optional[float]]:
+    """
+    Round trip times of many addresses, over ICMP when the kernel allows it
+    and over TCP connects otherwise
+    """
+    global _icmp_available
+    addresses = list(dict.fromkeys(addresses))
+    if _icmp_available is not False:
+        try:
+            results = await icmp_ping(addresses, timeout)
+            _icmp_available = True
+            return results
+        except OSError as exc:
+            if exc.errno not in _UNAVAILABLE:
+                raise
+            logger.warning(f"ICMP sockets unavailable ({exc}), pinging over TCP")
+            _icmp_available = False
+    rtts = await asyncio.gather(*(tcp_ping(address, timeout) for address in addresses))
+    return dict(zip(addresses, rtts))
+
+
+async def ping_targets(
+    hosts: Iterable[str],
+    timeout: float = PING_TIMEOUT,
+    resolver: Optional[CachingResolver] = None,
+) -> Dict[str, dict]:
+    """
+    Ping check of many hosts: resolve them concurrently, then ping every
+    address in one batch. Results are keyed by host in the shape of uptime
+    probe results
+    """
+    resolver = resolver or get_resolver()
+    hosts = list(dict.fromkeys(hosts))
+
+    async def lookup(host: str) -> tuple:
+        started = time.perf_counter()
+        try:
+            address, error = (await resolver.resolve(host))[0], None
+        except DNSResolutionError as exc:
+            address, error = None, str(exc)
+        return address, error, time.perf_counter() - started
+
+    lookups: List[tuple] = await asyncio.gather(*(lookup(host) for host in hosts))
+    rtts = await ping(
+        [address for address, _, _ in lookups if address is not None], timeout
+    )
+    results = {}
+    for host, (address, error, dns_seconds) in zip(hosts, lookups):
+        rtt = rtts.get(address) if address else None
+        results[host] = {
+            "is_up": rtt is not None,
+            "status_code": None,
+            "response_time_us": None if rtt is None else round(rtt * 1e6),
+            "dns_us": round(dns_seconds * 1e6),
+            "error_message": error or ("Ping failed" if rtt is None else None),
+        }
+    return results
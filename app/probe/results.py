@@ -0,0 +1,80 @@
+import struct
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple
+from uuid import UUID
+
+CHECK_TYPES = ("http", "ping", "dns")
+# Optional integer fields of a probe result, stored as -1 when missing
+DURATION_FIELDS = (
+    "response_time_us",
+    "dns_us",
+    "connect_us",
+    "tls_us",
+    "ttfb_us",
+    "bytes_downloaded",
+)
+
+# Record layout (little endian):
+#   timestamp_us q, flags B, check type B, status code h (-1: none),
+#   durations 6q (-1: none), error message length H, website count H,
+#   then the utf-8 error message and the 16 byte website ids
+_FIXED = struct.Struct(f"<qBBh{len(DURATION_FIELDS)}qHH")
+_MISSING = -1
+# flags: bit 0 is_up, bit 1 set when tls_resumed is known, bit 2 its value
+_UP = 1
+_TLS_KNOWN = 2
+_TLS_RESUMED = 4
+
+
+def _optional(value: int) -> Optional[int]:
+    return None if value == _MISSING else value
+
+
+def encode_result(
+    website_ids: Sequence[str], result: dict, check_type: str, timestamp: datetime
+) -> bytes:
+    """Pack a probe result and the websites it belongs to into a compact record"""
+    # cut on a character boundary: a split utf-8 sequence wouldn't decode
+    error = (result.get("error_message") or "").encode()[:0xFFFF]
+    error = error.decode(errors="ignore").encode()
+    status_code = result.get("status_code")
+    flags = _UP if result["is_up"] else 0
+    if result.get("tls_resumed") is not None:
+        flags |= _TLS_KNOWN | (_TLS_RESUMED if result["tls_resumed"] else 0)
+    header = _FIXED.pack(
+        int(timestamp.timestamp() * 1e6),
+        flags,
+        CHECK_TYPES.index(check_type),
+        _MISSING if status_code is None else status_code,
+        *(
+            _MISSING if result.get(field) is None else result[field]
+            for field in DURATION_FIELDS
+        ),
+        len(error),
+        len(website_ids),
+    )
+    return header + error + b"".join(UUID(str(i)).bytes for i in website_ids)
+
+
+def decode_result(record: bytes) -> Tuple[List[str], dict, str, datetime]:
+    """Website ids, result, check type and timestamp of an encoded record"""
+    timestamp_us, flags, check_type, status_code, *rest = _FIXED.unpack_from(record)
+    durations = rest[: len(DURATION_FIELDS)]
+    error_length, website_count = rest[len(DURATION_FIELDS) :]  # noqa: E203
+    offset = _FIXED.size
+    end = offset + error_length
+    error = record[offset:end].decode(errors="replace")
+    offset = end
+    website_ids = [
+        str(UUID(bytes=record[start : start + 16]))  # noqa: E203
+        for start in range(offset, offset + 16 * website_count, 16)
+    ]
+    result = {
+        "is_up": bool(flags & _UP),
+        "status_code": _optional(status_code),
+        **{field: _optional(value) for field, value in zip(DURATION_FIELDS, durations)},
+        "tls_resumed": bool(flags & _TLS_RESUMED) if flags & _TLS_KNOWN else None,
+        "error_message": error or None,
+    }
+    timestamp = datetime.fromtimestamp(timestamp_us / 1e6, tz=timezone.utc)
+    return website_ids, result, CHECK_TYPES[check_type], timestamp
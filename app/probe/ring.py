@@ -0,0 +1,60 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+VIRTUAL_NODES = 100  # points per member on the ring, evening out their shares
+
+
+def position(key: str) -> int:
+    """
+    Point of a key on the ring: 63 bits, so it also fits a signed BIGINT column
+    (Website.ring_position) and a member's share can be selected by range
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+class HashRing:
+    """
+    Consistent hashing of keys to members. The probe daemons share websites by
+    id (app.probe.daemon); the uptime scheduler shares probe targets between
+    worker shards by host name (app.utils.sharding), so all the probes of a
+    host meet the same DNS cache. Each member owns the arcs ending at its
+    virtual nodes, so a member joining or leaving only moves the keys of its
+    own share of the ring
+    """
+
+    def __init__(self, members: Iterable[str], vnodes: int = VIRTUAL_NODES):
+        self.members = sorted(set(members))
+        points = sorted(
+            (position(f"{member}#{index}"), member)
+            for member in self.members
+            for index in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Member a key belongs to, None on an empty ring"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, position(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def arcs(self, member: str) -> List[Tuple[Optional[int], Optional[int]]]:
+        """
+        Ranges of positions [start, end) a member owns, None for an open end,
+        adjacent ones merged
+        """
+        arcs: List[Tuple[Optional[int], Optional[int]]] = []
+        # a key belongs to the first point past its position, wrapping around
+        bounds = [None, *self._hashes]
+        owners = [*self._owners, self._owners[0] if self._owners else None]
+        for start, end, owner in zip(bounds, [*self._hashes, None], owners):
+            if owner != member:
+                continue
+            if arcs and arcs[-1][1] == start:
+                arcs[-1] = (arcs[-1][0], end)
+            else:
+                arcs.append((start, end))
+        return arcs
@@ -0,0 +1,164 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 1 << 20  # bytes preallocated per segment file
+SUFFIX = ".spool"
+
+# Each record is framed by its length and CRC-32. Segments are preallocated
+# with zeros, so a zero length marks the end of the written records, and a
+# record torn by a crash fails its CRC: reading stops there
+_FRAME = struct.Struct("<II")
+
+
+def read_segment(path: Path) -> List[bytes]:
+    """Records of a segment file, up to the end of what was fully written"""
+    records = []
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return records
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            while offset + _FRAME.size <= size:
+                length, crc = _FRAME.unpack_from(view, offset)
+                start = offset + _FRAME.size
+                end = start + length
+                if not length or end > size:
+                    break
+                record = view[start:end]
+                if zlib.crc32(record) != crc:
+                    logger.warning(f"Torn record at {path}:{offset}, ignoring the rest")
+                    break
+                records.append(record)
+                offset = end
+    return records
+
+
+class _Segment:
+    """Memory-mapped segment file being appended to, locked by its writer"""
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        # created under a name replayers don't list, and only given its own
+        # once locked: a replayer can't claim (and delete) it in between
+        creating = path.with_suffix(".new")
+        self.fd = os.open(creating, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        # held until the segment is sealed: replayers skip locked segments
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        os.ftruncate(self.fd, size)
+        os.rename(creating, path)
+        self.map = mmap.mmap(self.fd, size)
+        self.size = size
+        self.offset = 0
+
+    def fits(self, record: bytes) -> bool:
+        return self.offset + _FRAME.size + len(record) <= self.size
+
+    def append(self, record: bytes) -> None:
+        start = self.offset + _FRAME.size
+        end = start + len(record)
+        self.map[start:end] = record
+        # the frame goes last: a crash before it leaves no partial record
+        _FRAME.pack_into(self.map, self.offset, len(record), zlib.crc32(record))
+        self.offset = end
+
+    def close(self) -> None:
+        self.map.flush()
+        self.map.close()
+        os.close(self.fd)
+
+
+class Spool:
+    """
+    Crash-safe, append-only local store of records that couldn't be written to
+    the database. There is one spool directory per host, shared by the probe
+    processes running there (segments are claimed with flock, which only
+    holds between processes of one host). Each process appends to its own
+    memory-mapped segment file; any of them can replay segments nobody is
+    appending to (sealed ones, and those left behind by a process that died)
+    """
+
+    def __init__(self, directory: Path, segment_size: int = SEGMENT_SIZE):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self._segment: Optional[_Segment] = None
+
+    def _open_segment(self, min_size: int) -> _Segment:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # named by creation time, so replay goes oldest first
+        path = self.directory / f"{time.time_ns():020d}-{os.getpid()}{SUFFIX}"
+        return _Segment(path, max(self.segment_size, min_size))
+
+    def append(self, records: Iterable[bytes]) -> int:
+        """Append records and flush them to disk. Returns how many were written"""
+        written = 0
+        for record in records:
+            if self._segment is None or not self._segment.fits(record):
+                self.seal()
+                self._segment = self._open_segment(_FRAME.size + len(record))
+            self._segment.append(record)
+            written += 1
+        if self._segment is not None:
+            self._segment.map.flush()
+        return written
+
+    def seal(self) -> None:
+        """Close the segment being appended to, making it replayable"""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def segments(self) -> List[Path]:
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob(f"*{SUFFIX}"))
+
+    def pending(self) -> bool:
+        """Whether there are spooled records, including this process' own"""
+        return bool(self.segments())
+
+    def replay(self, load: Callable[[List[bytes]], None]) -> int:
+        """
+        Pass the records of each replayable segment to load, oldest segment
+        first, deleting the segment once load returns. A failing load leaves
+        its segment in place and is raised. Records are delivered at least
+        once: a crash between load and deletion replays the segment again
+        """
+        self.seal()
+        replayed = 0
+        for path in self.segments():
+            for records in self._claim(path):
+                if records:
+                    load(records)
+                    replayed += len(records)
+                path.unlink()
+        return replayed
+
+    def _claim(self, path: Path) -> Iterator[List[bytes]]:
+        """
+        Yield the records of a segment while holding its lock, nothing if it is
+        being written or was already replayed by another process
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            if os.fstat(fd).st_nlink == 0:  # deleted while we waited
+                return
+            yield read_segment(path)
+        finally:
+            os.close(fd)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import ssl
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+import certifi
+from cryptography import x509
+
+from app.exceptions.probe import DNSResolutionError
+from app.probe.dns import CachingResolver, get_resolver
+
+TLS_TIMEOUT = 10.0  # seconds allowed for the connection and handshake
+SESSION_CACHE_SIZE = 10_000  # hosts whose TLS session is kept
+SESSION_TTL = 3600  # seconds a session is offered, when its ticket allows as long
+
+# cleared while a probe needs a full handshake (see http_get's resume)
+offer_sessions: ContextVar[bool] = ContextVar("offer_sessions", default=True)
+
+
+class SessionCache:
+    """
+    Latest TLS session of each host, for resumption: kept until its ticket
+    lifetime (capped at ttl) runs out, least recently used hosts evicted first
+    """
+
+    def __init__(
+        self,
+        size: int = SESSION_CACHE_SIZE,
+        ttl: float = SESSION_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.size = size
+        self.ttl = ttl
+        self._clock = clock
+        self._sessions: OrderedDict[str, Tuple[float, ssl.SSLSession]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, host: str) -> Optional[ssl.SSLSession]:
+        entry = self._sessions.get(host)
+        if entry is None:
+            return None
+        expires_at, session = entry
+        if expires_at <= self._clock():
+            del self._sessions[host]
+            return None
+        self._sessions.move_to_end(host)
+        return session
+
+    def put(self, host: str, session: Optional[ssl.SSLSession]) -> None:
+        if session is None:
+            return
+        lifetime = min(self.ttl, session.ticket_lifetime_hint or self.ttl)
+        self._sessions[host] = (self._clock() + lifetime, session)
+        self._sessions.move_to_end(host)
+        while len(self._sessions) > self.size:
+            self._sessions.popitem(last=False)
+
+
+class ResumingContext(ssl.SSLContext):
+    """
+    Client context offering the cached session of the server's host on each
+    handshake, so repeat connections resume it instead of a full handshake.
+    Sessions only resume on the context that created them: probes share one
+    """
+
+    sessions: SessionCache
+
+    def wrap_bio(
+        self, incoming, outgoing, server_side=False, server_hostname=None, session=None
+    ):
+        if (
+            session is None
+            and server_hostname
+            and not server_side
+            and offer_sessions.get()
+        ):
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(
+            incoming, outgoing, server_side, server_hostname, session
+        )
+
+
+def certificate_details(cert_binary: bytes) -> dict:
+    """
+    A verified peer certificate (DER) in the shape of record_ssl_result's
+    arguments
+    """
+    cert = x509.load_der_x509_certificate(cert_binary)
+    issuer = cert.issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    return {
+        "is_valid": True,
+        "valid_until": cert.not_valid_after_utc,
+        "issuer": issuer[0].value if issuer else None,
+        "fingerprint": hashlib.sha256(cert_binary).hexdigest(),
+        "error_message": None,
+    }
+
+
+def certificate_error(error_message: str) -> dict:
+    """A failed certificate check in the shape of record_ssl_result's arguments"""
+    return {
+        "is_valid": False,
+        "valid_until": None,
+        "issuer": None,
+        "fingerprint": None,
+        "error_message": error_message,
+    }
+
+
+@lru_cache
+def get_probe_context() -> ResumingContext:
+    """Verifying TLS context shared by the HTTP probes of the process"""
+    context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(certifi.where())
+    context.sessions = SessionCache()
+    return context
+
+
+async def check_certificate(
+    host: str,
+    port: int = 443,
+    timeout: float = TLS_TIMEOUT,
+    resolver: Optional[CachingResolver] = None,
+) -> dict:
+    """
+    Certificate check of a host: a verified TLS handshake, reporting the peer
+    certificate in the shape of record_ssl_result's arguments. It always runs
+    a full handshake, never resuming a cached session
+    """
+    resolver = resolver or get_resolver()
+    context = ssl.create_default_context()
+    try:
+        address = (await resolver.resolve(host))[0]
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(address, port, ssl=context, server_hostname=host),
+            timeout,
+        )
+    except (DNSResolutionError, OSError, asyncio.TimeoutError) as exc:
+        return certificate_error(str(exc) or type(exc).__name__)
+    try:
+        cert_binary = writer.get_extra_info("ssl_object").getpeercert(binary_form=True)
+    finally:
+        writer.close()
+    return certificate_details(cert_binary)
@@ -0,0 +1,287 @@
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Type
+from uuid import UUID
+
+import numpy as np
+from celery.utils.log import get_task_logger
+from sqlalchemy import delete
+from sqlmodel import Session, SQLModel, select
+
+from app.api.v1.models import (
+    AdHocSSLLog,
+    Incident,
+    LatencyEstimate,
+    LatencySketch,
+    RefreshToken,
+    SSLLog,
+    UptimeDay,
+    UptimeLog,
+    Website,
+)
+from app.core.worker import celery_app
+from app.dependencies.db import SessionLocal
+from app.utils.archive import (
+    ArchivedChecks,
+    append_to_archive,
+    archive_path,
+    archive_root,
+    archived_through,
+    list_archives,
+)
+from app.utils.generic import as_utc
+
+logger = get_task_logger(__name__)
+
+BATCH_SIZE = 1000  # rows deleted per transaction
+BATCH_SLEEP_SECONDS = 0.2  # pause between batches to spread WAL and lock pressure
+ARCHIVE_RETENTION_MONTHS = 13  # archived checks are kept for a year (plus slack)
+# a deleted website still there this long after its deletion lost its purge
+PURGE_GRACE = timedelta(minutes=30)
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    model: Type[SQLModel]
+    timestamp_field: str  # column compared against the cutoff
+    max_age: timedelta
+
+
+# Raw probe results are only kept for a short while: long-range questions are
+# answered by the rollups maintained on the write path (latency sketches, uptime
+# bitmaps and incidents), which are kept much longer. Expired uptime logs are
+# moved to the columnar archive before the policy deletes anything.
+RETENTION_POLICIES: List[RetentionPolicy] = [
+    RetentionPolicy(UptimeLog, "timestamp", timedelta(days=14)),
+    RetentionPolicy(SSLLog, "last_seen", timedelta(days=90)),
+    RetentionPolicy(AdHocSSLLog, "timestamp", timedelta(days=30)),
+    RetentionPolicy(RefreshToken, "expires_at", timedelta(0)),
+    RetentionPolicy(LatencySketch, "bucket_start", timedelta(days=400)),
+    RetentionPolicy(UptimeDay, "day", timedelta(days=400)),
+    # by end, so open incidents (ended_at NULL) are never removed
+    RetentionPolicy(Incident, "ended_at", timedelta(days=400)),
+]
+
+# Tables holding rows of a website, purged before the website itself
+WEBSITE_CHILD_MODELS: List[Type[SQLModel]] = [
+    UptimeLog,
+    SSLLog,
+    LatencySketch,
+    LatencyEstimate,
+    UptimeDay,
+    Incident,
+]
+
+
+def delete_in_batches(
+    db: Session,
+    model: Type[SQLModel],
+    condition,
+    batch_size: int = BATCH_SIZE,
+    sleep_seconds: float = BATCH_SLEEP_SECONDS,
+) -> int:
+    """
+    Delete the rows matching a condition in small id-ordered batches, committing
+    after each one so no single transaction holds many locks or much WAL
+    """
+    deleted = 0
+    while True:
+        ids = db.exec(
+            select(model.id).where(condition).order_by(model.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return deleted
+        db.exec(delete(model).where(model.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+
+def apply_retention_policy(
+    db: Session,
+    policy: RetentionPolicy,
+    now: datetime,
+    batch_size: int = BATCH_SIZE,
+    sleep_seconds: float = BATCH_SLEEP_SECONDS,
+) -> int:
+    cutoff = now - policy.max_age
+    column = getattr(policy.model, policy.timestamp_field)
+    if policy.timestamp_field == "day":
+        cutoff = cutoff.date()
+    return delete_in_batches(
+        db, policy.model, column < cutoff, batch_size, sleep_seconds
+    )
+
+
+def purge_website_rows(
+    db: Session,
+    website_id: UUID,
+    batch_size: int = BATCH_SIZE,
+    sleep_seconds: float = BATCH_SLEEP_SECONDS,
+) -> int:
+    """
+    Remove a website and everything recorded for it, child tables first
+    """
+    deleted = 0
+    for model in WEBSITE_CHILD_MODELS:
+        deleted += delete_in_batches(
+            db, model, model.website_id == website_id, batch_size, sleep_seconds
+        )
+    website = db.get(Website, website_id)
+    if website:
+        db.delete(website)
+        db.commit()
+        deleted += 1
+    return deleted
+
+
+def _month_bounds(timestamp: datetime) -> tuple[datetime, datetime]:
+    start = timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def archive_expired_uptime_logs(
+    db: Session,
+    cutoff: datetime,
+    root: Path,
+    sleep_seconds: float = BATCH_SLEEP_SECONDS,
+) -> int:
+    """
+    Move uptime logs older than the cutoff into per-website monthly archive
+    files, one website month at a time, then delete them from the table. Each
+    file records the highest uptime log id it holds, so logs a crashed run
+    archived without deleting aren't archived twice by the next one
+    """
+    archived = 0
+    website_ids = db.exec(
+        select(UptimeLog.website_id).where(UptimeLog.timestamp < cutoff).distinct()
+    ).all()
+    for website_id in website_ids:
+        while True:
+            oldest = db.exec(
+                select(UptimeLog.timestamp)
+                .where(UptimeLog.website_id == website_id, UptimeLog.timestamp < cutoff)
+                .order_by(UptimeLog.timestamp)
+                .limit(1)
+            ).first()
+            if oldest is None:
+                break
+            month_start, month_end = _month_bounds(
+                as_utc(oldest).astimezone(timezone.utc)
+            )
+            condition = (
+                (UptimeLog.website_id == website_id)
+                & (UptimeLog.timestamp >= month_start)
+                & (UptimeLog.timestamp < min(month_end, cutoff))
+            )
+            path = archive_path(website_id, month_start.year, month_start.month, root)
+            rows = db.exec(
+                select(
+                    UptimeLog.id,
+                    UptimeLog.timestamp,
+                    UptimeLog.is_up,
+                    UptimeLog.response_time_us,
+                    UptimeLog.status_code,
+                ).where(condition, UptimeLog.id > archived_through(path))
+            ).all()
+            if rows:
+                checks = ArchivedChecks(
+                    timestamps_us=np.array(
+                        [int(as_utc(row[1]).timestamp() * 1e6) for row in rows],
+                        dtype=np.int64,
+                    ),
+                    is_up=np.array([row[2] for row in rows], dtype=bool),
+                    response_time=np.array(
+                        [np.nan if row[3] is None else row[3] / 1000 for row in rows],
+                        dtype=np.float32,
+                    ),
+                    status_code=np.array(
+                        [-1 if row[4] is None else row[4] for row in rows],
+                        dtype=np.int16,
+                    ),
+                )
+                append_to_archive(path, checks, max(row[0] for row in rows))
+            archived += delete_in_batches(
+                db, UptimeLog, condition, sleep_seconds=sleep_seconds
+            )
+    return archived
+
+
+def prune_archives(root: Path, now: datetime) -> int:
+    """Remove archive files older than ARCHIVE_RETENTION_MONTHS"""
+    months = now.year * 12 + now.month - 1 - ARCHIVE_RETENTION_MONTHS
+    oldest_kept = f"{months // 12:04d}-{months % 12 + 1:02d}"
+    removed = 0
+    if not root.is_dir():
+        return removed
+    for directory in root.iterdir():
+        for path in list_archives(UUID(directory.name), root):
+            if path.stem < oldest_kept:
+                path.unlink()
+                removed += 1
+    return removed
+
+
+@celery_app.task
+def purge_expired_rows():
+    """
+    Periodic task archiving expired uptime logs and applying every retention
+    policy
+    """
+    now = datetime.now(timezone.utc)
+    root = archive_root()
+    with SessionLocal() as db:
+        archived = archive_expired_uptime_logs(
+            db, now - RETENTION_POLICIES[0].max_age, root
+        )
+        logger.info(f"Archived {archived} uptime logs to {root}")
+        prune_archives(root, now)
+        for policy in RETENTION_POLICIES:
+            deleted = apply_retention_policy(db, policy, now)
+            if deleted:
+                logger.info(
+                    f"Retention removed {deleted} rows from "
+                    f"{policy.model.__tablename__}"
+                )
+
+
+@celery_app.task
+def purge_website(website_id: str):
+    """
+    Background deletion of a website marked as deleted through the API
+    """
+    with SessionLocal() as db:
+        deleted = purge_website_rows(db, UUID(website_id))
+    shutil.rmtree(archive_root() / website_id, ignore_errors=True)
+    logger.info(f"Purged website {website_id} ({deleted} rows)")
+
+
+def stale_purges(db: Session, now: datetime) -> List[UUID]:
+    """Websites deleted more than PURGE_GRACE ago and not purged yet"""
+    return db.exec(
+        select(Website.id).where(Website.deleted_at < now - PURGE_GRACE)
+    ).all()
+
+
+@celery_app.task
+def requeue_stale_purges():
+    """
+    Periodic task queueing the purge of deleted websites again, for purges that
+    were lost or never sent (the broker was down when the website was deleted).
+    Purging is idempotent, so a slow one queued twice does no harm
+    """
+    with SessionLocal() as db:
+        website_ids = stale_purges(db, datetime.now(timezone.utc))
+    for website_id in website_ids:
+        purge_website.delay(str(website_id))
+    if website_ids:
+        logger.warning(f"Requeued the purge of {len(website_ids)} deleted websites")
+    return {"requeued": len(website_ids)}
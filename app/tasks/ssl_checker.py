@@ -1,21 +1,40 @@
 import logging
 import socket
 import ssl
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
+from urllib.parse import urlsplit
+from uuid import UUID
 
-from cryptography import x509
-from cryptography.hazmat.backends import default_backend
-from sqlmodel import select
+from sqlmodel import func, select
 
-from app.api.v1.models import AdHocSSLLog, SSLLog, Website
+from app.api.v1.models import AdHocSSLLog, CheckType, Website
 from app.api.v1.schemas import SSLStatusResponse
 from app.core.worker import celery_app
 from app.dependencies.db import SessionLocal
+from app.probe.dns import resolve
+from app.probe.tls import TLS_TIMEOUT, certificate_details, certificate_error
+from app.utils.crud import SSL_CHECK_INTERVAL, record_website_certificate
 from app.utils.generic import validate_url
+from app.utils.politeness import (
+    ProbeJob,
+    build_limiters,
+    format_delay_report,
+    plan_dispatch,
+    resolve_hosts,
+    summarize_delays,
+)
 
 logger = logging.getLogger(__name__)
 
+SWEEP_PRIORITY = 1  # below checks requested through the API
+
+
+def _record_website_check(db, website_id: str, certificate: dict):
+    website = db.get(Website, UUID(website_id))
+    if website is not None:  # unless purged since the check was queued
+        record_website_certificate(db, website, certificate)
+
 
 @celery_app.task
 def check_ssl_status_task(
@@ -31,50 +50,40 @@ def check_ssl_status_task(
         # Create SSL context
         context = ssl.create_default_context()
 
-        # Establish a TCP connection
-        with socket.create_connection((domain, 443)) as sock:
+        # Establish a TCP connection to an address from the shared DNS cache
+        # (the handshake still verifies the certificate against the host name)
+        address = resolve(domain)[0]
+        with socket.create_connection((address, 443), timeout=TLS_TIMEOUT) as sock:
             with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                cert_binary = ssock.getpeercert(binary_form=True)
-                cert = x509.load_der_x509_certificate(cert_binary, default_backend())
-
-                expiry_date = cert.not_valid_after
-                days_remaining = (expiry_date - datetime.now()).days
-                issuer = cert.issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[
-                    0
-                ].value
-
-                result = {
-                    "valid": True,
-                    "expiry_date": expiry_date.isoformat(),
-                    "days_remaining": days_remaining,
-                    "issuer": issuer,
-                    "needs_renewal": days_remaining <= 30,  # Example threshold
-                    "error": None,
-                }
-
-                # Log the result to the database (if website_id is provided)
-                with SessionLocal() as db:
-                    if website_id:
-                        ssl_log = SSLLog(
-                            website_id=website_id,
-                            valid_until=expiry_date,
-                            issuer=issuer,
-                            is_valid=True,
-                            error=None,
-                        )
-                        db.add(ssl_log)
-                    else:
-                        adhoc_ssl_log = AdHocSSLLog(
-                            url=url,
-                            api_key_id=api_key_id,
-                            valid_until=expiry_date,
-                            issuer=issuer,
-                            is_valid=True,
-                            error=None,
-                        )
-                    db.add(adhoc_ssl_log)
+                certificate = certificate_details(ssock.getpeercert(binary_form=True))
+
+        expiry_date = certificate["valid_until"]
+        days_remaining = (expiry_date - datetime.now(timezone.utc)).days
+        result = {
+            "valid": True,
+            "expiry_date": expiry_date.isoformat(),
+            "days_remaining": days_remaining,
+            "issuer": certificate["issuer"],
+            "needs_renewal": days_remaining <= 30,  # Example threshold
+            "error": None,
+        }
+
+        # Log the result to the database (if website_id is provided)
+        with SessionLocal() as db:
+            if website_id:
+                _record_website_check(db, website_id, certificate)
+            else:
+                adhoc_ssl_log = AdHocSSLLog(
+                    url=url,
+                    api_key_id=api_key_id,
+                    valid_until=expiry_date,
+                    issuer=certificate["issuer"],
+                    is_valid=True,
+                    error=None,
+                )
+                db.add(adhoc_ssl_log)
                 db.commit()
-                return result
+        return result
 
     except Exception as e:
         logger.error(f"Error checking SSL status for {url}: {e}")
@@ -90,14 +99,7 @@ def check_ssl_status_task(
         # Log the error to the database (if website_id is provided)
         with SessionLocal() as db:
             if website_id:
-                ssl_log = SSLLog(
-                    website_id=website_id,
-                    valid_until=None,
-                    issuer=None,
-                    is_valid=False,
-                    error=str(e),
-                )
-                db.add(ssl_log)
+                _record_website_check(db, website_id, certificate_error(str(e)))
             else:
                 adhoc_ssl_log = AdHocSSLLog(
                     url=url,
@@ -107,7 +109,8 @@ def check_ssl_status_task(
                     is_valid=False,
                     error=str(e),
                 )
-            db.commit()
+                db.add(adhoc_ssl_log)
+                db.commit()
         return result
 
 
@@ -118,12 +121,47 @@ def periodic_ssl_check():
     Works well when the number of websites to be checked is small
     If the number of website grows, might be better to check the active
     websites only
+
+    HTTPS uptime probes check the certificate of their websites daily, so only
+    the websites they don't cover (other check types) are swept, and those
+    whose certificate they failed to bring back
     """
+    now = datetime.now(timezone.utc)
+    covered_by_probes = (
+        Website.check_type.is_(None) | (Website.check_type == CheckType.HTTP)
+    ) & func.lower(Website.url).startswith("https://")
     with SessionLocal() as db:
         websites = db.exec(
             select(Website).where(
-                Website.is_active.is_(True) & Website.ssl_check_enabled.is_(True)
+                Website.is_active.is_(True),
+                Website.ssl_check_enabled.is_(True),
+                ~covered_by_probes
+                | Website.ssl_last_checked.is_(None)
+                | (Website.ssl_last_checked <= now - SSL_CHECK_INTERVAL),
             )
         ).all()
-        for website in websites:
-            check_ssl_status_task.delay(website.url, website.id)
+        jobs = [
+            ProbeJob(
+                target=website.url,
+                check_type="ssl",
+                website_ids=[str(website.id)],
+                tenant=str(website.user_id),
+                host=urlsplit(website.url).hostname or website.url,
+            )
+            for website in websites
+        ]
+
+    # Same politeness limits and tenant fairness as the uptime probes
+    ips = resolve_hosts(job.host for job in jobs)
+    for job in jobs:
+        job.ip = ips.get(job.host)
+    planned = plan_dispatch(jobs, *build_limiters())
+    for job in planned:
+        check_ssl_status_task.apply_async(
+            (job.target, job.website_ids[0]),
+            countdown=job.countdown,
+            priority=SWEEP_PRIORITY,
+        )
+    logger.info(
+        "SSL probe queueing delay: " + format_delay_report(summarize_delays(planned))
+    )
@@ -1,24 +1,77 @@
+import asyncio
+import json
 import logging
 import random
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from uuid import UUID
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from uuid import UUID, uuid4
 
-import httpx
 from celery.utils.log import get_task_logger
-from ping3 import ping
+from redis.exceptions import RedisError
 from sqlalchemy.exc import OperationalError
 from sqlmodel import select
 
-from app.api.v1.models import UptimeLog, Website
-from app.core.worker import celery_app
+from app.api.v1.models import CheckType, Website
+from app.core.worker import celery_app, shard_queue
 from app.dependencies.db import SessionLocal
-from app.utils.generic import validate_url
+from app.dependencies.settings import get_settings
+from app.ingest import publish_results, record_result, write_records
+from app.probe.checks import adaptive_timeout, confirmed_http_check, probe_options
+from app.probe.dns import check_records
+from app.probe.icmp import ping_targets
+from app.probe.results import encode_result
+from app.probe.spool import Spool
+from app.utils.backpressure import (
+    DispatchStats,
+    dispatch_budget,
+    estimate_throughput,
+    load_stats,
+    outstanding_probes,
+    save_stats,
+    schedule_lag,
+    settle_probe,
+    track_probes,
+)
+from app.utils.crud import (
+    get_latency_estimates,
+    record_website_certificate,
+    ssl_check_due,
+)
+from app.utils.frequency import (
+    UPTIME_CHECK_INTERVAL_MINUTES,
+    check_due_at,
+    mark_dispatched,
+    uptime_check_due,
+    uptime_check_order,
+)
+from app.utils.generic import normalize_probe_target
+from app.utils.politeness import (
+    ProbeJob,
+    build_limiters,
+    format_delay_report,
+    plan_dispatch,
+    resolve_hosts,
+    summarize_delays,
+)
+from app.utils.sharding import (
+    cache_hit_rates,
+    live_shards,
+    report_cache_stats,
+    shard_ring,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = get_task_logger(__name__)
 
-UPTIME_CHECK_INTERVAL_MINUTES = 5  # Interval for uptime checks in minutes
+SCHEDULE_TICK_SECONDS = 60  # how often schedule_uptime_checks runs (beat)
 BASE_RETRY_DELAY = 30  # Base delay for retries in seconds
+DNS_BATCH_SIZE = 500  # DNS checks run by one task
+PING_BATCH_SIZE = 1000  # hosts pinged by one task
 
 
 @celery_app.task(
@@ -28,47 +81,443 @@ BASE_RETRY_DELAY = 30  # Base delay for retries in seconds
 def schedule_uptime_checks(self):
     """Periodically check websites that are due for an uptime check."""
 
-    # Fetch websites that need to be checked
-    # Check if the website is active and if the last check was more than
-    # the UPTIME_CHECK_INTERVAL_MINUTES or if it has never been checked
+    # Fetch websites that need to be checked: active ones whose last check was
+    # more than UPTIME_CHECK_INTERVAL_MINUTES ago (or never ran), or in the
+    # adaptive schedule whose next check is due
     try:
+        shards = live_shards()
+        ring = shard_ring(shards)
+        depth = outstanding_probes()
+        previous = load_stats()
+        tick = time.time()
+        throughput = (
+            estimate_throughput(previous, depth, tick) if depth is not None else None
+        )
+        budget = dispatch_budget(
+            depth or 0,
+            throughput,
+            SCHEDULE_TICK_SECONDS,
+            get_settings().uptime_dispatch_max_per_tick,
+        )
         with SessionLocal() as db:
             now = datetime.now(timezone.utc)
-            statement = select(Website).where(
-                Website.is_active.is_(True),
-                Website.uptime_last_checked.is_(None)
-                | (
-                    Website.uptime_last_checked
-                    <= now - timedelta(minutes=UPTIME_CHECK_INTERVAL_MINUTES)
-                ),  # check if X minutes have passed since uptime_last_checked
+            interval = timedelta(minutes=UPTIME_CHECK_INTERVAL_MINUTES)
+            statement = (
+                select(Website)
+                .where(uptime_check_due(now))
+                .order_by(*uptime_check_order())
             )
             websites = db.exec(statement).all()
             if not websites:
                 logger.info("No websites due for uptime check.")
                 return
+            lag = schedule_lag((check_due_at(website) for website in websites), now)
+            estimates = get_latency_estimates(
+                db,
+                [
+                    website.id
+                    for website in websites
+                    if CheckType(website.check_type or CheckType.HTTP) == CheckType.HTTP
+                ],
+            )
+            # Websites registered by several users often point to the same
+            # target: probe each target once and record the result for all of them
+            jobs: Dict[Tuple[str, str, str], ProbeJob] = {}
+            dns_checks: Dict[Tuple[str, str, Optional[str]], List[str]] = {}
+            # Under backpressure only the most overdue targets are dispatched;
+            # the others stay due and are coalesced into the next tick's check
+            used = 0.0
+            accepted: List[Website] = []
             for website in websites:
-                check_website_uptime.delay(
-                    website.url, str(website.id), website.check_type
-                )
-                website.uptime_last_checked = now
-                db.add(website)
+                check_type = CheckType(website.check_type or CheckType.HTTP).value
+                target = normalize_probe_target(website.url, check_type)
+                if check_type == CheckType.DNS:
+                    key = (
+                        target,
+                        website.dns_record_type or "A",
+                        website.dns_expected_value,
+                    )
+                    if key not in dns_checks:
+                        if used + 1 / DNS_BATCH_SIZE > budget:
+                            continue
+                        used += 1 / DNS_BATCH_SIZE
+                        dns_checks[key] = []
+                    dns_checks[key].append(str(website.id))
+                else:
+                    options = probe_options(website, check_type)
+                    key = (target, check_type, json.dumps(options, sort_keys=True))
+                    job = jobs.get(key)
+                    if job is None:
+                        cost = 1 / PING_BATCH_SIZE if check_type == "ping" else 1
+                        if used + cost > budget:
+                            continue
+                        used += cost
+                        # a shared target is charged to its first subscriber
+                        job = jobs[key] = ProbeJob(
+                            target=target,
+                            check_type=check_type,
+                            website_ids=[],
+                            tenant=str(website.user_id),
+                            host=urlsplit(target).hostname or target,
+                            options=options,
+                        )
+                    job.website_ids.append(str(website.id))
+                    # HTTPS probes bring the certificate back when it's due,
+                    # instead of a separate SSL check connecting again
+                    if target.startswith("https://") and ssl_check_due(website, now):
+                        job.options["certificate"] = True
+                    # a shared target waits as long as its slowest website needs
+                    if check_type == CheckType.HTTP:
+                        job.options["timeout"] = max(
+                            job.options.get("timeout", 0.0),
+                            adaptive_timeout(estimates.get(website.id)),
+                        )
+                accepted.append(website)
+
+            # Spread probes to the same host or IP over the tick and interleave
+            # tenants, so neither a shared host nor a large account gets a
+            # burst. Probes that can't start before the next tick stay due and
+            # are planned again then, rather than waiting in the queue
+            ips = resolve_hosts(job.host for job in jobs.values())
+            for job in jobs.values():
+                job.ip = ips.get(job.host)
+            planned = plan_dispatch(
+                jobs.values(), *build_limiters(), window=SCHEDULE_TICK_SECONDS
+            )
+            planned_ids = {
+                website_id for job in planned for website_id in job.website_ids
+            }
+            planned_ids.update(
+                website_id
+                for website_ids in dns_checks.values()
+                for website_id in website_ids
+            )
+            dispatched = 0
+            for website in accepted:
+                if str(website.id) in planned_ids:
+                    mark_dispatched(website, now)
+                    db.add(website)
+                    dispatched += 1
             db.commit()
-            logger.info(f"Uptime checks ran for {len(websites)} websites.")
+
+        # DNS checks only query resolvers, not the monitored hosts: they skip
+        # the politeness limits and run in large concurrent batches
+        messages: List[Tuple[Any, tuple, Dict[str, Any]]] = []
+        checks = [[*key, website_ids] for key, website_ids in dns_checks.items()]
+        for start in range(0, len(checks), DNS_BATCH_SIZE):
+            end = start + DNS_BATCH_SIZE
+            messages.append(
+                (
+                    check_dns_targets,
+                    (checks[start:end],),
+                    {"expires": interval.total_seconds()},
+                )
+            )
+
+        # Each host goes to the queue of the shard owning it, so its probes
+        # find the DNS cache of the previous ones warm. DNS checks bypass that
+        # cache and stay on the shared queue
+        ping_batches: Dict[Tuple[int, Optional[str]], List[list]] = defaultdict(list)
+        for job in planned:
+            shard = ring.owner(job.host) if ring else None
+            if job.check_type == CheckType.PING:
+                # pings starting in the same second share one task (and socket)
+                ping_batches[int(job.countdown), shard].append(
+                    [job.target, job.website_ids]
+                )
+                continue
+            messages.append(
+                (
+                    check_target_uptime,
+                    (job.target, job.website_ids, job.check_type, job.options),
+                    {
+                        "countdown": job.countdown,
+                        "expires": job.countdown + interval.total_seconds(),
+                        "queue": shard_queue(shard) if shard else None,
+                    },
+                )
+            )
+        for (countdown, shard), targets in ping_batches.items():
+            for start in range(0, len(targets), PING_BATCH_SIZE):
+                end = start + PING_BATCH_SIZE
+                messages.append(
+                    (
+                        check_ping_targets,
+                        (targets[start:end],),
+                        {
+                            "countdown": countdown,
+                            "expires": countdown + interval.total_seconds(),
+                            "queue": shard_queue(shard) if shard else None,
+                        },
+                    )
+                )
+
+        # Probes count as outstanding from before they're published until they
+        # run or expire, so the next tick also sees those a worker prefetched
+        # and holds until its countdown is over
+        for _, _, options in messages:
+            options["task_id"] = str(uuid4())
+        track_probes(
+            {options["task_id"]: tick + options["expires"] for *_, options in messages}
+        )
+        for task, args, options in messages:
+            task.apply_async(args, **options)
+        published = len(messages)  # for the next tick's throughput estimate
+        save_stats(
+            DispatchStats(
+                at=tick,
+                depth=depth or 0,
+                dispatched=published,
+                throughput=throughput,
+            ),
+            lag,
+        )
+        logger.info(
+            f"Uptime checks ran for {dispatched} of {len(websites)} due websites "
+            f"({len(planned) + len(dns_checks)} distinct targets)."
+        )
+        logger.info(
+            f"Uptime schedule lag: {lag['count']} checks due, "
+            f"median {lag['p50']:.0f}s, max {lag['max']:.0f}s late; "
+            f"outstanding probes {'unknown' if depth is None else depth}, "
+            f"dispatch budget {budget}"
+        )
+        hit_rates = cache_hit_rates()
+        logger.info(
+            f"Uptime probes sharded across {len(shards)} workers; "
+            "DNS cache hit rate "
+            + (
+                ", ".join(
+                    f"{shard} {rate:.0%}" for shard, rate in sorted(hit_rates.items())
+                )
+                or "unknown"
+            )
+        )
+        if dispatched < len(websites):
+            logger.warning(
+                f"Probe workers are behind: deferred {len(websites) - dispatched} "
+                "uptime checks to the next tick"
+            )
+        logger.info(
+            "Uptime probe queueing delay: "
+            + format_delay_report(summarize_delays(planned))
+        )
     except OperationalError as e:
         # if database error occurs, retry with jitter
         delay = random.uniform(0, BASE_RETRY_DELAY * (2**self.request.retries))
         logger.error(f"Database connection error: {e}, retrying in {delay:.2f}s")
         self.retry(countdown=delay)
     except Exception as e:
+        # the session (if one was opened) rolled back when its block exited
         logger.error(f"Error scheduling uptime checks: {e}", exc_info=True)
-        db.rollback()
         raise
 
 
+def probe_target(
+    target: str, check_type: str, options: Optional[Dict[str, Any]] = None
+) -> dict:
+    """
+    Run one uptime probe. An HTTP target that doesn't answer is probed again
+    in-process before it's reported down, rather than retried by the queue
+    """
+    if check_type == "http":
+        return asyncio.run(confirmed_http_check(target, options))
+    return asyncio.run(ping_targets([target]))[target]
+
+
+@lru_cache
+def get_spool() -> Spool:
+    return Spool(Path(get_settings().spool_dir))
+
+
+def _load_spooled(records: List[bytes]):
+    """Send one spooled segment on, to the results stream or the database"""
+    if get_settings().results_sink == "stream":
+        publish_results(records)
+        return
+    with SessionLocal() as db:
+        write_records(db, records)
+
+
+def replay_spool() -> int:
+    """Load the results spooled during an outage, oldest first"""
+    spool = get_spool()
+    if not spool.pending():
+        return 0
+    replayed = spool.replay(_load_spooled)
+    if replayed:
+        logger.info(f"Replayed {replayed} spooled probe results")
+    return replayed
+
+
+def save_results(results: List[Tuple[List[str], dict]], check_type: str):
+    """
+    Save probe results, each for every website sharing the probed target:
+    publish them to the results stream, or write them to the database. When
+    that is unavailable the results are appended to the local spool instead,
+    with the time they were measured, rather than retrying the probes; they
+    are replayed once it is reachable again
+    """
+    timestamp = datetime.now(timezone.utc)
+    if get_settings().results_sink == "stream":
+        records = [
+            encode_result(website_ids, result, check_type, timestamp)
+            for website_ids, result in results
+        ]
+        try:
+            replay_spool()
+            publish_results(records)
+        except RedisError as e:
+            logger.error(f"Error publishing {check_type} check results: {e}")
+            get_spool().append(records)
+        return
+
+    pending = [
+        (website_id, result)
+        for website_ids, result in results
+        for website_id in website_ids
+    ]
+    saved = 0
+    try:
+        # older spooled results go first, so derived tables see them in order
+        try:
+            replay_spool()
+        except OperationalError:
+            raise
+        except Exception as e:
+            logger.error(f"Error replaying spooled results: {e}", exc_info=True)
+        with SessionLocal() as db:
+            # Save the results and update the derived latency sketches
+            for website_id, result in pending:
+                record_result(db, website_id, result, check_type, timestamp)
+                saved += 1
+    except OperationalError as e:
+        logger.error(
+            f"Database error saving {check_type} check results: {e}, "
+            f"spooling {len(pending) - saved} results"
+        )
+        get_spool().append(
+            encode_result([website_id], result, check_type, timestamp)
+            for website_id, result in pending[saved:]
+        )
+
+
+def save_certificate(website_ids: List[str], certificate: dict):
+    """
+    Save the certificate seen by an HTTPS probe for the websites it probed that
+    monitor SSL. On a database error it is left for the next probe: the
+    websites' SSL checks stay due
+    """
+    timestamp = datetime.now(timezone.utc)
+    try:
+        with SessionLocal() as db:
+            websites = db.exec(
+                select(Website).where(
+                    Website.id.in_([UUID(website_id) for website_id in website_ids]),
+                    Website.ssl_check_enabled.is_(True),
+                )
+            ).all()
+            for website in websites:
+                record_website_certificate(db, website, certificate, timestamp)
+    except OperationalError as e:
+        logger.error(f"Database error saving the certificate of {website_ids}: {e}")
+
+
+def run_uptime_check(
+    task,
+    target: str,
+    website_ids: List[str],
+    check_type: str,
+    options: Optional[Dict[str, Any]] = None,
+):
+    """
+    Probe a target once and save the result for every website checking it
+    """
+    if check_type not in ("http", "ping"):
+        logger.error(f"Invalid check_type: {check_type}")
+        return {"error": "Invalid check_type"}
+
+    result = probe_target(target, check_type, options)
+    certificate = result.pop("certificate", None)
+    save_results([(website_ids, result)], check_type)
+    if certificate is not None:
+        save_certificate(website_ids, certificate)
+    report_cache_stats(task.request.hostname)
+    return {
+        "is_up": result["is_up"],
+        "response_time_us": result["response_time_us"],
+        "dns_us": result["dns_us"],
+        "bytes_downloaded": result.get("bytes_downloaded"),
+        "tls_resumed": result.get("tls_resumed"),
+    }
+
+
+@celery_app.task(bind=True, max_retries=3)
+def check_target_uptime(
+    self,
+    target: str,
+    website_ids: List[str],
+    check_type: str,
+    options: Optional[Dict[str, Any]] = None,
+):
+    """
+    Checks the uptime of a normalised probe target shared by several websites
+    probing it with the same options.
+    """
+    try:
+        result = run_uptime_check(self, target, website_ids, check_type, options)
+    finally:
+        settle_probe(self.request.id)
+    return {"target": target, "website_ids": website_ids, **result}
+
+
+@celery_app.task(bind=True, max_retries=3)
+def check_dns_targets(self, checks: List[list]):
+    """
+    Runs a batch of DNS checks concurrently. Each check is a
+    [host, record type, expected value, website ids] list.
+    """
+    try:
+        results = asyncio.run(
+            check_records(
+                (host, record_type, expected)
+                for host, record_type, expected, _ in checks
+            )
+        )
+        save_results(
+            [(check[3], result) for check, result in zip(checks, results)], "dns"
+        )
+    finally:
+        settle_probe(self.request.id)
+    return {
+        "checks": len(checks),
+        "down": sum(not result["is_up"] for result in results),
+    }
+
+
+@celery_app.task(bind=True, max_retries=3)
+def check_ping_targets(self, targets: List[list]):
+    """
+    Pings a batch of hosts at once. Each target is a [host, website ids] list.
+    """
+    try:
+        results = asyncio.run(ping_targets(host for host, _ in targets))
+        save_results(
+            [(website_ids, results[host]) for host, website_ids in targets], "ping"
+        )
+        report_cache_stats(self.request.hostname)
+    finally:
+        settle_probe(self.request.id)
+    return {
+        "checks": len(targets),
+        "down": sum(not results[host]["is_up"] for host, _ in targets),
+    }
+
+
 @celery_app.task(bind=True, max_retries=3)
 def check_website_uptime(self, url: str, website_id: str, check_type: str = "http"):
     """
-    Periodically checks the uptime of a website.
+    Checks the uptime of a single website.
     """
     try:
         UUID(website_id)  # Validate UUID
@@ -76,58 +525,36 @@ def check_website_uptime(self, url: str, website_id: str, check_type: str = "htt
         logger.error(f"Invalid website_id: {website_id}")
         return {"website_id": website_id, "error": "Invalid website_id"}
 
-    try:
-        # validate url
-        domain = validate_url(url)
-        if check_type == "http":
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get(domain)
-                is_up = response.status_code == 200
-                status_code = response.status_code
-                response_time = response.elapsed.total_seconds()
-        elif check_type == "ping":
-            response_time = ping(domain, timeout=10)
-            is_up = response_time is not None
-            status_code = None
-            error_message = "Ping failed" if not is_up else None
-            response_time = response_time if is_up else None
-        else:
-            logger.error(f"Invalid check_type: {check_type}")
-            return {"website_id": website_id, "error": "Invalid check_type"}
-
-    except httpx.RequestError as exc:
-        if isinstance(exc, httpx.TimeoutException):
-            # if a timeout occurs, retry with jitter
-            delay = random.uniform(0, BASE_RETRY_DELAY * (2**self.request.retries))
-            logger.warning(
-                f"HTTP check failed for {url}: {exc}, retrying in {delay:.2f}s"
-            )
-            self.retry(countdown=delay)
-        logger.warning(f"Uptime check failed for {url}: {exc}")
-        is_up = False
-        status_code = None
-        response_time = None
-        error_message = str(exc)
+    target = normalize_probe_target(url, check_type)
+    result = run_uptime_check(self, target, [website_id], check_type)
+    # define uptime log response schema
+    return {"website_id": website_id, **result}
+
 
+@celery_app.task
+def replay_spooled_results():
+    """
+    Periodically load spooled results, for workers that saw the database (or
+    Redis) come back but have had nothing to save since
+    """
     try:
-        with SessionLocal() as db:
-            # Save the result to the database
-            uptime_log = UptimeLog(
-                website_id=website_id,
-                timestamp=datetime.now(timezone.utc),
-                is_up=is_up,
-                status_code=status_code,
-                response_time=response_time,
-                error_message=error_message if not is_up else None,
-            )
+        return {"replayed": replay_spool()}
+    except (OperationalError, RedisError) as e:
+        logger.warning(f"Results sink still unavailable, keeping spooled results: {e}")
+        return {"replayed": 0}
 
-            db.add(uptime_log)
-            db.commit()
-    except OperationalError as e:
-        delay = random.uniform(0, BASE_RETRY_DELAY * (2**self.request.retries))
-        logger.error(
-            f"Database error saving uptime log for {url}: {e}, retrying in {delay:.2f}s"
+
+@celery_app.task
+def replay_spools():
+    """
+    Have each uptime worker replay the spool of its host. A spool can only be
+    read where it was written, so the replays go to the shard queues; without
+    live shards the workers share the uptime queue
+    """
+    shards = live_shards()
+    for shard in shards:
+        replay_spooled_results.apply_async(
+            queue=shard_queue(shard), expires=SCHEDULE_TICK_SECONDS
         )
-        self.retry(countdown=delay)
-    # define uptime log response schema
-    return {"website_id": website_id, "is_up": is_up, "response_time": response_time}
+    if not shards:
+        replay_spooled_results.apply_async(expires=SCHEDULE_TICK_SECONDS)
@@ -0,0 +1,274 @@
+import os
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.dependencies.settings import get_settings
+from app.utils.generic import as_utc
+
+# File layout (little endian, every section aligned to 8 bytes):
+#   header    magic, version, row count, status dictionary size, base timestamp,
+#             and (version 2) the highest uptime log id archived in the file
+#   deltas    uint32[n]  milliseconds since the previous row (first row: 0)
+#   is_up     ceil(n / 8) bytes, bit-packed least significant bit first
+#   latency   float32[n] response time in milliseconds, NaN when missing
+#   statuses  int16[k]   distinct status codes, -1 standing for "no status"
+#   codes     uint8[n]   index of each row's status code in the dictionary
+_HEADERS = {1: struct.Struct("<4sHxxIIq"), 2: struct.Struct("<4sHxxIIqq")}
+_MAGIC = b"PCA1"
+_VERSION = 2
+_NO_STATUS = -1
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+@dataclass
+class ArchivedChecks:
+    """Columns of archived uptime checks, ordered by timestamp"""
+
+    timestamps_us: np.ndarray  # int64 microseconds since the epoch
+    is_up: np.ndarray  # bool
+    response_time: np.ndarray  # float32 milliseconds, NaN when missing
+    status_code: np.ndarray  # int16, -1 when missing
+
+    def __len__(self) -> int:
+        return len(self.timestamps_us)
+
+    def rows(self, website_id: UUID) -> List[dict]:
+        """Materialise the checks in the shape of UptimeLog rows"""
+        return [
+            {
+                "id": None,
+                "website_id": website_id,
+                "timestamp": datetime.fromtimestamp(ts / 1e6, tz=timezone.utc),
+                "is_up": bool(up),
+                "status_code": None if code == _NO_STATUS else int(code),
+                "response_time": None if np.isnan(rt) else float(rt),
+                "error_message": None,
+            }
+            for ts, up, rt, code in zip(
+                self.timestamps_us, self.is_up, self.response_time, self.status_code
+            )
+        ]
+
+
+def concat_checks(parts: Sequence[ArchivedChecks]) -> ArchivedChecks:
+    return ArchivedChecks(
+        timestamps_us=np.concatenate([p.timestamps_us for p in parts]),
+        is_up=np.concatenate([p.is_up for p in parts]),
+        response_time=np.concatenate([p.response_time for p in parts]),
+        status_code=np.concatenate([p.status_code for p in parts]),
+    )
+
+
+def write_archive(path: Path, checks: ArchivedChecks, last_id: int = 0) -> None:
+    """
+    Write checks to a columnar archive file, replacing it atomically, with the
+    highest uptime log id they include
+    """
+    order = np.argsort(checks.timestamps_us, kind="stable")
+    timestamps = checks.timestamps_us[order]
+    n = len(timestamps)
+    base_us = int(timestamps[0]) if n else 0
+    offsets_ms = (timestamps - base_us + 500) // 1000
+    deltas = np.diff(offsets_ms, prepend=0).astype("<u4")
+    statuses, codes = np.unique(checks.status_code[order], return_inverse=True)
+    if len(statuses) > 256:
+        raise ValueError("Too many distinct status codes for one archive")
+
+    sections = [
+        deltas.tobytes(),
+        np.packbits(checks.is_up[order].astype(np.uint8), bitorder="little").tobytes(),
+        checks.response_time[order].astype("<f4").tobytes(),
+        statuses.astype("<i2").tobytes(),
+        codes.astype(np.uint8).tobytes(),
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    header = _HEADERS[_VERSION]
+    with open(tmp_path, "wb") as f:
+        f.write(header.pack(_MAGIC, _VERSION, n, len(statuses), base_us, last_id))
+        position = header.size
+        for section in sections:
+            padding = _align(position) - position
+            f.write(b"\0" * padding + section)
+            position += padding + len(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ArchiveReader:
+    """
+    Memory-mapped reader for one archive file. Only the timestamp column is
+    scanned to locate a range; other columns are read for the selected rows only
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version = struct.unpack_from("<4sH", self._map)
+        if magic != _MAGIC or version not in _HEADERS:
+            raise ValueError(f"Not a supported archive file: {path}")
+        header = _HEADERS[version]
+        _, _, n, k, base_us, *last_id = header.unpack_from(self._map)
+        self.row_count = n
+        self.base_us = base_us
+        # version 1 files don't know which uptime logs they hold
+        self.last_id = last_id[0] if last_id else 0
+        offset = _align(header.size)
+        self._deltas = self._view("<u4", n, offset)
+        offset = _align(offset + 4 * n)
+        self._is_up_offset = offset
+        offset = _align(offset + (n + 7) // 8)
+        self._latency = self._view("<f4", n, offset)
+        offset = _align(offset + 4 * n)
+        self._statuses = self._view("<i2", k, offset)
+        offset = _align(offset + 2 * k)
+        self._codes = self._view(np.uint8, n, offset)
+        self._timestamps: Optional[np.ndarray] = None
+
+    def _view(self, dtype, count: int, offset: int) -> np.ndarray:
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+
+    @property
+    def timestamps_us(self) -> np.ndarray:
+        if self._timestamps is None:
+            offsets_ms = np.cumsum(self._deltas, dtype=np.int64)
+            self._timestamps = self.base_us + offsets_ms * 1000
+        return self._timestamps
+
+    def _is_up(self, start: int, stop: int) -> np.ndarray:
+        first_byte, last_byte = start // 8, (stop + 7) // 8
+        packed = self._view(
+            np.uint8, last_byte - first_byte, self._is_up_offset + first_byte
+        )
+        bits = np.unpackbits(packed, bitorder="little").astype(bool)
+        skip = start - first_byte * 8
+        return bits[skip : skip + stop - start]  # noqa: E203
+
+    def locate(self, start_us: Optional[int], end_us: Optional[int]) -> slice:
+        """Row slice with start_us < timestamp <= end_us"""
+        timestamps = self.timestamps_us
+        first = (
+            0 if start_us is None else np.searchsorted(timestamps, start_us, "right")
+        )
+        last = (
+            len(timestamps)
+            if end_us is None
+            else np.searchsorted(timestamps, end_us, "right")
+        )
+        return slice(int(first), int(max(first, last)))
+
+    def read(self, rows: slice) -> ArchivedChecks:
+        return ArchivedChecks(
+            timestamps_us=np.array(self.timestamps_us[rows]),
+            is_up=self._is_up(rows.start, rows.stop),
+            response_time=np.array(self._latency[rows]),
+            status_code=np.array(self._statuses)[self._codes[rows]]
+            if len(self._statuses)
+            else np.zeros(0, dtype=np.int16),
+        )
+
+    def page(
+        self, rows: slice, limit: int, is_up: Optional[bool] = None
+    ) -> ArchivedChecks:
+        """
+        The first limit checks of a slice, only up (or down) ones when is_up is
+        given. Only the is_up bits of the slice are scanned; the other columns
+        are read for the selected rows only
+        """
+        if is_up is None:
+            return self.read(slice(rows.start, min(rows.stop, rows.start + limit)))
+        up = self._is_up(rows.start, rows.stop)
+        index = rows.start + np.flatnonzero(up == is_up)[:limit]
+        return ArchivedChecks(
+            timestamps_us=self.timestamps_us[index],
+            is_up=np.full(len(index), is_up),
+            response_time=np.array(self._latency[index]),
+            status_code=np.array(self._statuses)[self._codes[index]]
+            if len(self._statuses)
+            else np.zeros(0, dtype=np.int16),
+        )
+
+    def aggregate(self, rows: slice) -> dict:
+        """Count, up count and latency sum over a slice without building rows"""
+        latency = self._latency[rows]
+        measured = latency[~np.isnan(latency)]
+        return {
+            "checks": rows.stop - rows.start,
+            "up_checks": int(self._is_up(rows.start, rows.stop).sum()),
+            "latency_sum": float(measured.sum(dtype=np.float64)),
+            "latency_count": len(measured),
+        }
+
+    def all(self) -> ArchivedChecks:
+        return self.read(slice(0, self.row_count))
+
+
+def archive_root() -> Path:
+    return Path(get_settings().archive_dir)
+
+
+def archive_path(website_id: UUID, year: int, month: int, root: Path) -> Path:
+    return root / str(website_id) / f"{year:04d}-{month:02d}.pca"
+
+
+def list_archives(website_id: UUID, root: Path) -> List[Path]:
+    """Archive files of a website, oldest month first"""
+    directory = root / str(website_id)
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob("*.pca"))
+
+
+def archived_through(path: Path) -> int:
+    """Highest uptime log id archived in a month's file, 0 when none is"""
+    return ArchiveReader(path).last_id if path.exists() else 0
+
+
+def append_to_archive(path: Path, checks: ArchivedChecks, last_id: int = 0) -> None:
+    """
+    Merge new checks, uptime logs up to last_id, into a month's archive file
+    (rewriting it)
+    """
+    if path.exists():
+        reader = ArchiveReader(path)
+        checks = concat_checks([reader.all(), checks])
+        last_id = max(last_id, reader.last_id)
+    write_archive(path, checks, last_id)
+
+
+def iter_archived_rows(
+    website_id: UUID,
+    root: Path,
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+) -> Iterator[Tuple[ArchiveReader, slice]]:
+    """
+    Yield a reader and the matching rows for each archived month of a website
+    overlapping (after, before], oldest first. Months entirely outside the
+    range are skipped without opening their files
+    """
+    after = as_utc(after).astimezone(timezone.utc) if after else None
+    before = as_utc(before).astimezone(timezone.utc) if before else None
+    after_us = int(after.timestamp() * 1e6) if after else None
+    before_us = int(before.timestamp() * 1e6) if before else None
+    after_month = after.strftime("%Y-%m") if after else None
+    before_month = before.strftime("%Y-%m") if before else None
+    for path in list_archives(website_id, root):
+        if after_month and path.stem < after_month:
+            continue
+        if before_month and path.stem > before_month:
+            break
+        reader = ArchiveReader(path)
+        rows = reader.locate(after_us, before_us)
+        if rows.stop > rows.start:
+            yield reader, rows
@@ -0,0 +1,150 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from redis.exceptions import RedisError
+
+from app.ingest import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "uptime-dispatch"  # Redis hash: what the last tick saw and did
+OUTSTANDING_KEY = "uptime-outstanding"  # Redis sorted set: probe id -> deadline
+THROUGHPUT_SMOOTHING = 0.5  # weight of the newest throughput measurement
+BACKLOG_TOLERANCE = 0.1  # backlog (as a share of a tick's capacity) ignored
+
+
+@dataclass
+class DispatchStats:
+    """State of the probe dispatch at a scheduler tick, kept for the next one"""
+
+    at: float  # time.time() of the tick
+    depth: int  # probe messages outstanding before dispatching
+    dispatched: int  # messages published by the tick
+    throughput: Optional[float] = None  # messages consumed per second, smoothed
+
+
+def track_probes(deadlines: Dict[str, float]) -> None:
+    """
+    Count probe tasks (by id) as outstanding until they run or, at their
+    deadline (time.time()), expire unrun
+    """
+    if not deadlines:
+        return
+    try:
+        get_redis().zadd(OUTSTANDING_KEY, deadlines)
+    except RedisError as exc:
+        logger.warning(f"Can't track dispatched probes: {exc}")
+
+
+def settle_probe(task_id: Optional[str]) -> None:
+    """A probe task ran: it's no longer outstanding"""
+    if task_id is None:
+        return
+    try:
+        get_redis().zrem(OUTSTANDING_KEY, task_id)
+    except RedisError as exc:
+        logger.warning(f"Can't settle probe {task_id}: {exc}")
+
+
+def outstanding_probes(now: Optional[float] = None) -> Optional[int]:
+    """
+    Probe tasks dispatched and not run yet: ready in the queues, prefetched
+    and held by workers until their countdown is over, or running. Those past
+    their deadline are dropped, workers discard them. None when Redis is down
+    """
+    now = now or time.time()
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.zremrangebyscore(OUTSTANDING_KEY, "-inf", now)
+        pipeline.zcard(OUTSTANDING_KEY)
+        _, count = pipeline.execute()
+    except RedisError as exc:
+        logger.warning(f"Can't count outstanding probes: {exc}")
+        return None
+    return count
+
+
+def load_stats() -> Optional[DispatchStats]:
+    try:
+        stats = get_redis().hgetall(STATS_KEY)
+    except RedisError as exc:
+        logger.warning(f"Can't read dispatch stats: {exc}")
+        return None
+    if not stats:
+        return None
+    throughput = stats.get(b"throughput")
+    return DispatchStats(
+        at=float(stats[b"at"]),
+        depth=int(stats[b"depth"]),
+        dispatched=int(stats[b"dispatched"]),
+        throughput=float(throughput) if throughput else None,
+    )
+
+
+def save_stats(stats: DispatchStats, lag: dict) -> None:
+    """Keep the tick's state for the next one, with the schedule lag metrics"""
+    fields = {
+        "at": stats.at,
+        "depth": stats.depth,
+        "dispatched": stats.dispatched,
+        "throughput": "" if stats.throughput is None else stats.throughput,
+        **{f"lag_{name}": value for name, value in lag.items()},
+    }
+    try:
+        get_redis().hset(STATS_KEY, mapping=fields)
+    except RedisError as exc:
+        logger.warning(f"Can't save dispatch stats: {exc}")
+
+
+def estimate_throughput(
+    previous: Optional[DispatchStats], depth: int, now: float
+) -> Optional[float]:
+    """
+    Messages the consumers drained per second since the previous tick, smoothed
+    over ticks. Only a queue that never ran dry shows what the consumers can
+    do; otherwise the previous estimate is kept
+    """
+    if previous is None or now <= previous.at:
+        return None
+    drained = previous.depth + previous.dispatched - depth
+    measured = max(drained, 0) / (now - previous.at)
+    if depth == 0:
+        # the consumers had less work than they could do: a lower bound only
+        if previous.throughput is None:
+            return None
+        return max(previous.throughput, measured)
+    if previous.throughput is None:
+        return measured
+    return (
+        THROUGHPUT_SMOOTHING * measured
+        + (1 - THROUGHPUT_SMOOTHING) * previous.throughput
+    )
+
+
+def dispatch_budget(
+    depth: int, throughput: Optional[float], interval: float, max_dispatch: int
+) -> int:
+    """
+    Messages a tick may publish: what the consumers get through in one interval
+    minus what is already waiting, and never more than max_dispatch. Without
+    a backlog (or a throughput estimate) only max_dispatch applies
+    """
+    if throughput is None:
+        return max_dispatch
+    capacity = throughput * interval
+    if depth <= capacity * BACKLOG_TOLERANCE:
+        return max_dispatch
+    return int(max(0, min(max_dispatch, capacity - depth)))
+
+
+def schedule_lag(due_at: Iterable[datetime], now: datetime) -> dict:
+    """
+    How late due checks are (seconds past their slot): count, median and max
+    """
+    lags = sorted(max((now - at).total_seconds(), 0.0) for at in due_at)
+    if not lags:
+        return {"count": 0, "p50": 0.0, "max": 0.0}
+    return {"count": len(lags), "p50": lags[len(lags) // 2], "max": lags[-1]}
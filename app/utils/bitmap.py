@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import List, Tuple
+
+import numpy as np
+
+SLOT_MINUTES = 5  # one bit per uptime check slot
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BYTES_PER_DAY = SLOTS_PER_DAY // 8
+
+# Number of set bits for every possible byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+
+
+def empty_day() -> bytes:
+    return bytes(BYTES_PER_DAY)
+
+
+def slot_for(timestamp: datetime) -> int:
+    """Index of the check slot a timestamp falls in, within its day"""
+    return (timestamp.hour * 60 + timestamp.minute) // SLOT_MINUTES
+
+
+def set_slot(
+    up_bits: bytes, known_bits: bytes, slot: int, is_up: bool
+) -> Tuple[bytes, bytes]:
+    """
+    Record a check result in a day's bitmaps.
+    Bits are numbered least significant first within each byte (the same order as
+    Postgres' set_bit on bytea). If a slot already holds a result, a failure wins
+    over a success so short outages are never hidden.
+    """
+    byte, mask = slot // 8, 1 << (slot % 8)
+    up, known = bytearray(up_bits), bytearray(known_bits)
+    already_known = known[byte] & mask
+    known[byte] |= mask
+    if is_up and not already_known:
+        up[byte] |= mask
+    elif not is_up:
+        up[byte] &= ~mask & 0xFF
+    return bytes(up), bytes(known)
+
+
+def popcounts(bitmaps: List[bytes]) -> np.ndarray:
+    """Count the set bits of many day bitmaps in one vectorised pass"""
+    if not bitmaps:
+        return np.zeros(0, dtype=np.int64)
+    matrix = np.frombuffer(b"".join(bitmaps), dtype=np.uint8)
+    matrix = matrix.reshape(len(bitmaps), BYTES_PER_DAY)
+    return _POPCOUNT[matrix].sum(axis=1, dtype=np.int64)
@@ -1,12 +1,166 @@
-from datetime import datetime
-from typing import Dict, Optional
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence
 from uuid import UUID
 
+import numpy as np
 from fastapi import HTTPException, status
-from sqlmodel import Session, or_, select
-
-from app.api.v1.models import SSLLog, UptimeLog, User, Website
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, func, or_, select
+
+from app.api.v1.models import (
+    CheckType,
+    ErrorClass,
+    Incident,
+    LatencyEstimate,
+    LatencySketch,
+    SSLLog,
+    UptimeDay,
+    UptimeLog,
+    User,
+    Website,
+)
 from app.api.v1.schemas import WebsiteCreate
+from app.utils import bitmap
+from app.utils.archive import archive_root, iter_archived_rows
+from app.utils.frequency import adaptive, next_interval
+from app.utils.generic import as_utc
+from app.utils.sketch import QuantileSketch, merge_sketches
+
+MAX_ERROR_MESSAGE_LENGTH = 500
+# certificates are checked daily, by HTTPS uptime probes or periodic_ssl_check
+SSL_CHECK_INTERVAL = timedelta(days=1)
+
+# weight of the newest response time in a website's latency estimate: about
+# the last ten checks count
+LATENCY_SMOOTHING = 0.2
+
+# Error messages are few and never change once stored, so their ids are cached
+# for the lifetime of the process. An id is only cached once the transaction
+# that read or inserted it has committed; until then it's kept in the
+# session's info, and forgotten if the session rolls back
+_error_class_ids: Dict[str, int] = {}
+_PENDING_ERROR_CLASS_IDS = "pending_error_class_ids"
+
+# Host names and addresses in error messages (resolver, socket and certificate
+# errors) are replaced, so the same failure on different websites shares one
+# error class
+_ADDRESS_PATTERNS = (
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (
+        re.compile(r"(?<![\w:])(?:[0-9a-f]{1,4}:){2,7}[0-9a-f]{1,4}(?![\w:])", re.I),
+        "<ip>",
+    ),
+    (
+        re.compile(
+            r"\b(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z][a-z0-9-]*[a-z0-9]\.?", re.I
+        ),
+        "<host>",
+    ),
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_error_classes(session: Session) -> None:
+    if session.in_nested_transaction():
+        return  # a savepoint was released, the transaction may still roll back
+    _error_class_ids.update(session.info.pop(_PENDING_ERROR_CLASS_IDS, {}))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_error_classes(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_ERROR_CLASS_IDS, None)
+
+
+def normalize_error_message(message: str) -> str:
+    """An error message with the host names and addresses it mentions replaced"""
+    for pattern, placeholder in _ADDRESS_PATTERNS:
+        message = pattern.sub(placeholder, message)
+    return message[:MAX_ERROR_MESSAGE_LENGTH]
+
+
+def get_error_class_id(db: Session, message: Optional[str]) -> Optional[int]:
+    """
+    Return the id of an error message in the error_class table, adding it if it
+    has not been seen before
+    """
+    if message is None:
+        return None
+    message = normalize_error_message(message)
+    if message in _error_class_ids:
+        return _error_class_ids[message]
+    pending = db.info.get(_PENDING_ERROR_CLASS_IDS, {})
+    if message in pending:
+        return pending[message]
+    query = select(ErrorClass.id).where(ErrorClass.message == message)
+    error_id = db.exec(query).first()
+    if error_id is None:
+        try:
+            # savepoint, so a concurrent insert of the same message doesn't
+            # roll back the caller's transaction
+            with db.begin_nested():
+                error_class = ErrorClass(message=message)
+                db.add(error_class)
+            error_id = error_class.id
+        except IntegrityError:
+            error_id = db.exec(query).one()
+    db.info.setdefault(_PENDING_ERROR_CLASS_IDS, {})[message] = error_id
+    return error_id
+
+
+def _probe_phases(uptime_log: UptimeLog) -> Optional[dict]:
+    """Phase timings of a check in milliseconds, None when none were recorded"""
+    phases = {
+        "dns": uptime_log.dns_us,
+        "connect": uptime_log.connect_us,
+        "tls": uptime_log.tls_us,
+        "ttfb": uptime_log.ttfb_us,
+    }
+    if all(value is None for value in phases.values()):
+        return None
+    return {
+        phase: None if value is None else value / 1000
+        for phase, value in phases.items()
+    }
+
+
+def _uptime_log_row(uptime_log: UptimeLog, error_message: Optional[str]) -> dict:
+    """Shape an uptime log for the API, with latency in milliseconds"""
+    response_time_us = uptime_log.response_time_us
+    return {
+        "id": uptime_log.id,
+        "website_id": uptime_log.website_id,
+        "timestamp": uptime_log.timestamp,
+        "is_up": uptime_log.is_up,
+        "status_code": uptime_log.status_code,
+        "response_time": None if response_time_us is None else response_time_us / 1000,
+        "phases": _probe_phases(uptime_log),
+        "bytes_downloaded": uptime_log.bytes_downloaded,
+        "tls_resumed": uptime_log.tls_resumed,
+        "error_message": error_message,
+        "check_type": uptime_log.check_type,
+    }
+
+
+def _ssl_log_row(ssl_log: SSLLog, error: Optional[str]) -> dict:
+    return {**ssl_log.model_dump(exclude={"error_id"}), "error": error}
+
+
+def _expand_ssl_log_row(
+    row: dict, interval: timedelta = SSL_CHECK_INTERVAL
+) -> List[dict]:
+    """
+    Rebuild one entry per scheduled check from a row covering several checks
+    """
+    first, last = row["timestamp"], row["last_seen"] or row["timestamp"]
+    entries = []
+    timestamp = first
+    while timestamp < last:
+        entries.append({**row, "timestamp": timestamp, "last_seen": timestamp})
+        timestamp += interval
+    entries.append({**row, "timestamp": last, "last_seen": last})
+    return entries
 
 
 def fetch_ssl_logs(
@@ -15,11 +169,19 @@ def fetch_ssl_logs(
     is_valid: bool | None = None,
     limit: int = 10,
     cursor: int | None = None,
+    expand: bool = False,
 ) -> dict:
     """
-    Retrieve SSL logs for a specific website with optional filters
+    Retrieve SSL logs for a specific website with optional filters.
+    Stored rows cover every check that saw the same certificate state; with
+    expand, each one is turned back into one entry per scheduled check (the
+    limit and cursor still apply to stored rows)
     """
-    query = select(SSLLog).where(SSLLog.website_id == website_id)
+    query = (
+        select(SSLLog, ErrorClass.message)
+        .outerjoin(ErrorClass, SSLLog.error_id == ErrorClass.id)
+        .where(SSLLog.website_id == website_id)
+    )
     if is_valid is not None:
         query = query.where(SSLLog.is_valid == is_valid)
     if cursor:
@@ -42,7 +204,10 @@ def fetch_ssl_logs(
     if has_next:
         ssl_logs = ssl_logs[:-1]  # Trim to exclude the extra log
 
-    next_cursor = ssl_logs[-1].id if has_next else None
+    next_cursor = ssl_logs[-1][0].id if has_next else None
+    ssl_logs = [_ssl_log_row(ssl_log, error) for ssl_log, error in ssl_logs]
+    if expand:
+        ssl_logs = [entry for row in ssl_logs for entry in _expand_ssl_log_row(row)]
 
     return {
         "data": ssl_logs,
@@ -68,7 +233,7 @@ def get_website_by_id(db: Session, website_id: UUID, user_id: UUID):
     Retrieve a website by its ID
     """
     website = db.get(Website, website_id)
-    if website and website.user_id == user_id:
+    if website and website.user_id == user_id and website.deleted_at is None:
         return website
     return None
 
@@ -78,7 +243,9 @@ def get_website_by_url(db: Session, url: str):
     Retrieve a website by its ID
     """
     website_url = str(url)
-    statement = select(Website).where(Website.url == website_url)
+    statement = select(Website).where(
+        Website.url == website_url, Website.deleted_at.is_(None)
+    )
     website = db.exec(statement).first()
     return website
 
@@ -89,7 +256,9 @@ def get_all_websites(
     """
     Retrieve all websites from db with cursor-based pagination
     """
-    query = select(Website).where(Website.user_id == user_id)
+    query = select(Website).where(
+        Website.user_id == user_id, Website.deleted_at.is_(None)
+    )
     if cursor:
         query = query.where(Website.id > cursor)
     query = query.order_by(Website.id.asc()).limit(limit + 1)
@@ -112,6 +281,16 @@ def get_all_websites(
     }
 
 
+def get_user_website_ids(db: Session, user_id: UUID) -> List[UUID]:
+    """
+    Retrieve the ids of all websites owned by a user
+    """
+    query = select(Website.id).where(
+        Website.user_id == user_id, Website.deleted_at.is_(None)
+    )
+    return list(db.exec(query).all())
+
+
 def fetch_uptime_logs(
     db: Session,
     website_id: UUID,
@@ -119,15 +298,38 @@ def fetch_uptime_logs(
     limit: int = 10,
     is_up: Optional[bool] = None,
 ) -> dict:
-    query = select(UptimeLog).where(UptimeLog.website_id == website_id)
-    if is_up is not None:
-        query = query.where(UptimeLog.is_up == is_up)
-    if after:
-        query = query.where(UptimeLog.timestamp > after)
-
-    # Fetch one extra to check if more exist
-    query = query.order_by(UptimeLog.timestamp.asc()).limit(limit + 1)
-    uptime_logs = db.exec(query).all()
+    """
+    Retrieve uptime logs in timestamp order. Checks older than the retention
+    window are read from the website's columnar archive, which always holds
+    checks older than any still in the table
+    """
+    uptime_logs = []
+    for reader, rows in iter_archived_rows(website_id, archive_root(), after=after):
+        # only the rows of the page are read from the file
+        checks = reader.page(rows, limit + 1 - len(uptime_logs), is_up)
+        uptime_logs.extend(checks.rows(website_id))
+        if len(uptime_logs) > limit:
+            break
+
+    if len(uptime_logs) <= limit:
+        query = (
+            select(UptimeLog, ErrorClass.message)
+            .outerjoin(ErrorClass, UptimeLog.error_id == ErrorClass.id)
+            .where(UptimeLog.website_id == website_id)
+        )
+        if is_up is not None:
+            query = query.where(UptimeLog.is_up == is_up)
+        if after:
+            query = query.where(UptimeLog.timestamp > after)
+
+        # Fetch one extra to check if more exist
+        query = query.order_by(UptimeLog.timestamp.asc()).limit(
+            limit + 1 - len(uptime_logs)
+        )
+        uptime_logs.extend(
+            _uptime_log_row(uptime_log, error_message)
+            for uptime_log, error_message in db.exec(query).all()
+        )
 
     # TODO: return empty list instead of raising exception
     if not uptime_logs:
@@ -140,7 +342,7 @@ def fetch_uptime_logs(
     has_next = len(uptime_logs) > limit
     uptime_logs = uptime_logs[:limit]  # Trim to requested limit
 
-    next_cursor = uptime_logs[-1].timestamp if has_next else None
+    next_cursor = uptime_logs[-1]["timestamp"] if has_next else None
     return {
         "data": uptime_logs,
         "next_cursor": next_cursor,
@@ -148,12 +350,489 @@ def fetch_uptime_logs(
     }
 
 
+def get_uptime_summary(
+    db: Session, website_id: UUID, start: datetime, end: datetime
+) -> dict:
+    """
+    Aggregate checks in (start, end] over the archive and the uptime log table
+    """
+    checks = up_checks = latency_count = 0
+    latency_sum = 0.0
+    for reader, rows in iter_archived_rows(
+        website_id, archive_root(), after=start, before=end
+    ):
+        aggregate = reader.aggregate(rows)
+        checks += aggregate["checks"]
+        up_checks += aggregate["up_checks"]
+        latency_sum += aggregate["latency_sum"]
+        latency_count += aggregate["latency_count"]
+
+    row = db.exec(
+        select(
+            func.count(UptimeLog.id),
+            func.count(UptimeLog.id).filter(UptimeLog.is_up.is_(True)),
+            func.sum(UptimeLog.response_time_us),
+            func.count(UptimeLog.response_time_us),
+        ).where(
+            UptimeLog.website_id == website_id,
+            UptimeLog.timestamp > start,
+            UptimeLog.timestamp <= end,
+        )
+    ).one()
+    checks += row[0]
+    up_checks += row[1]
+    latency_sum += (row[2] or 0) / 1000
+    latency_count += row[3]
+    return {
+        "start": start,
+        "end": end,
+        "checks": checks,
+        "up_checks": up_checks,
+        "availability": up_checks / checks if checks else None,
+        "avg_response_time": latency_sum / latency_count if latency_count else None,
+    }
+
+
+def record_uptime_log(
+    db: Session,
+    website_id: UUID,
+    is_up: bool,
+    status_code: Optional[int] = None,
+    response_time_us: Optional[int] = None,
+    error_message: Optional[str] = None,
+    timestamp: Optional[datetime] = None,
+    check_type: CheckType = CheckType.HTTP,
+    dns_us: Optional[int] = None,
+    connect_us: Optional[int] = None,
+    tls_us: Optional[int] = None,
+    ttfb_us: Optional[int] = None,
+    bytes_downloaded: Optional[int] = None,
+    tls_resumed: Optional[bool] = None,
+    commit: bool = True,
+) -> UptimeLog:
+    """
+    Save a probe result and keep the tables derived from it up to date. Bulk
+    loads pass commit=False and commit once at the end
+    """
+    timestamp = timestamp or datetime.now(timezone.utc)
+    error_message = error_message if not is_up else None
+    uptime_log = UptimeLog(
+        website_id=website_id,
+        timestamp=timestamp,
+        is_up=is_up,
+        status_code=status_code,
+        response_time_us=response_time_us,
+        dns_us=dns_us,
+        connect_us=connect_us,
+        tls_us=tls_us,
+        ttfb_us=ttfb_us,
+        bytes_downloaded=bytes_downloaded,
+        tls_resumed=tls_resumed,
+        error_id=get_error_class_id(db, error_message),
+        check_type=CheckType(check_type),
+    )
+    db.add(uptime_log)
+    if response_time_us is not None:
+        update_latency_sketch(db, website_id, timestamp, response_time_us / 1000)
+        if is_up and CheckType(check_type) == CheckType.HTTP:
+            update_latency_estimate(db, website_id, response_time_us / 1000, timestamp)
+    update_incident(db, website_id, is_up, timestamp, error_message)
+    update_uptime_bitmap(db, website_id, timestamp, is_up)
+    if adaptive():
+        update_check_interval(db, website_id, is_up, timestamp)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return uptime_log
+
+
+def record_ssl_result(
+    db: Session,
+    website_id: UUID,
+    is_valid: bool,
+    valid_until: Optional[datetime] = None,
+    issuer: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+    error_message: Optional[str] = None,
+    timestamp: Optional[datetime] = None,
+) -> SSLLog:
+    """
+    Save an SSL check result. When the certificate, its validity and the error
+    are the same as in the website's latest row, only that row's last_seen is
+    updated
+    """
+    timestamp = timestamp or datetime.now(timezone.utc)
+    error_id = get_error_class_id(db, error_message)
+    latest = db.exec(
+        select(SSLLog)
+        .where(SSLLog.website_id == website_id)
+        .order_by(SSLLog.id.desc())
+        .limit(1)
+        .with_for_update()
+    ).first()
+    if latest and (latest.fingerprint, latest.is_valid, latest.error_id) == (
+        fingerprint,
+        is_valid,
+        error_id,
+    ):
+        latest.last_seen = timestamp
+        ssl_log = latest
+    else:
+        ssl_log = SSLLog(
+            website_id=website_id,
+            timestamp=timestamp,
+            last_seen=timestamp,
+            valid_until=valid_until,
+            issuer=issuer,
+            is_valid=is_valid,
+            fingerprint=fingerprint,
+            error_id=error_id,
+        )
+    db.add(ssl_log)
+    db.commit()
+    db.refresh(ssl_log)
+    return ssl_log
+
+
+def ssl_check_due(website: Website, now: datetime) -> bool:
+    """Whether a website monitoring SSL had no certificate check for a day"""
+    return website.ssl_check_enabled and (
+        website.ssl_last_checked is None
+        or as_utc(website.ssl_last_checked) <= now - SSL_CHECK_INTERVAL
+    )
+
+
+def record_website_certificate(
+    db: Session,
+    website: Website,
+    certificate: dict,
+    timestamp: Optional[datetime] = None,
+) -> SSLLog:
+    """
+    Save a certificate check of a website (record_ssl_result's arguments, as
+    returned by the probes) and bring the website's SSL fields up to date
+    """
+    timestamp = timestamp or datetime.now(timezone.utc)
+    website.ssl_last_checked = timestamp
+    if certificate["valid_until"] is not None:
+        website.ssl_expiry_date = certificate["valid_until"]
+    db.add(website)
+    return record_ssl_result(
+        db, website_id=website.id, timestamp=timestamp, **certificate
+    )
+
+
+def update_check_interval(
+    db: Session, website_id: UUID, is_up: bool, timestamp: datetime
+) -> Optional[Website]:
+    """Adapt a website's check interval to a check and schedule the next one"""
+    website = db.get(Website, website_id)
+    if website is None:
+        return None
+    website.check_interval = next_interval(website.check_interval, is_up)
+    website.next_check_at = timestamp + timedelta(seconds=website.check_interval)
+    db.add(website)
+    return website
+
+
+def _locked_row(db: Session, query, new_row: Callable[[], SQLModel]):
+    """
+    Lock the row selected by query, inserting new_row() first when it doesn't
+    exist. A missing row can't be locked, so two writers may both try to
+    insert it: the insert runs in a savepoint and the loser of the unique
+    constraint locks the winner's row instead of failing its transaction
+    """
+    row = db.exec(query.with_for_update()).first()
+    if row is not None:
+        return row
+    try:
+        with db.begin_nested():
+            row = new_row()
+            db.add(row)
+    except IntegrityError:
+        row = db.exec(query.with_for_update()).one()
+    return row
+
+
+def update_uptime_bitmap(
+    db: Session, website_id: UUID, timestamp: datetime, is_up: bool
+) -> UptimeDay:
+    """
+    Set the check slot of a result in the website's bitmap row for that day
+    """
+    timestamp = as_utc(timestamp).astimezone(timezone.utc)
+    row = _locked_row(
+        db,
+        select(UptimeDay).where(
+            UptimeDay.website_id == website_id, UptimeDay.day == timestamp.date()
+        ),
+        lambda: UptimeDay(
+            website_id=website_id,
+            day=timestamp.date(),
+            up_bits=bitmap.empty_day(),
+            known_bits=bitmap.empty_day(),
+        ),
+    )
+    row.up_bits, row.known_bits = bitmap.set_slot(
+        row.up_bits, row.known_bits, bitmap.slot_for(timestamp), is_up
+    )
+    db.add(row)
+    return row
+
+
+def update_incident(
+    db: Session,
+    website_id: UUID,
+    is_up: bool,
+    timestamp: datetime,
+    error_message: Optional[str] = None,
+) -> Optional[Incident]:
+    """
+    Maintain the incident table from up/down transitions: the first failed check
+    opens an incident and the first successful check after it closes it. A
+    website has one open incident at most (a partial unique index), so
+    concurrent failed checks count towards the same one
+    """
+    query = select(Incident).where(
+        Incident.website_id == website_id, Incident.ended_at.is_(None)
+    )
+    if not is_up:
+        opened = Incident(
+            website_id=website_id, started_at=timestamp, cause=error_message
+        )
+        incident = _locked_row(db, query, lambda: opened)
+        if incident is not opened:
+            incident.failure_count += 1
+            db.add(incident)
+        return incident
+    incident = db.exec(query.with_for_update()).first()
+    if incident:
+        incident.ended_at = timestamp
+        incident.duration_seconds = int(
+            (as_utc(timestamp) - as_utc(incident.started_at)).total_seconds()
+        )
+        db.add(incident)
+    return incident
+
+
+def _sketch_bucket_start(timestamp: datetime) -> datetime:
+    """Floor a timestamp to the start of its latency sketch bucket"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def update_latency_sketch(
+    db: Session, website_id: UUID, timestamp: datetime, response_time: float
+) -> LatencySketch:
+    """
+    Fold a response time (milliseconds) into the website's sketch for its bucket.
+    The row is locked so concurrent probe writers don't lose each other's samples
+    """
+    bucket_start = _sketch_bucket_start(timestamp)
+    row = _locked_row(
+        db,
+        select(LatencySketch).where(
+            LatencySketch.website_id == website_id,
+            LatencySketch.bucket_start == bucket_start,
+        ),
+        lambda: LatencySketch(
+            website_id=website_id,
+            bucket_start=bucket_start,
+            sketch=QuantileSketch().to_bytes(),
+        ),
+    )
+    sketch = QuantileSketch.from_bytes(row.sketch)
+    sketch.add(response_time)
+    row.sketch = sketch.to_bytes()
+    row.sample_count = sketch.count
+    db.add(row)
+    return row
+
+
+def update_latency_estimate(
+    db: Session, website_id: UUID, response_time: float, timestamp: datetime
+) -> LatencyEstimate:
+    """
+    Fold the response time (milliseconds) of an up HTTP check into the
+    website's exponentially weighted mean and variance
+    """
+    query = select(LatencyEstimate).where(LatencyEstimate.website_id == website_id)
+    row = _locked_row(
+        db, query, lambda: LatencyEstimate(website_id=website_id, mean_ms=response_time)
+    )
+    if row.sample_count:
+        deviation = response_time - row.mean_ms
+        row.mean_ms += LATENCY_SMOOTHING * deviation
+        row.variance_ms2 = (1 - LATENCY_SMOOTHING) * (
+            row.variance_ms2 + LATENCY_SMOOTHING * deviation**2
+        )
+    row.sample_count += 1
+    row.updated_at = timestamp
+    db.add(row)
+    return row
+
+
+def get_latency_estimates(
+    db: Session, website_ids: Sequence[UUID]
+) -> Dict[UUID, LatencyEstimate]:
+    """Latency estimates of the websites that have one, by website id"""
+    if not website_ids:
+        return {}
+    rows = db.exec(
+        select(LatencyEstimate).where(LatencyEstimate.website_id.in_(website_ids))
+    ).all()
+    return {row.website_id: row for row in rows}
+
+
+def get_latency_percentiles(
+    db: Session,
+    website_ids: List[UUID],
+    start: datetime,
+    end: datetime,
+    quantiles: Sequence[float] = (0.5, 0.95, 0.99),
+) -> dict:
+    """
+    Estimate response time percentiles over a window from the stored sketches,
+    without touching the raw uptime logs
+    """
+    query = select(LatencySketch.sketch).where(
+        LatencySketch.website_id.in_(website_ids),
+        LatencySketch.bucket_start >= _sketch_bucket_start(start),
+        LatencySketch.bucket_start < end,
+    )
+    rows = db.exec(query).all()
+    sketch = merge_sketches(QuantileSketch.from_bytes(row) for row in rows)
+    estimates = sketch.quantiles(quantiles)
+    return {
+        "start": start,
+        "end": end,
+        "sample_count": sketch.count,
+        "percentiles": {
+            f"p{q * 100:g}": value for q, value in zip(quantiles, estimates)
+        },
+    }
+
+
+def fetch_incidents(
+    db: Session,
+    website_id: UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 10,
+    cursor: Optional[int] = None,
+) -> dict:
+    """
+    Retrieve incidents of a website, optionally those overlapping a time window
+    """
+    query = select(Incident).where(Incident.website_id == website_id)
+    if start:
+        query = query.where(Incident.ended_at.is_(None) | (Incident.ended_at > start))
+    if end:
+        query = query.where(Incident.started_at < end)
+    if cursor:
+        query = query.where(Incident.id > cursor)
+    query = query.order_by(Incident.id.asc()).limit(limit + 1)
+    incidents = db.exec(query).all()
+
+    has_next = len(incidents) > limit
+    incidents = incidents[:limit]
+    next_cursor = incidents[-1].id if has_next else None
+    return {"data": incidents, "next_cursor": next_cursor, "has_next": has_next}
+
+
+def get_incident_stats(
+    db: Session, website_id: UUID, start: datetime, end: datetime
+) -> dict:
+    """
+    Compute downtime, MTTR and MTBF for a window from the incident table alone.
+    Incidents overlapping the window edges are clipped to it
+    """
+    start, end = as_utc(start), as_utc(end)
+    incidents = db.exec(
+        select(Incident).where(
+            Incident.website_id == website_id,
+            Incident.started_at < end,
+            Incident.ended_at.is_(None) | (Incident.ended_at > start),
+        )
+    ).all()
+    now = datetime.now(timezone.utc)
+    window_seconds = (end - start).total_seconds()
+    downtime = 0.0
+    repair_times = []
+    failures = 0
+    for incident in incidents:
+        started_at = as_utc(incident.started_at)
+        ended_at = as_utc(incident.ended_at) if incident.ended_at else min(now, end)
+        downtime += (min(ended_at, end) - max(started_at, start)).total_seconds()
+        if started_at >= start:
+            failures += 1
+            if incident.duration_seconds is not None:
+                repair_times.append(incident.duration_seconds)
+
+    uptime = window_seconds - downtime
+    return {
+        "start": start,
+        "end": end,
+        "incident_count": len(incidents),
+        "downtime_seconds": round(downtime),
+        "availability": uptime / window_seconds if window_seconds else None,
+        # mean time to recover over incidents that started and ended in the window
+        "mttr_seconds": sum(repair_times) / len(repair_times) if repair_times else None,
+        # mean operating time between failures that started in the window
+        "mtbf_seconds": uptime / failures if failures else None,
+    }
+
+
+def get_daily_availability(
+    db: Session, website_ids: List[UUID], start_day: date, end_day: date
+) -> dict:
+    """
+    Daily availability of several websites from their uptime bitmaps, fetched
+    in a single query. Days without any check result are reported as None
+    """
+    rows = db.exec(
+        select(
+            UptimeDay.website_id, UptimeDay.day, UptimeDay.up_bits, UptimeDay.known_bits
+        ).where(
+            UptimeDay.website_id.in_(website_ids),
+            UptimeDay.day >= start_day,
+            UptimeDay.day <= end_day,
+        )
+    ).all()
+    num_days = (end_day - start_day).days + 1
+    up = np.zeros((len(website_ids), num_days), dtype=np.int64)
+    known = np.zeros((len(website_ids), num_days), dtype=np.int64)
+    if rows:
+        site_index = {website_id: i for i, website_id in enumerate(website_ids)}
+        sites = np.array([site_index[row[0]] for row in rows])
+        days = np.array([(row[1] - start_day).days for row in rows])
+        up[sites, days] = bitmap.popcounts([row[2] for row in rows])
+        known[sites, days] = bitmap.popcounts([row[3] for row in rows])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily = np.where(known > 0, up / known, np.nan)
+    totals_known = known.sum(axis=1)
+    data = []
+    for i, website_id in enumerate(website_ids):
+        data.append(
+            {
+                "website_id": website_id,
+                "availability": (
+                    float(up[i].sum() / totals_known[i]) if totals_known[i] else None
+                ),
+                "checks": int(totals_known[i]),
+                "days": [None if np.isnan(v) else round(float(v), 6) for v in daily[i]],
+            }
+        )
+    return {"start_day": start_day, "end_day": end_day, "data": data}
+
+
 def update_website(
     db: Session, website_id: UUID, update_data: dict, user_id: UUID
 ) -> Optional[Website]:
     """Update website fields"""
-    website = db.get(Website, website_id)
-    if not website or website.user_id != user_id:
+    website = get_website_by_id(db, website_id, user_id)
+    if not website:
         return None
     for key, value in update_data.items():
         setattr(website, key, value)
@@ -164,11 +843,16 @@ def update_website(
 
 
 def delete_website(db: Session, website_id: UUID, user_id: UUID) -> bool:
-    """Delete a website"""
-    website = db.get(Website, website_id)
-    if not website or website.user_id != user_id:
+    """
+    Mark a website as deleted and stop monitoring it. Its rows are removed by
+    the purge_website background task rather than in the request
+    """
+    website = get_website_by_id(db, website_id, user_id)
+    if not website:
         return False
-    db.delete(website)
+    website.is_active = False
+    website.deleted_at = datetime.now(timezone.utc)
+    db.add(website)
     db.commit()
     return True
 
@@ -181,7 +865,9 @@ def search_websites(
     limit: int = 10,
 ) -> dict:
     """Search websites by url or name with cursor pagination"""
-    sql_query = select(Website).where(Website.user_id == user_id)
+    sql_query = select(Website).where(
+        Website.user_id == user_id, Website.deleted_at.is_(None)
+    )
 
     # Apply search filter
     if query:
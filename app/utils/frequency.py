@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from app.api.v1.models import Website
+from app.dependencies.settings import get_settings
+from app.utils.generic import as_utc
+
+UPTIME_CHECK_INTERVAL_MINUTES = 5  # Interval for uptime checks in minutes
+INTERVAL_BACKOFF = 2  # growth of a stable website's interval per up check
+
+# Adaptive scheduling (uptime_schedule = "adaptive"): each website keeps its
+# own interval (check_interval) and the time its next check is due
+# (next_check_at). A down check drops the interval to the floor, so incidents
+# and flapping websites are watched closely; every up check doubles it, back
+# up to UPTIME_CHECK_INTERVAL_MINUTES once the website is stable. Websites
+# never checked adaptively fall back to the fixed interval. The floor is the
+# same for every website (uptime_interval_floor): there are no plans yet to
+# give some websites a shorter one
+
+
+def adaptive() -> bool:
+    return get_settings().uptime_schedule == "adaptive"
+
+
+def interval_bounds() -> Tuple[int, int]:
+    """Shortest and longest check interval of a website, in seconds"""
+    ceiling = UPTIME_CHECK_INTERVAL_MINUTES * 60
+    return min(get_settings().uptime_interval_floor, ceiling), ceiling
+
+
+def next_interval(current: Optional[int], is_up: bool) -> int:
+    """A website's check interval (seconds) after a check"""
+    floor, ceiling = interval_bounds()
+    if not is_up:
+        return floor
+    if current is None:
+        return ceiling
+    return min(max(current, floor) * INTERVAL_BACKOFF, ceiling)
+
+
+def uptime_check_due(now: datetime):
+    """Condition on Website of active websites due for an uptime check"""
+    interval = timedelta(minutes=UPTIME_CHECK_INTERVAL_MINUTES)
+    due = Website.uptime_last_checked.is_(None) | (
+        Website.uptime_last_checked <= now - interval
+    )
+    if adaptive():
+        due = (Website.next_check_at.is_(None) & due) | (Website.next_check_at <= now)
+    return Website.is_active.is_(True) & due
+
+
+def uptime_check_order() -> tuple:
+    """Order of due websites, the most overdue first"""
+    order = (Website.uptime_last_checked.asc().nulls_first(),)
+    if adaptive():
+        order = (Website.next_check_at.asc().nulls_first(), *order)
+    return order
+
+
+def check_due_at(website: Website) -> datetime:
+    """When a website's uptime check was due"""
+    if adaptive() and website.next_check_at is not None:
+        return as_utc(website.next_check_at)
+    if website.uptime_last_checked is None:
+        return as_utc(website.created_at)
+    return as_utc(website.uptime_last_checked) + timedelta(
+        minutes=UPTIME_CHECK_INTERVAL_MINUTES
+    )
+
+
+def mark_dispatched(website: Website, now: datetime) -> None:
+    """
+    Record that a website's uptime check was dispatched: it's not due again
+    until its interval has passed, or its result sets the next check earlier
+    """
+    website.uptime_last_checked = now
+    if adaptive():
+        interval = website.check_interval or interval_bounds()[1]
+        website.next_check_at = now + timedelta(seconds=interval)
@@ -1,11 +1,13 @@
 import re
-from urllib.parse import urlparse
+from datetime import datetime, timezone
+from urllib.parse import urlparse, urlsplit, urlunsplit
 
 import validators
 
 from app.exceptions.ssl import InvalidURLException
 
 WHITELISTED_TLDS = {"local", "internal", "dev", "test"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
 
 
 def validate_url(url: str) -> str:
@@ -39,3 +41,36 @@ def validate_url(url: str) -> str:
         raise InvalidURLException("URL must use http or https scheme")
 
     return domain
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    """
+    Return a timezone-aware timestamp, treating naive values (e.g. read back
+    from SQLite or passed in a query string) as UTC.
+    """
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def normalize_probe_target(url: str, check_type: str = "http") -> str:
+    """
+    Reduce a website URL to the target actually probed, so websites that would
+    produce the same request share a single check.
+
+    HTTP targets keep the scheme, host, port, path and query, with the scheme and
+    host lowercased, default ports and fragments dropped and an empty path
+    written as "/". Ping and DNS targets are just the host name.
+    """
+    parsed = urlsplit(url.strip())
+    host = (parsed.hostname or "").rstrip(".")
+    if check_type in ("ping", "dns"):
+        return host
+    scheme = parsed.scheme.lower()
+    netloc = f"[{host}]" if ":" in host else host
+    if parsed.port is not None and parsed.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parsed.port}"
+    userinfo = parsed.netloc.rpartition("@")[0]
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parsed.path or "/", parsed.query, ""))
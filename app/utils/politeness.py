@@ -0,0 +1,179 @@
+import asyncio
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.dependencies.settings import get_settings
+from app.probe.dns import get_resolver
+
+PROBE_HOLD_SECONDS = 10.0  # a probe occupies its slot for up to its timeout
+
+
+@dataclass
+class ProbeJob:
+    """One probe to dispatch, with the keys it is rate limited and queued by"""
+
+    target: str
+    check_type: str
+    website_ids: List[str]
+    tenant: str  # user the probe is charged to
+    host: str
+    ip: Optional[str] = None
+    countdown: float = 0.0  # seconds to wait before starting, set by plan_dispatch
+    options: Dict[str, Any] = field(default_factory=dict)  # how to probe the target
+
+
+class SpacingLimiter:
+    """
+    Plans probe start times so that, for each key (a host name or an IP), starts
+    are at least min_spacing apart and no more than `concurrency` probes are
+    in flight (started within the last hold_seconds) at once
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        min_spacing: float,
+        hold_seconds: float = PROBE_HOLD_SECONDS,
+    ):
+        self.concurrency = concurrency
+        self.min_spacing = min_spacing
+        self.hold_seconds = hold_seconds
+        self._starts: Dict[str, Deque[float]] = defaultdict(deque)
+
+    def earliest(self, key: Optional[str], at: float = 0.0) -> float:
+        """Earliest start time at or after `at` allowed for a key"""
+        if key is None:
+            return at
+        starts = self._starts[key]
+        if starts:
+            at = max(at, starts[-1] + self.min_spacing)
+        if len(starts) >= self.concurrency:
+            at = max(at, starts[-self.concurrency] + self.hold_seconds)
+        return at
+
+    def reserve(self, key: Optional[str], at: float) -> None:
+        if key is None:
+            return
+        starts = self._starts[key]
+        starts.append(at)
+        # only the last `concurrency` starts are ever looked at
+        while len(starts) > self.concurrency:
+            starts.popleft()
+
+    def prune(self, now: float) -> None:
+        """Forget the keys whose starts no longer limit any start from now on"""
+        horizon = now - max(self.hold_seconds, self.min_spacing)
+        for key in [
+            key
+            for key, starts in self._starts.items()
+            if not starts or starts[-1] <= horizon
+        ]:
+            del self._starts[key]
+
+
+def build_limiters() -> Tuple[SpacingLimiter, SpacingLimiter]:
+    """Per-host and per-IP limiters configured from the settings"""
+    settings = get_settings()
+    return (
+        SpacingLimiter(
+            settings.probe_host_concurrency, settings.probe_host_min_spacing
+        ),
+        SpacingLimiter(settings.probe_ip_concurrency, settings.probe_ip_min_spacing),
+    )
+
+
+def fair_order(
+    jobs: Iterable[ProbeJob], weights: Optional[Dict[str, float]] = None
+) -> List[ProbeJob]:
+    """
+    Order jobs by weighted fair queuing across tenants. All jobs of a dispatch
+    window arrive together, so the k-th job of a tenant gets the virtual finish
+    time k / weight (weights default to the probe_tenant_weights setting, 1 for
+    unlisted tenants): tenants with few jobs are served first instead of
+    waiting behind a tenant with many, and any stretch of the order is shared
+    in proportion to the weights
+    """
+    if weights is None:
+        weights = get_settings().probe_tenant_weights
+    served: Dict[str, int] = defaultdict(int)
+    tagged = []
+    for index, job in enumerate(jobs):
+        served[job.tenant] += 1
+        tagged.append((served[job.tenant] / weights.get(job.tenant, 1.0), index, job))
+    tagged.sort(key=lambda item: item[:2])
+    return [job for _, _, job in tagged]
+
+
+def plan_dispatch(
+    jobs: Iterable[ProbeJob],
+    host_limiter: SpacingLimiter,
+    ip_limiter: SpacingLimiter,
+    window: Optional[float] = None,
+    now: float = 0.0,
+) -> List[ProbeJob]:
+    """
+    Give each job the countdown it must wait to respect the per-host and per-IP
+    limits, serving tenants fairly. Returns the jobs in dispatch order; with a
+    window, jobs that couldn't start within it are left out (and don't hold
+    their host's or IP's slots), for the caller to plan again later.
+    Limiters kept across plans need `now` on one clock (e.g. time.monotonic())
+    so the starts planned earlier still count
+    """
+    planned = []
+    for job in fair_order(jobs):
+        start = now
+        # moving past one limit can break the other: repeat until both agree
+        while True:
+            at = ip_limiter.earliest(job.ip, host_limiter.earliest(job.host, start))
+            if at == start:
+                break
+            start = at
+        if window is not None and start - now >= window:
+            continue
+        host_limiter.reserve(job.host, start)
+        ip_limiter.reserve(job.ip, start)
+        job.countdown = start - now
+        planned.append(job)
+    return planned
+
+
+def resolve_hosts(hosts: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Resolve host names to one IP each (None when resolution fails)"""
+    return asyncio.run(get_resolver().resolve_many(hosts))
+
+
+def summarize_delays(jobs: Iterable[ProbeJob]) -> Dict[str, Dict[str, dict]]:
+    """Queueing delay (count, mean and max countdown) per host and per tenant"""
+    delays: Dict[str, Dict[str, List[float]]] = {
+        "hosts": defaultdict(list),
+        "tenants": defaultdict(list),
+    }
+    for job in jobs:
+        delays["hosts"][job.host].append(job.countdown)
+        delays["tenants"][job.tenant].append(job.countdown)
+    return {
+        group: {
+            key: {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "max": max(values),
+            }
+            for key, values in by_key.items()
+        }
+        for group, by_key in delays.items()
+    }
+
+
+def format_delay_report(summary: Dict[str, Dict[str, dict]], limit: int = 5) -> str:
+    """One line naming the hosts and tenants that waited longest"""
+    parts = []
+    for group, by_key in summary.items():
+        worst = sorted(by_key.items(), key=lambda item: -item[1]["max"])[:limit]
+        listed = ", ".join(
+            f"{key} ({stats['count']} probes, mean {stats['mean']:.1f}s, "
+            f"max {stats['max']:.1f}s)"
+            for key, stats in worst
+        )
+        parts.append(f"{group}: {listed or 'none'}")
+    return "; ".join(parts)
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from redis.exceptions import RedisError
+
+from app.ingest import get_redis
+from app.probe.dns import get_resolver
+from app.probe.ring import HashRing
+
+logger = logging.getLogger(__name__)
+
+SHARDS_KEY = "uptime-shards"  # Redis sorted set: shard -> time of its last heartbeat
+HEARTBEAT_INTERVAL = 10  # seconds between heartbeats of a shard
+SHARD_TTL = 30  # seconds without a heartbeat before a shard leaves the ring
+CACHE_STATS_KEY = "uptime-cache-stats"  # Redis hash: "<shard>:hits" -> count
+CACHE_REPORT_INTERVAL = 60  # seconds between cache stats reports of a process
+
+_heartbeat: Optional["ShardHeartbeat"] = None
+_reported = {"at": 0.0, "hits": 0, "misses": 0}
+
+
+def live_shards(now: Optional[float] = None) -> List[str]:
+    """Shards that sent a heartbeat within SHARD_TTL, none when Redis is down"""
+    now = now or time.time()
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.zremrangebyscore(SHARDS_KEY, "-inf", now - SHARD_TTL)
+        pipeline.zrange(SHARDS_KEY, 0, -1)
+        _, shards = pipeline.execute()
+    except RedisError as exc:
+        logger.warning(f"Can't read the uptime shards: {exc}")
+        return []
+    return sorted(shard.decode() for shard in shards)
+
+
+def shard_ring(shards: List[str]) -> Optional[HashRing]:
+    """
+    Ring of the live shards, keyed by the host name of a probe target. A shard
+    joining or leaving only moves the hosts of its own share, so the other
+    shards' caches stay warm; None without
+    shards, when probes go to the shared uptime queue
+    """
+    return HashRing(shards) if shards else None
+
+
+class ShardHeartbeat(threading.Thread):
+    """Keeps a worker's shard in the ring while the worker runs"""
+
+    def __init__(self, shard: str):
+        super().__init__(name=f"shard-heartbeat-{shard}", daemon=True)
+        self.shard = shard
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            try:
+                get_redis().zadd(SHARDS_KEY, {self.shard: time.time()})
+            except RedisError as exc:
+                logger.warning(f"Shard {self.shard} heartbeat failed: {exc}")
+            if self.stopped.wait(HEARTBEAT_INTERVAL):
+                break
+        # leave right away rather than after SHARD_TTL
+        try:
+            get_redis().zrem(SHARDS_KEY, self.shard)
+        except RedisError as exc:
+            logger.warning(f"Shard {self.shard} couldn't leave the ring: {exc}")
+
+
+def start_heartbeat(shard: str) -> None:
+    global _heartbeat
+    stop_heartbeat()
+    _heartbeat = ShardHeartbeat(shard)
+    _heartbeat.start()
+    logger.info(f"Joined the uptime shards as {shard}")
+
+
+def stop_heartbeat() -> None:
+    global _heartbeat
+    if _heartbeat is not None:
+        _heartbeat.stopped.set()
+        _heartbeat.join()
+        _heartbeat = None
+
+
+def report_cache_stats(shard: Optional[str]) -> None:
+    """
+    Add this process' probe DNS cache hits and misses since its last report to
+    the shard's totals, at most every CACHE_REPORT_INTERVAL seconds. Tasks run
+    outside a worker have no shard and don't report
+    """
+    now = time.monotonic()
+    if shard is None or now - _reported["at"] < CACHE_REPORT_INTERVAL:
+        return
+    resolver = get_resolver()
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.hincrby(
+            CACHE_STATS_KEY, f"{shard}:hits", resolver.hits - _reported["hits"]
+        )
+        pipeline.hincrby(
+            CACHE_STATS_KEY, f"{shard}:misses", resolver.misses - _reported["misses"]
+        )
+        pipeline.execute()
+    except RedisError as exc:
+        logger.warning(f"Can't report probe cache stats: {exc}")
+        return
+    _reported.update(at=now, hits=resolver.hits, misses=resolver.misses)
+
+
+def cache_hit_rates() -> Dict[str, float]:
+    """Share of probe DNS lookups answered from the cache, per shard"""
+    try:
+        stats = get_redis().hgetall(CACHE_STATS_KEY)
+    except RedisError as exc:
+        logger.warning(f"Can't read probe cache stats: {exc}")
+        return {}
+    counts: Dict[str, Dict[str, int]] = {}
+    for field, value in stats.items():
+        shard, _, kind = field.decode().rpartition(":")
+        counts.setdefault(shard, {})[kind] = int(value)
+    return {
+        shard: count.get("hits", 0) / total
+        for shard, count in counts.items()
+        if (total := count.get("hits", 0) + count.get("misses", 0))
+    }
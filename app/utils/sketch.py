@@ -0,0 +1,140 @@
+import math
+import struct
+import zlib
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+# Relative accuracy guaranteed for every quantile estimate (1%)
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+# Latencies below this (in milliseconds) are counted in a dedicated zero bucket
+MIN_TRACKABLE_VALUE = 0.01
+
+_HEADER = struct.Struct("<BiI")  # version, offset, zero_count
+_VERSION = 1
+
+
+class QuantileSketch:
+    """
+    Mergeable latency sketch using logarithmically sized buckets (DDSketch style).
+
+    A value x is counted in bucket ceil(log_gamma(x)); every bucket covers values
+    within RELATIVE_ACCURACY of its representative value, so quantile estimates
+    are accurate to 1% regardless of the distribution. Because the bucket layout
+    is fixed, sketches from different time buckets or websites merge by adding
+    their count arrays.
+    """
+
+    def __init__(
+        self, offset: int = 0, counts: np.ndarray | None = None, zero_count: int = 0
+    ):
+        self.offset = offset
+        self.counts = (
+            np.zeros(0, dtype=np.uint32)
+            if counts is None
+            else np.asarray(counts, dtype=np.uint32)
+        )
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum(dtype=np.uint64)) + self.zero_count
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Record a latency value (milliseconds)"""
+        if value < MIN_TRACKABLE_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / _LOG_GAMMA)
+        if not len(self.counts):
+            self.offset = index
+            self.counts = np.zeros(1, dtype=np.uint32)
+        elif index < self.offset:
+            padding = np.zeros(self.offset - index, dtype=np.uint32)
+            self.counts = np.concatenate([padding, self.counts])
+            self.offset = index
+        elif index >= self.offset + len(self.counts):
+            padding = np.zeros(index - self.offset - len(self.counts) + 1, np.uint32)
+            self.counts = np.concatenate([self.counts, padding])
+        self.counts[index - self.offset] += count
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Return a new sketch holding the values of both sketches"""
+        return merge_sketches([self, other])
+
+    def quantiles(self, qs: Sequence[float]) -> List[float | None]:
+        """
+        Estimate several quantiles (0 <= q <= 1) in one pass over the buckets
+        """
+        total = self.count
+        if total == 0:
+            return [None for _ in qs]
+        ranks = np.asarray(qs, dtype=np.float64) * (total - 1)
+        cumulative = np.cumsum(self.counts, dtype=np.uint64) + self.zero_count
+        positions = np.searchsorted(cumulative, ranks, side="right")
+        indexes = self.offset + positions
+        values = 2 * np.power(GAMMA, indexes) / (GAMMA + 1)
+        return [
+            0.0 if rank < self.zero_count else float(value)
+            for rank, value in zip(ranks, values)
+        ]
+
+    def quantile(self, q: float) -> float | None:
+        return self.quantiles([q])[0]
+
+    def to_bytes(self) -> bytes:
+        """Serialise the sketch for storage in a bytea column"""
+        trimmed, offset = _trim(self.counts, self.offset)
+        header = _HEADER.pack(_VERSION, offset, self.zero_count)
+        return header + zlib.compress(trimmed.astype("<u4").tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "QuantileSketch":
+        version, offset, zero_count = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported sketch version: {version}")
+        header_size = _HEADER.size
+        payload = zlib.decompress(data[header_size:])
+        counts = np.frombuffer(payload, dtype="<u4").astype(np.uint32)
+        return cls(offset=offset, counts=counts, zero_count=zero_count)
+
+
+def _trim(counts: np.ndarray, offset: int) -> tuple[np.ndarray, int]:
+    """Drop empty buckets from both ends of a count array"""
+    nonzero = np.flatnonzero(counts)
+    if not len(nonzero):
+        return np.zeros(0, dtype=np.uint32), 0
+    first, last = int(nonzero[0]), int(nonzero[-1]) + 1
+    return counts[first:last], offset + first
+
+
+def merge_sketches(sketches: Iterable[QuantileSketch]) -> QuantileSketch:
+    """
+    Merge any number of sketches into one.
+    All count arrays are aligned on a shared bucket range and summed in a single
+    vectorised operation, so merging months of hourly buckets stays cheap.
+    """
+    sketches = [sketch for sketch in sketches if sketch.count]
+    if not sketches:
+        return QuantileSketch()
+    zero_count = sum(sketch.zero_count for sketch in sketches)
+    populated = [sketch for sketch in sketches if len(sketch.counts)]
+    if not populated:
+        return QuantileSketch(zero_count=zero_count)
+
+    offsets = np.array([sketch.offset for sketch in populated])
+    lengths = np.array([len(sketch.counts) for sketch in populated])
+    low = int(offsets.min())
+    width = int((offsets + lengths).max()) - low
+
+    # Scatter every sketch into one flat index space and sum with bincount
+    flat_counts = np.concatenate([sketch.counts for sketch in populated])
+    starts = np.repeat(offsets - low, lengths)
+    segment_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    within = np.arange(len(flat_counts)) - segment_starts
+    merged = np.bincount(starts + within, weights=flat_counts, minlength=width)
+    return QuantileSketch(
+        offset=low, counts=merged.astype(np.uint32), zero_count=zero_count
+    )
@@ -1,6 +1,14 @@
+import socket
+import threading
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 
+import dns.asyncresolver
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine
@@ -10,6 +18,8 @@ from app import app
 from app.api.v1.models import NotificationPreference, SSLLog, UptimeLog, User, Website
 from app.auth import get_password_hash
 from app.dependencies.db import get_db
+from app.utils import crud
+from app.utils.crud import get_error_class_id
 
 TEST_DATABASE_URL = "sqlite:///:memory:"
 engine = create_engine(
@@ -22,6 +32,7 @@ engine = create_engine(
 @pytest.fixture(scope="function")
 def test_db():
     SQLModel.metadata.create_all(engine)
+    crud._error_class_ids.clear()  # ids are only valid for this database
     session = Session(engine)
     try:
         yield session
@@ -136,7 +147,7 @@ def test_ssl_logs(test_db: Session, test_website: Website):
             website_id=test_website.id,
             valid_until=now + timedelta(days=-1),  # Expired
             is_valid=False,
-            error="Certificate expired",
+            error_id=get_error_class_id(test_db, "Certificate expired"),
             issuer="Issuer2",
         ),
         SSLLog(
@@ -162,30 +173,116 @@ def test_uptime_logs(test_db: Session, test_website: Website):
             website_id=test_website.id,
             timestamp=now - timedelta(minutes=30),
             is_up=True,
-            response_time=120,
+            response_time_us=120_000,
             status_code=200,
-            error_message=None,
         ),
         UptimeLog(
             id=2,
             website_id=test_website.id,
             timestamp=now - timedelta(minutes=20),
             is_up=False,
-            response_time=None,
+            response_time_us=None,
             status_code=None,
-            error_message="Connection timeout",
+            error_id=get_error_class_id(test_db, "Connection timeout"),
         ),
         UptimeLog(
             id=3,
             website_id=test_website.id,
             timestamp=now - timedelta(minutes=10),
             is_up=True,
-            response_time=98,
+            response_time_us=98_000,
             status_code=200,
-            error_message=None,
         ),
     ]
     test_db.add_all(logs)
     test_db.commit()
 
     return logs
+
+
+class StubDNSServer:
+    """
+    Minimal UDP DNS server for probe tests. Names in `records` resolve to their
+    IPv4 addresses, other names are NXDOMAIN; every answer carries the SOA
+    record used for negative caching
+    """
+
+    SOA = "ns.test. hostmaster.test. 1 3600 600 86400 30"  # negative TTL 30s
+
+    def __init__(self, records):
+        self.records = records  # name -> (ttl, [addresses])
+        self.queries = Counter()  # (name, record type) -> number of queries
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                wire, address = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            query = dns.message.from_wire(wire)
+            question = query.question[0]
+            name = question.name.to_text(omit_final_dot=True)
+            self.queries[(name, dns.rdatatype.to_text(question.rdtype))] += 1
+            response = dns.message.make_response(query)
+            if name not in self.records:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            elif question.rdtype == dns.rdatatype.A:
+                ttl, addresses = self.records[name]
+                response.answer.append(
+                    dns.rrset.from_text_list(question.name, ttl, "IN", "A", addresses)
+                )
+            if not response.answer:
+                response.authority.append(
+                    dns.rrset.from_text("test.", 60, "IN", "SOA", self.SOA)
+                )
+            self.sock.sendto(response.to_wire(), address)
+
+    def resolver(self):
+        resolver = dns.asyncresolver.Resolver(configure=False)
+        resolver.nameservers = ["127.0.0.1"]
+        resolver.port = self.port
+        return resolver
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def dispatch_stats(monkeypatch):
+    """
+    Stands in for the outstanding probes, dispatch stats and uptime shards
+    kept in Redis, as seen by the uptime scheduler
+    """
+    state = {"depth": 0, "stats": None, "saved": [], "shards": [], "tracked": {}}
+    monkeypatch.setattr(
+        "app.tasks.uptime_monitor.outstanding_probes", lambda: state["depth"]
+    )
+    monkeypatch.setattr(
+        "app.tasks.uptime_monitor.track_probes", state["tracked"].update
+    )
+    monkeypatch.setattr("app.tasks.uptime_monitor.live_shards", lambda: state["shards"])
+    monkeypatch.setattr("app.tasks.uptime_monitor.cache_hit_rates", lambda: {})
+    monkeypatch.setattr("app.tasks.uptime_monitor.load_stats", lambda: state["stats"])
+    monkeypatch.setattr(
+        "app.tasks.uptime_monitor.save_stats",
+        lambda stats, lag: state["saved"].append((stats, lag)),
+    )
+    return state
+
+
+@pytest.fixture
+def dns_stub():
+    server = StubDNSServer({"probe.test": (120, ["127.0.0.1"])})
+    try:
+        yield server
+    finally:
+        server.close()
@@ -0,0 +1,523 @@
+import asyncio
+import errno
+import fcntl
+import socket
+import ssl
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from app.exceptions.probe import DNSResolutionError
+from app.probe import icmp
+from app.probe.checks import confirmed_http_check
+from app.probe.content import AhoCorasick, compile_assertions
+from app.probe.dns import CachingResolver, check_record, check_records
+from app.probe.http import http_get
+from app.probe.icmp import checksum, echo_request, icmp_ping, tcp_ping
+from app.probe.results import decode_result, encode_result
+from app.probe.ring import HashRing, position
+from app.probe.spool import Spool, read_segment
+from app.probe.tls import (
+    ResumingContext,
+    SessionCache,
+    certificate_details,
+    check_certificate,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def http_server():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(("GET", self.path))
+            body = b"x" * 1_000_000 if self.path == "/big" else b"ok"
+            if self.path == "/shop":
+                body = b"<h1>Shop</h1><button>Add to cart</button>" + b" " * 1_000_000
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:  # the probe hung up early
+                pass
+
+        def do_HEAD(self):
+            requests.append(("HEAD", self.path))
+            self.send_response(405 if self.path == "/no-head" else 200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = requests
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_resolver_caches_answers_for_their_ttl(dns_stub):
+    clock = FakeClock()
+    resolver = CachingResolver(dns_stub.resolver(), clock=clock)
+
+    assert asyncio.run(resolver.resolve("probe.test")) == ["127.0.0.1"]
+    assert asyncio.run(resolver.resolve("PROBE.test.")) == ["127.0.0.1"]
+    assert dns_stub.queries[("probe.test", "A")] == 1
+    assert (resolver.hits, resolver.misses) == (1, 1)
+
+    clock.now += 121
+    asyncio.run(resolver.resolve("probe.test"))
+    assert dns_stub.queries[("probe.test", "A")] == 2
+    assert (resolver.hits, resolver.misses) == (1, 2)
+
+
+def test_resolver_caches_nxdomain(dns_stub):
+    clock = FakeClock()
+    resolver = CachingResolver(dns_stub.resolver(), clock=clock)
+
+    for _ in range(3):
+        with pytest.raises(DNSResolutionError, match="does not exist"):
+            asyncio.run(resolver.resolve("gone.test"))
+    assert dns_stub.queries[("gone.test", "A")] == 1
+
+    # negative answers are kept for the SOA minimum (30s)
+    clock.now += 31
+    with pytest.raises(DNSResolutionError):
+        asyncio.run(resolver.resolve("gone.test"))
+    assert dns_stub.queries[("gone.test", "A")] == 2
+
+
+def test_resolve_many(dns_stub):
+    resolver = CachingResolver(dns_stub.resolver())
+    assert asyncio.run(resolver.resolve_many(["probe.test", "gone.test"])) == {
+        "gone.test": None,
+        "probe.test": "127.0.0.1",
+    }
+
+
+def test_http_get_resolves_through_cache(dns_stub, http_server):
+    resolver = CachingResolver(dns_stub.resolver())
+    url = f"http://probe.test:{http_server.server_port}/"
+
+    response, phases = asyncio.run(http_get(url, resolver=resolver))
+    assert response.status_code == 200
+    assert phases["dns_us"] > 0
+    assert phases["connect_us"] >= 0
+    assert phases["tls_us"] is None
+    assert 0 < phases["ttfb_us"] < phases["total_us"]
+    asyncio.run(http_get(url, resolver=resolver))
+    assert dns_stub.queries[("probe.test", "A")] == 1
+
+    with pytest.raises(httpx.ConnectError, match="does not exist"):
+        asyncio.run(http_get("http://gone.test/", resolver=resolver))
+
+
+def test_http_get_skips_the_body(http_server):
+    base = f"http://127.0.0.1:{http_server.server_port}"
+
+    response, phases = asyncio.run(http_get(f"{base}/big"))
+    assert response.status_code == 200
+    assert phases["bytes_downloaded"] == 0
+    assert http_server.requests == [("HEAD", "/big")]
+
+    # servers rejecting HEAD get a GET closed once the headers are in
+    response, phases = asyncio.run(http_get(f"{base}/no-head"))
+    assert response.status_code == 200
+    assert http_server.requests[-2:] == [("HEAD", "/no-head"), ("GET", "/no-head")]
+
+    response, phases = asyncio.run(http_get(f"{base}/big", method="get"))
+    assert response.status_code == 200
+    assert phases["bytes_downloaded"] < 1_000_000
+    assert http_server.requests[-1] == ("GET", "/big")
+
+    chunks = []
+    response, phases = asyncio.run(
+        http_get(
+            f"{base}/big",
+            method="head",
+            max_body_bytes=1000,
+            scan=lambda chunk: chunks.append(chunk),
+        )
+    )
+    assert b"".join(chunks) == b"x" * 1000
+    assert 1000 <= phases["bytes_downloaded"] < 1_000_000
+
+
+def test_check_record(dns_stub):
+    resolver = dns_stub.resolver()
+
+    result = asyncio.run(check_record("probe.test", "A", "127.0.0.1", resolver))
+    assert result["is_up"] is True
+    assert result["response_time_us"] > 0
+
+    result = asyncio.run(check_record("probe.test", "A", "10.0.0.1", resolver))
+    assert result["is_up"] is False
+    assert result["error_message"] == "No A record matches the expected value"
+
+    result = asyncio.run(check_record("probe.test", "AAAA", None, resolver))
+    assert result["error_message"] == "No AAAA records for probe.test"
+
+
+def test_check_records_batch(dns_stub):
+    results = asyncio.run(
+        check_records(
+            [("probe.test", "A", None), ("gone.test", "A", None)] * 50,
+            resolver=dns_stub.resolver(),
+            concurrency=10,
+        )
+    )
+    assert [result["is_up"] for result in results[:2]] == [True, False]
+    assert results[1]["error_message"] == "Domain gone.test does not exist"
+    assert len(results) == 100
+
+
+def test_echo_request_checksum():
+    packet = echo_request(socket.AF_INET, 7)
+    assert packet[0] == 8  # echo request
+    assert checksum(packet) == 0  # a packet with a valid checksum sums to zero
+
+
+def test_icmp_ping_loopback():
+    try:
+        rtts = asyncio.run(icmp_ping(["127.0.0.1"], timeout=2.0))
+    except PermissionError:
+        pytest.skip("ICMP datagram sockets not allowed (net.ipv4.ping_group_range)")
+    assert rtts["127.0.0.1"] is not None
+
+
+def test_tcp_ping_loopback():
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        port = server.getsockname()[1]
+        assert asyncio.run(tcp_ping("127.0.0.1", timeout=2.0, port=port)) is not None
+    # nothing listens anymore: the refused connection still proves the host is up
+    assert asyncio.run(tcp_ping("127.0.0.1", timeout=2.0, port=port)) is not None
+
+
+def test_ping_targets_falls_back_to_tcp(dns_stub, monkeypatch):
+    async def icmp_not_allowed(addresses, timeout):
+        raise PermissionError(errno.EACCES, "Permission denied")
+
+    monkeypatch.setattr(icmp, "icmp_ping", icmp_not_allowed)
+    monkeypatch.setattr(icmp, "_icmp_available", None)
+    resolver = CachingResolver(dns_stub.resolver())
+
+    results = asyncio.run(
+        icmp.ping_targets(["probe.test", "gone.test"], timeout=2.0, resolver=resolver)
+    )
+
+    assert results["probe.test"]["is_up"] is True
+    assert results["probe.test"]["response_time_us"] > 0
+    assert results["gone.test"]["is_up"] is False
+    assert results["gone.test"]["error_message"] == "Domain gone.test does not exist"
+    assert icmp._icmp_available is False
+
+
+def test_aho_corasick_matches_across_chunks():
+    automaton = AhoCorasick([b"he", b"she", b"his", b"hers"])
+
+    state, found = automaton.scan(b"ushe")
+    assert found == {0, 1}
+    state, found = automaton.scan(b"rs", state)
+    assert found == {3}
+    assert automaton.scan(b"hi")[1] == set()
+
+
+def test_content_scan():
+    assertions = [
+        {"type": "contains", "value": "Add to cart"},
+        {"type": "regex", "value": r"\$\d+\.\d\d"},
+        {"type": "not_contains", "value": "Out of stock"},
+    ]
+    assert compile_assertions(assertions) is compile_assertions(assertions)
+
+    scan = compile_assertions(assertions).start()
+    assert scan(b"<button>Add to") is False
+    assert scan(b" cart</button> $19.99") is False  # forbidden text still possible
+    assert scan.failure() is None
+
+    scan = compile_assertions(assertions).start()
+    assert scan(b"Out of stock") is True
+    assert scan.failure() == "Forbidden content found (assertion 3)"
+
+    scan = compile_assertions(assertions[:1]).start()
+    scan(b"Add to basket")
+    assert scan.failure() == "Required content not found (assertion 1)"
+
+
+def test_http_get_stops_once_assertions_are_decided(http_server):
+    url = f"http://127.0.0.1:{http_server.server_port}/shop"
+    scan = compile_assertions([{"type": "contains", "value": "Add to cart"}]).start()
+
+    response, phases = asyncio.run(http_get(url, max_body_bytes=2_000_000, scan=scan))
+    assert response.status_code == 200
+    assert scan.failure() is None
+    assert phases["bytes_downloaded"] < 1_000_000
+
+
+def test_result_codec_roundtrip():
+    website_ids = [str(uuid4()), str(uuid4())]
+    timestamp = datetime(2026, 10, 19, 12, 30, 15, 250000, tzinfo=timezone.utc)
+    result = {
+        "is_up": False,
+        "status_code": 503,
+        "response_time_us": 120_000,
+        "dns_us": 1_500,
+        "connect_us": None,
+        "tls_us": None,
+        "ttfb_us": 80_000,
+        "bytes_downloaded": 0,
+        "tls_resumed": True,
+        "error_message": "Unexpected status code 503",
+    }
+
+    record = encode_result(website_ids, result, "http", timestamp)
+    assert decode_result(record) == (website_ids, result, "http", timestamp)
+    ping = {**result, "is_up": True, "tls_resumed": None, "error_message": None}
+    record = encode_result(website_ids, ping, "ping", timestamp)
+    assert decode_result(record)[1] == ping
+    # a long message is cut on a character boundary
+    long = {**result, "error_message": "é" * 0x8000}
+    record = encode_result(website_ids, long, "http", timestamp)
+    assert decode_result(record)[1]["error_message"] == "é" * 0x7FFF
+
+
+def test_spool_append_and_replay(tmp_path):
+    spool = Spool(tmp_path, segment_size=64)
+    records = [bytes([n]) * 20 for n in range(1, 6)]
+    assert spool.append(records) == 5
+    # two 28 byte frames fit in a segment
+    assert len(spool.segments()) == 3
+
+    # the segment being written is locked: another process can't replay it
+    other = Spool(tmp_path)
+    loaded = []
+    assert other.replay(loaded.extend) == 4
+    assert loaded == records[:4]
+    assert len(spool.segments()) == 1
+
+    assert spool.replay(loaded.extend) == 1
+    assert loaded == records
+    assert not spool.pending()
+
+
+def test_spool_segment_is_not_replayed_while_created(tmp_path, monkeypatch):
+    spool = Spool(tmp_path)
+    other = Spool(tmp_path)
+    flock = fcntl.flock
+    replayed = []
+
+    def replay_then_lock(fd, operation):
+        # another process replays between the segment's creation and its lock
+        if operation == fcntl.LOCK_EX:
+            replayed.append(other.replay(lambda records: None))
+        flock(fd, operation)
+
+    monkeypatch.setattr("app.probe.spool.fcntl.flock", replay_then_lock)
+    spool.append([b"record"])
+    monkeypatch.undo()
+
+    assert replayed == [0]
+    loaded = []
+    assert spool.replay(loaded.extend) == 1
+    assert loaded == [b"record"]
+
+
+def test_spool_ignores_torn_records(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append([b"complete", b"torn"])
+    spool.seal()
+    (path,) = spool.segments()
+    with open(path, "r+b") as f:
+        f.seek(8 + len(b"complete") + 8)
+        f.write(b"TORN")  # a crash mid-write left a partial record
+
+    assert read_segment(path) == [b"complete"]
+
+
+def test_hash_ring_moves_only_the_new_members_share():
+    keys = [str(uuid4()) for _ in range(3000)]
+    ring = HashRing(["probe-a", "probe-b", "probe-c"])
+    owners = {key: ring.owner(key) for key in keys}
+    assert all(700 < n < 1300 for n in Counter(owners.values()).values())
+
+    grown = HashRing(["probe-a", "probe-b", "probe-c", "probe-d"])
+    moved = [key for key in keys if grown.owner(key) != owners[key]]
+    assert {grown.owner(key) for key in moved} == {"probe-d"}
+    assert 500 < len(moved) < 1000
+    assert HashRing([]).owner(keys[0]) is None
+
+    # a member's arcs hold exactly the keys it owns
+    for member in grown.members:
+        arcs = grown.arcs(member)
+        for key in keys:
+            inside = any(
+                (start is None or start <= position(key))
+                and (end is None or position(key) < end)
+                for start, end in arcs
+            )
+            assert inside == (grown.owner(key) == member)
+
+
+@pytest.fixture
+def https_server(tmp_path):
+    """HTTPS server on localhost with a self-signed certificate, and its path"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, "localhost")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False
+        )
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = tmp_path / "cert.pem"
+    key_path = tmp_path / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, cert_path
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_tls_sessions_are_resumed(https_server, monkeypatch):
+    server, cert_path = https_server
+    context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(cert_path)
+    context.sessions = SessionCache()
+    monkeypatch.setattr("app.probe.http.get_probe_context", lambda: context)
+    url = f"https://localhost:{server.server_address[1]}/"
+
+    _, first = asyncio.run(http_get(url, method="head"))
+    _, second = asyncio.run(http_get(url, method="head"))
+    assert first["tls_resumed"] is False
+    assert second["tls_resumed"] is True
+    assert len(context.sessions) == 1
+    # the certificate is available on resumed connections too
+    assert second["peer_certificate"] == first["peer_certificate"]
+    assert certificate_details(second["peer_certificate"])["issuer"] == "localhost"
+    # a probe bringing the certificate back makes a full handshake, and its
+    # session is resumed by the next probe
+    _, full = asyncio.run(http_get(url, method="head", resume=False))
+    _, after = asyncio.run(http_get(url, method="head"))
+    assert full["tls_resumed"] is False and after["tls_resumed"] is True
+
+    # certificate checks always run a full handshake
+    certificate = asyncio.run(
+        check_certificate("localhost", server.server_address[1], resolver=None)
+    )
+    assert certificate["error_message"] is not None  # not a trusted root
+
+
+def test_session_cache_expiry_and_eviction():
+    clock = FakeClock()
+    cache = SessionCache(size=2, ttl=60, clock=clock)
+    sessions = [MagicMock(ticket_lifetime_hint=lifetime) for lifetime in (30, 0, 0)]
+    for host, session in zip(("a", "b", "c"), sessions):
+        cache.put(host, session)
+    assert cache.get("a") is None  # evicted, least recently used
+    assert cache.get("b") is sessions[1]
+    clock.now += 45
+    assert cache.get("b") is sessions[1]  # no hint: kept for the ttl
+    clock.now += 30
+    assert cache.get("b") is None and cache.get("c") is None
+
+
+def test_confirmed_http_check_hedges_before_reporting_down(monkeypatch):
+    attempts = []
+
+    async def http_check(target, options, timeout, resolver):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            raise httpx.ConnectTimeout("timed out")
+        if len(attempts) == 2:  # the confirmation hangs: it gets hedged
+            await asyncio.sleep(timeout)
+            raise httpx.ReadTimeout("timed out")
+        return {"is_up": True, "status_code": 200, "error_message": None}
+
+    monkeypatch.setattr("app.probe.checks.http_check", http_check)
+    result = asyncio.run(confirmed_http_check("https://example.com/", {"timeout": 0.1}))
+    assert result["is_up"] is True
+    # the confirmation waits twice as long, and so does its hedge
+    assert attempts == [0.1, 0.2, 0.2]
+
+    async def refused(target, options, timeout, resolver):
+        attempts.append(timeout)
+        return {"is_up": False, "status_code": None, "error_message": "refused"}
+
+    monkeypatch.setattr("app.probe.checks.http_check", refused)
+    attempts.clear()
+    result = asyncio.run(confirmed_http_check("https://example.com/", {"timeout": 0.1}))
+    assert result["is_up"] is False
+    assert attempts == [0.1, 0.2]  # quick failures need no hedge
+
+    async def hangs(target, options, timeout, resolver):
+        attempts.append(timeout)
+        await asyncio.sleep(timeout)
+        raise httpx.ReadTimeout("timed out")
+
+    # a check without time left for its confirmation within the ceiling
+    # reports the first timeout
+    monkeypatch.setattr("app.probe.checks.http_check", hangs)
+    monkeypatch.setattr(
+        "app.probe.checks.get_settings",
+        lambda: MagicMock(probe_timeout_ceiling=0.3),
+    )
+    attempts.clear()
+    result = asyncio.run(confirmed_http_check("https://example.com/", {"timeout": 0.2}))
+    assert result["is_up"] is False and result["error_message"] == "Timed out"
+    assert attempts == [0.2]
@@ -1,12 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 from uuid import uuid4
 
 from fastapi import status
-from sqlmodel import Session
+from sqlmodel import Session, select
 
 from app.api.v1.models import SSLLog, Website
 from app.api.v1.schemas import SSLLogResponse, SSLStatusResponse
+from app.utils.crud import record_ssl_result
 
 
 # Test the /websites/{website_id}/ssl-checks endpoint
@@ -62,7 +63,6 @@ def test_get_ssl_logs(client, test_db: Session, logged_in_user):
         valid_until=datetime(2025, 1, 1, 0, 0, 0),
         issuer="Example Issuer",
         is_valid=True,
-        error=None,
     )
     test_db.add(ssl_log)
     test_db.commit()
@@ -144,3 +144,70 @@ def test_get_invalid_logs_only(client, test_ssl_logs, logged_in_user):
     assert data["data"][0]["id"] == 2
     assert data["next_cursor"] is None
     assert all(not log["is_valid"] for log in data["data"])
+
+
+def test_record_ssl_result_stores_changes_only(test_db: Session, test_website):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for day in range(5):
+        record_ssl_result(
+            test_db,
+            test_website.id,
+            is_valid=True,
+            issuer="Issuer1",
+            fingerprint="a" * 64,
+            timestamp=start + timedelta(days=day),
+        )
+    # a renewed certificate, then a failed check
+    record_ssl_result(
+        test_db,
+        test_website.id,
+        is_valid=True,
+        issuer="Issuer1",
+        fingerprint="b" * 64,
+        timestamp=start + timedelta(days=5),
+    )
+    for day in (6, 7):
+        record_ssl_result(
+            test_db,
+            test_website.id,
+            is_valid=False,
+            error_message="Connection refused",
+            timestamp=start + timedelta(days=day),
+        )
+
+    logs = test_db.exec(
+        select(SSLLog).where(SSLLog.website_id == test_website.id).order_by(SSLLog.id)
+    ).all()
+    assert [log.fingerprint for log in logs] == ["a" * 64, "b" * 64, None]
+    assert logs[0].timestamp.date() == start.date()
+    assert logs[0].last_seen.date() == (start + timedelta(days=4)).date()
+    assert logs[2].last_seen.date() == (start + timedelta(days=7)).date()
+
+
+def test_get_ssl_logs_expanded(client, test_db: Session, test_website, logged_in_user):
+    headers = logged_in_user["headers"]
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for day in range(3):
+        record_ssl_result(
+            test_db,
+            test_website.id,
+            is_valid=True,
+            fingerprint="a" * 64,
+            timestamp=start + timedelta(days=day),
+        )
+
+    response = client.get(f"/websites/{test_website.id}/ssl-logs", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["data"]) == 1
+
+    response = client.get(
+        f"/websites/{test_website.id}/ssl-logs?expand=true", headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()["data"]
+    assert len(data) == 3
+    assert [log["timestamp"][:10] for log in data] == [
+        "2026-01-01",
+        "2026-01-02",
+        "2026-01-03",
+    ]
@@ -1,15 +1,57 @@
-from datetime import datetime, timedelta
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from unittest.mock import MagicMock, patch
+from urllib.parse import urlsplit
 from uuid import uuid4
 
 import httpx
+import pytest
 from fastapi.testclient import TestClient
+from redis.exceptions import RedisError
+from sqlalchemy.exc import OperationalError
 from sqlmodel import Session, select
 
-from app.api.v1.models import SSLLog, UptimeLog, User, Website
+from app.api.v1.models import (
+    CheckType,
+    Incident,
+    SSLLog,
+    UptimeDay,
+    UptimeLog,
+    User,
+    Website,
+)
 from app.auth import get_password_hash
+from app.core.worker import add_shard_queue, celery_app, set_prefetch
+from app.ingest import DEAD_LETTER_STREAM, RESULTS_STREAM, Ingester
+from app.probe.daemon import ProbeDaemon
+from app.probe.dns import check_records
+from app.probe.ring import HashRing
+from app.probe.spool import Spool
+from app.tasks.retention import (
+    RETENTION_POLICIES,
+    RetentionPolicy,
+    apply_retention_policy,
+    archive_expired_uptime_logs,
+    purge_website_rows,
+    requeue_stale_purges,
+    stale_purges,
+)
 from app.tasks.ssl_checker import check_ssl_status_task
-from app.tasks.uptime_monitor import check_website_uptime
+from app.tasks.uptime_monitor import (
+    check_dns_targets,
+    check_target_uptime,
+    check_website_uptime,
+    replay_spool,
+    replay_spools,
+    save_results,
+    schedule_uptime_checks,
+)
+from app.utils.archive import ArchiveReader, list_archives
+from app.utils.backpressure import DispatchStats
+from app.utils.crud import record_uptime_log
+from app.utils.generic import normalize_probe_target
 
 
 def test_check_ssl_status_task_success(test_db: Session):
@@ -19,11 +61,13 @@ def test_check_ssl_status_task_success(test_db: Session):
     ) as mock_conn, patch(
         "app.tasks.ssl_checker.ssl.create_default_context"
     ) as mock_ctx, patch(
-        "app.tasks.ssl_checker.x509.load_der_x509_certificate"
+        "app.probe.tls.x509.load_der_x509_certificate"
     ) as mock_cert:
         # Mock the SSL certificate object
         mock_cert_obj = MagicMock()
-        mock_cert_obj.not_valid_after = datetime.now() + timedelta(days=90)
+        mock_cert_obj.not_valid_after_utc = datetime.now(timezone.utc) + timedelta(
+            days=90
+        )
         mock_cert_obj.issuer.get_attributes_for_oid.return_value = [
             MagicMock(value="TestIssuer")
         ]
@@ -111,3 +155,804 @@ def test_check_website_uptime(client: TestClient, test_db: Session):
     ).first()
     assert log is not None
     assert log.check_type == "http"
+
+
+def test_purge_website_rows(test_db: Session, test_website: Website):
+    now = datetime.now(timezone.utc)
+    for minutes_ago in range(5):
+        record_uptime_log(
+            test_db,
+            website_id=test_website.id,
+            is_up=minutes_ago % 2 == 0,
+            response_time_us=100_000,
+            timestamp=now - timedelta(minutes=minutes_ago),
+        )
+
+    deleted = purge_website_rows(
+        test_db, test_website.id, batch_size=2, sleep_seconds=0
+    )
+
+    assert deleted > 5
+    assert test_db.get(Website, test_website.id) is None
+    assert test_db.exec(select(UptimeLog)).all() == []
+    assert test_db.exec(select(Incident)).all() == []
+
+
+def test_apply_retention_policy(test_db: Session, test_website: Website):
+    now = datetime.now(timezone.utc)
+    for days_ago in (1, 13, 15, 30):
+        record_uptime_log(
+            test_db,
+            website_id=test_website.id,
+            is_up=True,
+            timestamp=now - timedelta(days=days_ago),
+        )
+
+    policy = RetentionPolicy(UptimeLog, "timestamp", timedelta(days=14))
+    deleted = apply_retention_policy(
+        test_db, policy, now, batch_size=1, sleep_seconds=0
+    )
+
+    assert deleted == 2
+    assert len(test_db.exec(select(UptimeLog)).all()) == 2
+    policy = RetentionPolicy(UptimeDay, "day", timedelta(days=14))
+    assert apply_retention_policy(test_db, policy, now, sleep_seconds=0) == 2
+
+
+def test_incident_retention_keeps_open_incidents(
+    test_db: Session, test_website: Website
+):
+    now = datetime.now(timezone.utc)
+    website_id = test_website.id
+    for days_ago, is_up in ((500, False), (499, True), (450, False)):
+        record_uptime_log(
+            test_db, website_id, is_up, timestamp=now - timedelta(days=days_ago)
+        )
+
+    (policy,) = [p for p in RETENTION_POLICIES if p.model is Incident]
+    assert apply_retention_policy(test_db, policy, now, sleep_seconds=0) == 1
+    (incident,) = test_db.exec(select(Incident)).all()
+    assert incident.ended_at is None
+
+
+def test_lost_purges_are_requeued(test_db: Session, test_website: Website):
+    now = datetime.now(timezone.utc)
+    recent = Website(
+        id=uuid4(),
+        name="Recent",
+        url="https://example.org",
+        user_id=test_website.user_id,
+        deleted_at=now - timedelta(minutes=1),
+    )
+    test_website.deleted_at = now - timedelta(hours=2)
+    test_db.add_all([test_website, recent])
+    test_db.commit()
+    website_id = test_website.id
+
+    # a purge queued a minute ago is still on its way
+    assert stale_purges(test_db, now) == [website_id]
+    with patch("app.tasks.retention.SessionLocal", return_value=test_db), patch(
+        "app.tasks.retention.purge_website.delay"
+    ) as mock_delay:
+        assert requeue_stale_purges.run() == {"requeued": 1}
+    mock_delay.assert_called_once_with(str(website_id))
+
+
+def test_archive_expired_uptime_logs(
+    client, test_db: Session, logged_in_user, test_website: Website, tmp_path
+):
+    now = datetime.now(timezone.utc)
+    for days_ago in (40, 39, 20, 1):
+        record_uptime_log(
+            test_db,
+            website_id=test_website.id,
+            is_up=days_ago != 39,
+            status_code=200 if days_ago != 39 else None,
+            response_time_us=100_000,
+            timestamp=now - timedelta(days=days_ago),
+        )
+
+    # a run crashing between archiving and deleting is repeated without
+    # archiving the same logs twice
+    with patch(
+        "app.tasks.retention.delete_in_batches",
+        side_effect=OperationalError("", {}, None),
+    ):
+        try:
+            archive_expired_uptime_logs(
+                test_db, now - timedelta(days=14), tmp_path, sleep_seconds=0
+            )
+        except OperationalError:
+            pass
+    archived = archive_expired_uptime_logs(
+        test_db, now - timedelta(days=14), tmp_path, sleep_seconds=0
+    )
+    assert archived == 3
+    assert len(test_db.exec(select(UptimeLog)).all()) == 1
+    paths = list_archives(test_website.id, tmp_path)
+    assert sum(ArchiveReader(path).row_count for path in paths) == 3
+
+    # Archived checks are still served by the uptime log endpoints
+    headers = logged_in_user["headers"]
+    with patch("app.utils.crud.archive_root", return_value=tmp_path):
+        response = client.get(
+            f"/websites/{test_website.id}/uptime-logs?limit=10", headers=headers
+        )
+        summary = client.get(
+            f"/websites/{test_website.id}/uptime-logs/summary",
+            params={"start": (now - timedelta(days=60)).isoformat()},
+            headers=headers,
+        )
+    logs = response.json()["data"]
+    assert [log["is_up"] for log in logs] == [True, False, True, True]
+    assert logs[0]["id"] is None and logs[-1]["id"] is not None
+    assert summary.json()["checks"] == 4
+    assert summary.json()["up_checks"] == 3
+
+    # pages of archived checks, filtered, follow the cursor
+    with patch("app.utils.crud.archive_root", return_value=tmp_path):
+        first = client.get(
+            f"/websites/{test_website.id}/uptime-logs?limit=1&is_up=true",
+            headers=headers,
+        ).json()
+        second = client.get(
+            f"/websites/{test_website.id}/uptime-logs",
+            params={"limit": 1, "is_up": True, "after": first["next_cursor"]},
+            headers=headers,
+        ).json()
+    assert first["data"][0]["timestamp"] == logs[0]["timestamp"]
+    assert second["data"][0]["timestamp"] == logs[2]["timestamp"]
+    assert first["has_next"] and second["has_next"]
+
+
+def test_schedule_uptime_checks_groups_shared_targets(
+    test_db: Session, test_website: Website, dispatch_stats
+):
+    duplicates = [
+        Website(id=uuid4(), name="Duplicate", url=url, user_id=test_website.user_id)
+        for url in ("https://EXAMPLE.com/", "https://example.com:443")
+    ]
+    other = Website(
+        id=uuid4(),
+        name="Other",
+        url="https://example.org",
+        user_id=test_website.user_id,
+    )
+    # same target probed differently: not grouped with the others
+    with_get = Website(
+        id=uuid4(),
+        name="GET",
+        url="https://example.com",
+        user_id=test_website.user_id,
+        probe_method="get",
+    )
+    test_db.add_all([*duplicates, other, with_get])
+    test_db.commit()
+    shared_ids = sorted(str(website.id) for website in [test_website, *duplicates])
+    with_get_id = str(with_get.id)
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+
+    calls = {
+        (call.args[0][0], call.args[0][3]["method"]): call.args[0]
+        for call in mock_apply.call_args_list
+    }
+    assert set(calls) == {
+        ("https://example.com/", "auto"),
+        ("https://example.com/", "get"),
+        ("https://example.org/", "auto"),
+    }
+    target, website_ids, check_type, options = calls[("https://example.com/", "auto")]
+    assert sorted(website_ids) == shared_ids
+    assert check_type == "http"
+    assert calls[("https://example.com/", "get")][1] == [with_get_id]
+
+
+def test_probe_timeouts_adapt_to_response_times(
+    test_db: Session, test_website: Website, dispatch_stats
+):
+    fast = Website(
+        id=uuid4(),
+        name="Fast",
+        url="https://fast.example.com",
+        user_id=test_website.user_id,
+    )
+    test_db.add(fast)
+    test_db.commit()
+    fast_id = fast.id
+    new_target = normalize_probe_target(test_website.url)
+    # a steady ~100ms: a few samples from the floor, however fast
+    for response_time_ms in (100, 110, 90, 100, 105, 95):
+        record_uptime_log(
+            test_db, fast_id, True, 200, response_time_us=response_time_ms * 1000
+        )
+    for website in test_db.exec(select(Website)).all():
+        website.uptime_last_checked = None
+        test_db.add(website)
+    test_db.commit()
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+
+    timeouts = {
+        call.args[0][0]: call.args[0][3]["timeout"]
+        for call in mock_apply.call_args_list
+    }
+    assert timeouts["https://fast.example.com/"] == 2.0
+    # no history yet: the ceiling
+    assert timeouts[new_target] == 10.0
+
+
+def test_check_target_uptime_fans_out(test_db: Session, test_website: Website):
+    other = Website(
+        id=uuid4(),
+        name="Other",
+        url="https://example.com",
+        user_id=test_website.user_id,
+    )
+    test_db.add(other)
+    test_db.commit()
+    website_ids = {test_website.id, other.id}
+    probe = {
+        "is_up": False,
+        "status_code": 503,
+        "response_time_us": 20_000,
+        "dns_us": 1_500,
+        "error_message": "Unexpected status code 503",
+    }
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.probe_target", return_value=probe
+    ) as mock_probe, patch("app.tasks.uptime_monitor.settle_probe") as mock_settle:
+        result = check_target_uptime.run(
+            "https://example.com/",
+            [str(website_id) for website_id in website_ids],
+            "http",
+        )
+
+    mock_probe.assert_called_once()
+    mock_settle.assert_called_once()  # no longer outstanding
+    assert result["is_up"] is False
+    logs = test_db.exec(select(UptimeLog)).all()
+    assert {log.website_id for log in logs} == website_ids
+    assert all(log.status_code == 503 and log.dns_us == 1_500 for log in logs)
+    assert len(test_db.exec(select(Incident)).all()) == 2
+
+
+def test_dns_checks_are_batched(
+    test_db: Session, test_website: Website, dns_stub, dispatch_stats
+):
+    dns_websites = [
+        Website(
+            id=uuid4(),
+            name="DNS",
+            url=url,
+            user_id=test_website.user_id,
+            check_type=CheckType.DNS,
+            dns_expected_value="127.0.0.1",
+        )
+        for url in ("https://probe.test", "https://gone.test")
+    ]
+    test_db.add_all(dns_websites)
+    test_db.commit()
+    dns_ids = {website.id for website in dns_websites}
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async"), patch(
+        "app.tasks.uptime_monitor.check_dns_targets.apply_async"
+    ) as mock_apply:
+        schedule_uptime_checks.run()
+
+    ((checks,),) = mock_apply.call_args.args
+    assert sorted(check[:3] for check in checks) == [
+        ["gone.test", "A", "127.0.0.1"],
+        ["probe.test", "A", "127.0.0.1"],
+    ]
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.check_records",
+        partial(check_records, resolver=dns_stub.resolver()),
+    ):
+        result = check_dns_targets.run(checks)
+
+    assert result == {"checks": 2, "down": 1}
+    logs = test_db.exec(
+        select(UptimeLog).where(UptimeLog.website_id.in_(dns_ids))
+    ).all()
+    assert len(logs) == 2
+    assert all(log.check_type == CheckType.DNS for log in logs)
+    assert sorted(log.is_up for log in logs) == [False, True]
+
+
+def test_pings_are_batched(test_db: Session, test_website: Website, dispatch_stats):
+    test_website.check_type = CheckType.PING
+    others = [
+        Website(
+            id=uuid4(),
+            name="Ping",
+            url=url,
+            user_id=test_website.user_id,
+            check_type=CheckType.PING,
+        )
+        for url in ("https://example.org", "http://example.com:8080")
+    ]
+    test_db.add_all([test_website, *others])
+    test_db.commit()
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch(
+        "app.tasks.uptime_monitor.check_target_uptime.apply_async"
+    ) as mock_http, patch(
+        "app.tasks.uptime_monitor.check_ping_targets.apply_async"
+    ) as mock_ping:
+        schedule_uptime_checks.run()
+
+    mock_http.assert_not_called()
+    # both example.com websites ping the same host, and every ping starts at once
+    ((targets,),) = [call.args[0] for call in mock_ping.call_args_list]
+    assert sorted(host for host, _ in targets) == ["example.com", "example.org"]
+    assert [len(ids) for host, ids in sorted(targets)] == [2, 1]
+
+
+def test_results_are_spooled_while_the_db_is_down(
+    test_db: Session, test_website: Website, tmp_path
+):
+    website_id = test_website.id
+    spool = Spool(tmp_path)
+    probe = {
+        "is_up": True,
+        "status_code": 200,
+        "response_time_us": 42_000,
+        "dns_us": 900,
+        "error_message": None,
+    }
+    down = OperationalError("SELECT 1", None, Exception("connection refused"))
+
+    with patch("app.tasks.uptime_monitor.get_spool", return_value=spool), patch(
+        "app.tasks.uptime_monitor.SessionLocal", side_effect=down
+    ):
+        save_results([([str(website_id)], probe)], "http")
+    measured_at = datetime.now(timezone.utc)
+    assert spool.pending()
+    assert not test_db.exec(select(UptimeLog)).all()
+
+    with patch("app.tasks.uptime_monitor.get_spool", return_value=spool), patch(
+        "app.tasks.uptime_monitor.SessionLocal", return_value=test_db
+    ):
+        assert replay_spool() == 1
+
+    assert not spool.pending()
+    (log,) = test_db.exec(select(UptimeLog)).all()
+    assert log.website_id == website_id
+    assert log.response_time_us == 42_000 and log.dns_us == 900
+    assert log.timestamp.replace(tzinfo=timezone.utc) <= measured_at
+
+
+def test_results_stream_ingest(test_db: Session, test_website: Website, tmp_path):
+    website_id = test_website.id
+    probe = {
+        "is_up": False,
+        "status_code": None,
+        "response_time_us": None,
+        "dns_us": 700,
+        "error_message": "Connection refused",
+    }
+    client = MagicMock()
+    pipeline = client.pipeline.return_value
+    settings = MagicMock(results_sink="stream")
+
+    with patch("app.tasks.uptime_monitor.get_settings", return_value=settings), patch(
+        "app.tasks.uptime_monitor.get_spool", return_value=Spool(tmp_path)
+    ), patch("app.ingest.get_redis", return_value=client):
+        save_results([([str(website_id), str(uuid4())], probe)], "http")
+
+    (call,) = pipeline.xadd.call_args_list
+    assert call.args[0] == RESULTS_STREAM
+    # as read back by the ingester; the second entry was trimmed meanwhile
+    entries = [(b"1-0", {b"r": call.args[1]["r"]}), (b"2-0", {})]
+
+    ingester = Ingester(client, lambda: test_db, consumer="test")
+    # the unknown website (purged since it was probed) is skipped
+    assert ingester.ingest(entries) == 1
+    client.xack.assert_called_once_with(RESULTS_STREAM, "ingest", b"1-0", b"2-0")
+    (log,) = test_db.exec(select(UptimeLog)).all()
+    assert log.website_id == website_id
+    assert log.dns_us == 700 and not log.is_up
+
+    # an entry that can't be decoded is dead-lettered, the rest of its batch
+    # is written and the batch acknowledged
+    client.reset_mock()
+    entries = [(b"3-0", {b"r": call.args[1]["r"]}), (b"4-0", {b"r": b"garbage"})]
+    assert ingester.ingest(entries) == 1
+    client.xack.assert_called_once_with(RESULTS_STREAM, "ingest", b"3-0", b"4-0")
+    (dead,) = client.xadd.call_args_list
+    assert dead.args[0] == DEAD_LETTER_STREAM
+    assert dead.args[1][b"r"] == b"garbage" and dead.args[1][b"id"] == b"4-0"
+    assert len(test_db.exec(select(UptimeLog)).all()) == 2
+
+
+def test_tasks_are_routed_to_their_workload_queue():
+    router = celery_app.amqp.router
+    queue = router.route({}, check_target_uptime.name)["queue"]
+    assert queue.name == "uptime"
+    # only the uptime queue is bound under the key the task is published with
+    assert (queue.exchange.name, queue.routing_key) == ("uptime", "uptime")
+    assert router.route({}, schedule_uptime_checks.name)["queue"].name == "scheduling"
+    assert router.route({}, check_ssl_status_task.name)["queue"].name == "ssl"
+
+    conf = MagicMock()
+    set_prefetch(conf=conf, options={"queues": "uptime"})
+    assert conf.worker_prefetch_multiplier == 4
+    set_prefetch(conf=conf, options={"queues": ["uptime", "ssl"]})
+    assert conf.worker_prefetch_multiplier == 1
+
+
+def test_spools_are_replayed_on_the_hosts_that_wrote_them(dispatch_stats):
+    dispatch_stats["shards"] = ["celery@uptime-1", "celery@uptime-2"]
+    with patch(
+        "app.tasks.uptime_monitor.replay_spooled_results.apply_async"
+    ) as mock_apply:
+        replay_spools.run()
+    queues = [call.kwargs["queue"].name for call in mock_apply.call_args_list]
+    assert queues == ["uptime.celery@uptime-1", "uptime.celery@uptime-2"]
+
+    # unsharded workers all consume the uptime queue
+    dispatch_stats["shards"] = []
+    with patch(
+        "app.tasks.uptime_monitor.replay_spooled_results.apply_async"
+    ) as mock_apply:
+        replay_spools.run()
+    (call,) = mock_apply.call_args_list
+    assert "queue" not in call.kwargs
+    assert celery_app.amqp.router.route({}, replay_spools.name)["queue"].name == (
+        "scheduling"
+    )
+
+
+def test_schedule_uptime_checks_defers_when_workers_are_behind(
+    test_db: Session, test_website: Website, dispatch_stats
+):
+    now = datetime.now(timezone.utc)
+    overdue = Website(
+        id=uuid4(),
+        name="Overdue",
+        url="https://example.org",
+        user_id=test_website.user_id,
+        uptime_last_checked=now - timedelta(minutes=20),
+    )
+    test_website.uptime_last_checked = now - timedelta(minutes=6)
+    test_db.add_all([test_website, overdue])
+    test_db.commit()
+    deferred_id = test_website.id
+    # 58 messages waiting and one drained per second: room for one more
+    # before the next tick
+    dispatch_stats["depth"] = 58
+    dispatch_stats["stats"] = DispatchStats(
+        at=time.time() - 60, depth=58, dispatched=60, throughput=1.0
+    )
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+
+    # only the most overdue target was dispatched, expiring after one interval
+    (call,) = mock_apply.call_args_list
+    assert call.args[0][0] == "https://example.org/"
+    assert call.kwargs["expires"] == call.kwargs["countdown"] + 300
+    deferred = test_db.get(Website, deferred_id)
+    assert deferred.uptime_last_checked.replace(tzinfo=timezone.utc) < now
+    ((stats, lag),) = dispatch_stats["saved"]
+    assert stats.depth == 58 and stats.dispatched == 1
+    # counted as outstanding until it runs or expires
+    assert dispatch_stats["tracked"] == {
+        call.kwargs["task_id"]: stats.at + call.kwargs["expires"]
+    }
+    assert lag["count"] == 2 and lag["max"] >= 15 * 60
+
+
+def test_schedule_uptime_checks_caps_countdowns_at_the_tick(
+    test_db: Session, test_website: Website, dispatch_stats
+):
+    test_db.add_all(
+        Website(
+            id=uuid4(),
+            name=f"Page {i}",
+            url=f"https://shop.example.com/page{i}",
+            user_id=test_website.user_id,
+        )
+        for i in range(15)
+    )
+    test_db.commit()
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+
+    # two probes of the host in flight at once, each holding its slot for 10s:
+    # twelve start within the minute, the others wait for the next tick
+    countdowns = [
+        call.kwargs["countdown"]
+        for call in mock_apply.call_args_list
+        if "shop" in call.args[0][0]
+    ]
+    assert len(countdowns) == 12 and max(countdowns) < 60
+    pending = test_db.exec(
+        select(Website).where(Website.uptime_last_checked.is_(None))
+    ).all()
+    assert len(pending) == 3
+
+
+def test_schedule_uptime_checks_reraises_errors_before_the_session(
+    dispatch_stats, monkeypatch
+):
+    def unreachable():
+        raise RedisError("Connection refused")
+
+    monkeypatch.setattr("app.tasks.uptime_monitor.live_shards", unreachable)
+    with pytest.raises(RedisError):
+        schedule_uptime_checks.run()
+
+
+def test_adaptive_schedule_checks_unstable_websites_more_often(
+    test_db: Session, test_website: Website, dispatch_stats, monkeypatch
+):
+    monkeypatch.setattr(
+        "app.utils.frequency.get_settings",
+        lambda: MagicMock(uptime_schedule="adaptive", uptime_interval_floor=60),
+    )
+    stable = Website(
+        id=uuid4(),
+        name="Stable",
+        url="https://stable.example.com",
+        user_id=test_website.user_id,
+    )
+    test_db.add(stable)
+    test_db.commit()
+    flapping_id, stable_id = test_website.id, stable.id
+    now = datetime.now(timezone.utc)
+    checked_at = now - timedelta(minutes=2)
+    record_uptime_log(test_db, flapping_id, False, 503, timestamp=checked_at)
+    record_uptime_log(test_db, stable_id, True, 200, timestamp=checked_at)
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+
+    # the down website is due a minute after its check, the stable one isn't
+    (call,) = mock_apply.call_args_list
+    assert call.args[0][1] == [str(flapping_id)]
+    flapping = test_db.exec(select(Website).where(Website.id == flapping_id)).one()
+    assert flapping.check_interval == 60
+    assert flapping.next_check_at.replace(tzinfo=timezone.utc) > now
+    stable = test_db.exec(select(Website).where(Website.id == stable_id)).one()
+    assert stable.check_interval == 300
+
+    # once it recovers, its interval relaxes back to the configured one
+    intervals = []
+    for _ in range(4):
+        record_uptime_log(test_db, flapping_id, True, 200)
+        test_db.refresh(flapping)
+        intervals.append(flapping.check_interval)
+    assert intervals == [120, 240, 300, 300]
+    record_uptime_log(test_db, flapping_id, False, None)
+    test_db.refresh(flapping)
+    assert flapping.check_interval == 60
+
+
+def test_probe_daemon_probes_its_share_of_due_websites(
+    test_db: Session, test_website: Website, tmp_path, monkeypatch
+):
+    websites = [test_website] + [
+        Website(
+            id=uuid4(),
+            name=f"Shop {i}",
+            url=f"https://shop{i}.example.com",
+            user_id=test_website.user_id,
+        )
+        for i in range(20)
+    ]
+    test_db.add_all(websites)
+    test_db.commit()
+    ids = [website.id for website in websites]
+    ring = HashRing(["probe-a", "probe-b"])
+    mine = {i for i in ids if ring.owner(str(i)) == "probe-a"}
+    assert 0 < len(mine) < len(ids)
+
+    async def confirmed_http_check(target, options):
+        assert options["timeout"] == 10.0  # no latency history yet
+        result = {
+            "is_up": True,
+            "status_code": 200,
+            "response_time_us": 1000,
+            "error_message": None,
+        }
+        if options.get("certificate"):
+            result["certificate"] = {
+                "is_valid": True,
+                "valid_until": datetime(2030, 1, 1),
+                "issuer": "Test CA",
+                "fingerprint": target,
+                "error_message": None,
+            }
+        return result
+
+    async def resolve_many(hosts):
+        return {}
+
+    resolver = MagicMock(resolve_many=resolve_many)
+    monkeypatch.setattr("app.probe.daemon.confirmed_http_check", confirmed_http_check)
+    monkeypatch.setattr("app.probe.daemon.get_resolver", lambda: resolver)
+    monkeypatch.setattr(
+        "app.probe.daemon.build_limiters", lambda: (MagicMock(), MagicMock())
+    )
+    monkeypatch.setattr("app.probe.daemon.plan_dispatch", lambda jobs, *_, **__: jobs)
+
+    daemon = ProbeDaemon(
+        lambda: test_db, name="probe-a", members=["probe-a", "probe-b"]
+    )
+    daemon.spool = Spool(tmp_path)
+
+    async def run():
+        started = await daemon.poll()
+        # claiming a certificate check doesn't count as having checked it
+        websites = test_db.exec(select(Website)).all()
+        assert all(website.ssl_last_checked is None for website in websites)
+        await daemon.drain()
+        return started
+
+    # the HTTPS uptime probes bring the certificates back
+    assert asyncio.run(run()) == len(mine)
+    logs = test_db.exec(select(UptimeLog)).all()
+    assert {log.website_id for log in logs} == mine
+    ssl_logs = test_db.exec(select(SSLLog)).all()
+    assert {log.website_id for log in ssl_logs} == mine
+    for website in test_db.exec(select(Website)).all():
+        assert (website.uptime_last_checked is not None) == (website.id in mine)
+        assert (website.ssl_expiry_date is not None) == (website.id in mine)
+        assert (website.ssl_last_checked is not None) == (website.id in mine)
+    # claimed websites aren't due again until the next interval
+    assert asyncio.run(daemon.poll()) == 0
+
+    # results the sink rejects for any reason are spooled, not lost
+    monkeypatch.setattr(daemon, "write_results", MagicMock(side_effect=ValueError))
+    daemon.save_results([b"record"])
+    assert daemon.spool.pending()
+
+
+def test_probes_are_routed_to_the_shard_owning_their_host(
+    test_db: Session, test_website: Website, dispatch_stats
+):
+    hosts = [f"shop{i}.example.com" for i in range(12)]
+    test_db.add_all(
+        Website(
+            id=uuid4(),
+            name=host,
+            url=f"https://{host}",
+            user_id=test_website.user_id,
+            check_type=CheckType.PING if i % 2 else CheckType.HTTP,
+        )
+        for i, host in enumerate(hosts)
+    )
+    test_db.commit()
+    dispatch_stats["shards"] = ["celery@uptime-1", "celery@uptime-2"]
+    ring = HashRing(dispatch_stats["shards"])
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch(
+        "app.tasks.uptime_monitor.check_target_uptime.apply_async"
+    ) as mock_http, patch(
+        "app.tasks.uptime_monitor.check_ping_targets.apply_async"
+    ) as mock_ping:
+        schedule_uptime_checks.run()
+
+    routed = {}
+    for call in mock_http.call_args_list:
+        routed[urlsplit(call.args[0][0]).hostname] = call.kwargs["queue"].name
+    for call in mock_ping.call_args_list:
+        for host, _ in call.args[0][0]:
+            routed[host] = call.kwargs["queue"].name
+    assert len(routed) == len(hosts) + 1
+    assert routed == {host: f"uptime.{ring.owner(host)}" for host in routed}
+    assert len(set(routed.values())) == 2
+
+    # without live shards, probes go to the shared uptime queue
+    dispatch_stats["shards"] = []
+    for website in test_db.exec(select(Website)).all():
+        website.uptime_last_checked = None
+    test_db.commit()
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch(
+        "app.tasks.uptime_monitor.check_target_uptime.apply_async"
+    ) as mock_http, patch(
+        "app.tasks.uptime_monitor.check_ping_targets.apply_async"
+    ):
+        schedule_uptime_checks.run()
+    assert all(call.kwargs["queue"] is None for call in mock_http.call_args_list)
+
+
+def test_uptime_workers_consume_their_shard_queue():
+    instance = MagicMock()
+    instance.app.amqp.queues.consume_from = {"uptime": None}
+    add_shard_queue(sender="celery@uptime-1", instance=instance)
+    (queue,) = instance.app.amqp.queues.select_add.call_args.args
+    assert queue.name == "uptime.celery@uptime-1"
+    assert queue.routing_key == queue.name
+
+    instance.app.amqp.queues.consume_from = {"ssl": None}
+    instance.app.amqp.queues.select_add.reset_mock()
+    add_shard_queue(sender="celery@ssl-1", instance=instance)
+    instance.app.amqp.queues.select_add.assert_not_called()
+
+
+def test_https_probes_check_due_certificates(
+    test_db: Session, test_website: Website, dispatch_stats
+):
+    no_ssl = Website(
+        id=uuid4(),
+        name="No SSL",
+        url="https://example.com",
+        user_id=test_website.user_id,
+        ssl_check_enabled=False,
+    )
+    test_db.add(no_ssl)
+    test_db.commit()
+    website_id, no_ssl_id = test_website.id, no_ssl.id
+
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+
+    ((target, website_ids, check_type, options),) = [
+        call.args[0] for call in mock_apply.call_args_list
+    ]
+    assert options["certificate"] is True
+    valid_until = datetime(2030, 1, 1)
+    probe = {
+        "is_up": True,
+        "status_code": 200,
+        "response_time_us": 20_000,
+        "dns_us": 1_500,
+        "error_message": None,
+        "certificate": {
+            "is_valid": True,
+            "valid_until": valid_until,
+            "issuer": "Test CA",
+            "fingerprint": "ab" * 32,
+            "error_message": None,
+        },
+    }
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.probe_target", return_value=probe
+    ):
+        check_target_uptime.run(target, website_ids, check_type, options)
+
+    (ssl_log,) = test_db.exec(select(SSLLog)).all()
+    assert ssl_log.website_id == website_id and ssl_log.issuer == "Test CA"
+    website = test_db.get(Website, website_id)
+    assert website.ssl_expiry_date == valid_until
+    assert website.ssl_last_checked is not None
+    assert test_db.get(Website, no_ssl_id).ssl_last_checked is None
+
+    # checked a moment ago: the next probes don't collect the certificate
+    for website in test_db.exec(select(Website)).all():
+        website.uptime_last_checked = None
+    test_db.commit()
+    with patch("app.tasks.uptime_monitor.SessionLocal", return_value=test_db), patch(
+        "app.tasks.uptime_monitor.resolve_hosts", return_value={}
+    ), patch("app.tasks.uptime_monitor.check_target_uptime.apply_async") as mock_apply:
+        schedule_uptime_checks.run()
+    ((_, _, _, options),) = [call.args[0] for call in mock_apply.call_args_list]
+    assert "certificate" not in options
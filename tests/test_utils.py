@@ -1,5 +1,16 @@
+from collections import Counter
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import numpy as np
+
 from app.exceptions.ssl import InvalidURLException
-from app.utils.generic import validate_url
+from app.utils import bitmap
+from app.utils.archive import ArchivedChecks, ArchiveReader, write_archive
+from app.utils.backpressure import DispatchStats, dispatch_budget, estimate_throughput
+from app.utils.generic import normalize_probe_target, validate_url
+from app.utils.politeness import ProbeJob, SpacingLimiter, fair_order, plan_dispatch
+from app.utils.sketch import QuantileSketch, merge_sketches
 
 
 def test_validate_url_success():
@@ -34,3 +45,180 @@ def test_validate_url_invalid_scheme():
     except Exception as e:
         assert isinstance(e, InvalidURLException)
         assert str(e) == "URL must use http or https scheme"
+
+
+def test_normalize_probe_target():
+    assert normalize_probe_target("HTTPS://Example.COM") == "https://example.com/"
+    assert (
+        normalize_probe_target("https://example.com:443/status?x=1#top")
+        == "https://example.com/status?x=1"
+    )
+    assert normalize_probe_target("http://example.com:8080") == (
+        "http://example.com:8080/"
+    )
+    assert normalize_probe_target("https://example.com./", "ping") == "example.com"
+
+
+def test_plan_dispatch_spaces_hosts_and_shares_tenants():
+    def job(tenant, host, ip):
+        return ProbeJob(f"https://{host}/", "http", [], tenant, host, ip)
+
+    # a large tenant on one shared IP, and a small tenant elsewhere
+    jobs = [job("big", f"site{i}.example.com", "10.0.0.1") for i in range(6)]
+    jobs += [job("big", "shop.example.com", "10.0.0.2") for _ in range(2)]
+    jobs.append(job("small", "example.org", "10.0.0.3"))
+    planned = plan_dispatch(
+        jobs,
+        SpacingLimiter(concurrency=1, min_spacing=1.0, hold_seconds=10.0),
+        SpacingLimiter(concurrency=2, min_spacing=0.5, hold_seconds=10.0),
+    )
+
+    # the small tenant is served right after the large tenant's first probe
+    assert planned[1].tenant == "small"
+    assert planned[1].countdown == 0.0
+    shared_ip = sorted(j.countdown for j in planned if j.ip == "10.0.0.1")
+    assert shared_ip[:3] == [0.0, 0.5, 10.0]
+    # one probe in flight per host: the second one waits for the first to finish
+    same_host = sorted(j.countdown for j in planned if j.host == "shop.example.com")
+    assert same_host == [0.0, 10.0]
+
+    # probes that can't start within the window are left for the next one
+    busy = [job("big", "shop.example.com", "10.0.0.2") for _ in range(4)]
+    planned = plan_dispatch(
+        busy,
+        SpacingLimiter(concurrency=1, min_spacing=1.0, hold_seconds=10.0),
+        SpacingLimiter(concurrency=2, min_spacing=0.5, hold_seconds=10.0),
+        window=25.0,
+    )
+    assert [j.countdown for j in planned] == [0.0, 10.0, 20.0]
+
+
+def test_fair_order_shares_by_tenant_weight():
+    jobs = [
+        ProbeJob(f"https://{tenant}{i}.example.com/", "http", [], tenant, "")
+        for tenant in ("gold", "basic", "free")
+        for i in range(30)
+    ]
+    ordered = fair_order(jobs, weights={"gold": 3.0, "free": 0.5})
+
+    # every stretch of the order is shared 3 : 1 : 0.5
+    shares = Counter(job.tenant for job in ordered[:27])
+    assert shares == {"gold": 18, "basic": 6, "free": 3}
+    # without weights, tenants take turns
+    ordered = fair_order(jobs, weights={})
+    assert [job.tenant for job in ordered[:3]] == ["gold", "basic", "free"]
+
+
+def test_limiters_kept_across_plans():
+    def job(host):
+        return ProbeJob(f"https://{host}/", "http", [], "tenant", host, "10.0.0.1")
+
+    host_limiter = SpacingLimiter(concurrency=1, min_spacing=1.0, hold_seconds=10.0)
+    ip_limiter = SpacingLimiter(concurrency=2, min_spacing=0.5, hold_seconds=10.0)
+    plan_dispatch([job("shop.example.com")], host_limiter, ip_limiter, now=100.0)
+
+    # planned 4s later, the host's probe is still in flight
+    (planned,) = plan_dispatch(
+        [job("shop.example.com")], host_limiter, ip_limiter, now=104.0
+    )
+    assert planned.countdown == 6.0
+
+    # hosts and IPs idle for longer than a probe holds its slot are forgotten
+    host_limiter.prune(now=120.0)
+    ip_limiter.prune(now=120.0)
+    assert not host_limiter._starts and not ip_limiter._starts
+
+
+def test_quantile_sketch_accuracy():
+    values = np.random.default_rng(42).lognormal(mean=5, sigma=1, size=10_000)
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.count == len(values)
+    for q, estimate in zip([0.5, 0.95, 0.99], sketch.quantiles([0.5, 0.95, 0.99])):
+        exact = np.quantile(values, q, method="lower")
+        assert abs(estimate - exact) / exact <= 0.011
+
+
+def test_quantile_sketch_roundtrip_and_merge():
+    first, second = QuantileSketch(), QuantileSketch()
+    for value in range(1, 501):
+        first.add(value)
+    for value in range(501, 1001):
+        second.add(value)
+
+    restored = QuantileSketch.from_bytes(first.to_bytes())
+    assert restored.count == 500
+    assert restored.quantile(0.5) == first.quantile(0.5)
+
+    merged = merge_sketches([restored, second, QuantileSketch()])
+    assert merged.count == 1000
+    assert abs(merged.quantile(0.5) - 500) / 500 <= 0.011
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_uptime_bitmap_slots_and_popcounts():
+    up, known = bitmap.empty_day(), bitmap.empty_day()
+    up, known = bitmap.set_slot(up, known, 0, True)
+    up, known = bitmap.set_slot(up, known, 9, True)
+    up, known = bitmap.set_slot(up, known, 9, False)  # a failure wins in a slot
+    up, known = bitmap.set_slot(up, known, 9, True)
+    up, known = bitmap.set_slot(up, known, bitmap.SLOTS_PER_DAY - 1, True)
+
+    assert len(up) == bitmap.BYTES_PER_DAY
+    assert up[0] == 0b00000001 and known[1] == 0b00000010
+    assert list(bitmap.popcounts([up, known])) == [2, 3]
+    assert bitmap.slot_for(datetime(2025, 1, 1, 23, 59)) == bitmap.SLOTS_PER_DAY - 1
+
+
+def test_archive_roundtrip_range_and_aggregate(tmp_path):
+    base = int(datetime(2025, 3, 1, tzinfo=timezone.utc).timestamp() * 1e6)
+    n = 1000
+    checks = ArchivedChecks(
+        timestamps_us=base + np.arange(n, dtype=np.int64) * 300_000_000,
+        is_up=np.arange(n) % 10 != 0,
+        response_time=np.where(
+            np.arange(n) % 10 != 0, np.arange(n, dtype=np.float32), np.nan
+        ).astype(np.float32),
+        status_code=np.where(np.arange(n) % 10 != 0, 200, -1).astype(np.int16),
+    )
+    path = tmp_path / "archive.pca"
+    write_archive(path, checks)
+
+    reader = ArchiveReader(path)
+    assert reader.row_count == n
+    assert np.array_equal(reader.timestamps_us, checks.timestamps_us)
+
+    rows = reader.locate(int(checks.timestamps_us[9]), int(checks.timestamps_us[30]))
+    assert (rows.start, rows.stop) == (10, 31)
+    window = reader.read(rows)
+    assert list(window.is_up[:2]) == [False, True]
+    assert list(window.status_code[:2]) == [-1, 200]
+    assert reader.aggregate(rows) == {
+        "checks": 21,
+        "up_checks": 18,
+        "latency_sum": float(sum(i for i in range(10, 31) if i % 10)),
+        "latency_count": 18,
+    }
+    assert ArchiveReader(path).all().rows(uuid4())[1]["response_time"] == 1.0
+
+
+def test_dispatch_budget_follows_consumer_throughput():
+    previous = DispatchStats(at=1000.0, depth=0, dispatched=600)
+    # an emptied queue only shows the consumers were fast enough
+    assert estimate_throughput(previous, 0, 1300.0) is None
+    assert dispatch_budget(0, None, 300, 5000) == 5000
+
+    # 600 published, 300 still waiting five minutes later: 1 message/s
+    throughput = estimate_throughput(previous, 300, 1300.0)
+    assert throughput == 1.0
+    assert dispatch_budget(300, throughput, 300, 5000) == 0
+    assert dispatch_budget(100, throughput, 300, 5000) == 200
+    # a backlog within the tolerance doesn't throttle
+    assert dispatch_budget(20, throughput, 300, 5000) == 5000
+
+    # estimates are smoothed across ticks
+    previous = DispatchStats(at=1300.0, depth=300, dispatched=0, throughput=1.0)
+    assert estimate_throughput(previous, 0, 1400.0) == 3.0
+    assert estimate_throughput(previous, 100, 1400.0) == 1.5
@@ -1,9 +1,25 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
 from uuid import UUID, uuid4
 
+import pytest
 from pydantic import HttpUrl
-from sqlmodel import Session
-
-from app.api.v1.models import Website
+from sqlalchemy import event, insert
+from sqlmodel import Session, select
+
+from app.api.v1.models import (
+    ErrorClass,
+    Incident,
+    LatencyEstimate,
+    LatencySketch,
+    UptimeDay,
+    UptimeLog,
+    Website,
+)
+from app.utils import bitmap, crud
+from app.utils.crud import get_error_class_id, record_uptime_log
+from app.utils.sketch import QuantileSketch
 
 
 def test_create_website_success(client, test_db: Session, logged_in_user):
@@ -32,6 +48,59 @@ def test_create_website_success(client, test_db: Session, logged_in_user):
     assert str(website_in_db.url) == "https://example.com/"
 
 
+def test_create_website_dns_check(client, test_db: Session, logged_in_user):
+    user = logged_in_user["user"]
+    headers = logged_in_user["headers"]
+
+    payload = {
+        "user_id": str(user.id),
+        "name": "Mail",
+        "url": "https://example.com/",
+        "check_type": "DNS",
+        "dns_record_type": "mx",
+        "dns_expected_value": "mail.example.com",
+    }
+    response = client.post("/websites/", json=payload, headers=headers)
+    assert response.status_code == 201
+    data = response.json()
+    assert data["check_type"] == "dns"
+    assert data["dns_record_type"] == "MX"
+
+    payload["dns_record_type"] = "SRV"
+    response = client.post("/websites/", json=payload, headers=headers)
+    assert response.status_code == 422
+
+
+def test_create_website_content_assertions(client, test_db: Session, logged_in_user):
+    user = logged_in_user["user"]
+    headers = logged_in_user["headers"]
+
+    payload = {
+        "user_id": str(user.id),
+        "name": "Shop",
+        "url": "https://shop.example.com/",
+        "probe_method": "GET",
+        "content_assertions": [
+            {"type": "contains", "value": "Add to cart"},
+            {"type": "not_regex", "value": "[Ee]rror \\d+"},
+        ],
+    }
+    response = client.post("/websites/", json=payload, headers=headers)
+    assert response.status_code == 201
+    data = response.json()
+    assert data["probe_method"] == "get"
+    assert data["content_assertions"] == payload["content_assertions"]
+    website = test_db.get(Website, UUID(data["id"]))
+    assert website.content_assertions[0] == {
+        "type": "contains",
+        "value": "Add to cart",
+    }
+
+    payload["content_assertions"] = [{"type": "regex", "value": "(unclosed"}]
+    response = client.post("/websites/", json=payload, headers=headers)
+    assert response.status_code == 422
+
+
 def test_create_website_already_exists(client, test_db: Session, logged_in_user):
     user = logged_in_user["user"]
     headers = logged_in_user["headers"]
@@ -162,13 +231,25 @@ def test_delete_website(client, test_db: Session, logged_in_user):
     test_db.commit()
     test_db.refresh(website)
 
-    response = client.delete(f"/websites/{website.id}", headers=headers)
+    with patch("app.api.v1.routes.website.purge_website.delay") as mock_purge:
+        response = client.delete(f"/websites/{website.id}", headers=headers)
     assert response.status_code == 204
     assert response.content == b""  # No content expected for 204 No Content
+    mock_purge.assert_called_once_with(str(website.id))
 
-    # Verify the website has been deleted from the database
-    deleted_website = test_db.get(Website, website.id)
-    assert deleted_website is None
+    # The website is hidden right away; its rows are purged in the background
+    test_db.refresh(website)
+    assert website.deleted_at is not None
+    assert website.is_active is False
+    response = client.get(f"/websites/{website.id}", headers=headers)
+    assert response.status_code == 404
+    # nor can it be edited (and monitored again) while it waits for its purge
+    response = client.patch(
+        f"/websites/{website.id}", json={"is_active": True}, headers=headers
+    )
+    assert response.status_code == 404
+    test_db.refresh(website)
+    assert website.is_active is False
 
 
 def test_delete_non_existent_website(client, logged_in_user):
@@ -305,3 +386,227 @@ def test_search_website_paginated(client, test_db: Session, logged_in_user):
     assert response.status_code == 200
     data = response.json()
     assert len(data["data"]) == 1
+
+
+def test_get_latency_percentiles(
+    client, test_db: Session, logged_in_user, test_website: Website
+):
+    headers = logged_in_user["headers"]
+    for response_time in range(1, 101):
+        record_uptime_log(
+            test_db,
+            website_id=test_website.id,
+            is_up=True,
+            status_code=200,
+            response_time_us=response_time * 1000,
+        )
+    rows = test_db.exec(select(LatencySketch)).all()
+    assert sum(row.sample_count for row in rows) == 100
+
+    response = client.get(
+        f"/websites/{test_website.id}/latency?q=0.5&q=0.99", headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["sample_count"] == 100
+    assert abs(data["percentiles"]["p50"] - 50) <= 1
+    assert abs(data["percentiles"]["p99"] - 99) <= 1.5
+
+    response = client.get("/websites/latency", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["sample_count"] == 100
+
+    # timestamps without a timezone are UTC
+    start = (datetime.now(timezone.utc) - timedelta(hours=1)).replace(tzinfo=None)
+    for path in (f"/websites/{test_website.id}/latency", "/websites/latency"):
+        response = client.get(
+            path, params={"start": start.isoformat()}, headers=headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["sample_count"] == 100
+        assert datetime.fromisoformat(data["start"]) == start.replace(
+            tzinfo=timezone.utc
+        )
+
+
+@contextmanager
+def racing_writer(db: Session, model, values: dict):
+    """
+    Another writer inserts values into model's table right after db first
+    looked for the row there and found none
+    """
+    raced = []
+
+    def insert_after_select(state):
+        if raced or not state.is_select:
+            return None
+        if model not in [mapper.class_ for mapper in state.all_mappers]:
+            return None
+        raced.append(values)
+        result = state.invoke_statement().freeze()
+        db.connection().execute(insert(model.__table__).values(**values))
+        return result()
+
+    event.listen(db, "do_orm_execute", insert_after_select)
+    try:
+        yield raced
+    finally:
+        event.remove(db, "do_orm_execute", insert_after_select)
+
+
+def _sketch_of(*response_times: float) -> bytes:
+    sketch = QuantileSketch()
+    for response_time in response_times:
+        sketch.add(response_time)
+    return sketch.to_bytes()
+
+
+# model: (the row another writer inserts first, check of the row afterwards)
+FIRST_ROWS = {
+    LatencySketch: (
+        lambda website_id, at: {
+            "website_id": website_id,
+            "bucket_start": at.replace(minute=0, second=0, microsecond=0),
+            "sample_count": 1,
+            "sketch": _sketch_of(5.0),
+        },
+        lambda row: row.sample_count == 2,
+    ),
+    Incident: (
+        lambda website_id, at: {
+            "website_id": website_id,
+            "started_at": at - timedelta(minutes=5),
+            "failure_count": 1,
+        },
+        lambda row: row.failure_count == 2 and row.ended_at is None,
+    ),
+    # the other writer saw the website up in the same slot: the failure wins
+    UptimeDay: (
+        lambda website_id, at: dict(
+            zip(
+                ("up_bits", "known_bits"),
+                bitmap.set_slot(
+                    bitmap.empty_day(), bitmap.empty_day(), bitmap.slot_for(at), True
+                ),
+            ),
+            website_id=website_id,
+            day=at.date(),
+        ),
+        lambda row: list(bitmap.popcounts([row.known_bits, row.up_bits])) == [1, 0],
+    ),
+    # only up checks feed the estimate: the 10ms check is folded into 100ms
+    LatencyEstimate: (
+        lambda website_id, at: {
+            "website_id": website_id,
+            "mean_ms": 100.0,
+            "variance_ms2": 0.0,
+            "sample_count": 1,
+            "updated_at": at,
+        },
+        lambda row: row.sample_count == 2 and row.mean_ms == pytest.approx(82.0),
+    ),
+}
+
+
+@pytest.mark.parametrize("model", list(FIRST_ROWS))
+def test_derived_rows_first_written_concurrently(
+    test_db: Session, test_website: Website, model
+):
+    website_id = test_website.id
+    now = datetime.now(timezone.utc)
+    values, check = FIRST_ROWS[model]
+    with racing_writer(test_db, model, values(website_id, now)) as raced:
+        record_uptime_log(
+            test_db,
+            website_id=website_id,
+            is_up=model is LatencyEstimate,
+            response_time_us=10_000,
+            error_message=None if model is LatencyEstimate else "Connection timeout",
+            timestamp=now,
+        )
+    assert raced
+    # the check is saved, merged into the other writer's row
+    assert test_db.exec(select(UptimeLog)).one().website_id == website_id
+    (row,) = test_db.exec(select(model)).all()
+    assert check(row)
+
+
+def test_incidents_from_uptime_transitions(
+    client, test_db: Session, logged_in_user, test_website: Website
+):
+    headers = logged_in_user["headers"]
+    now = datetime.now(timezone.utc)
+    # up, down, down (one incident of 10 minutes), up, down (open incident)
+    checks = [(50, True), (45, False), (40, False), (35, True), (5, False)]
+    for minutes_ago, is_up in checks:
+        record_uptime_log(
+            test_db,
+            website_id=test_website.id,
+            is_up=is_up,
+            error_message=None if is_up else "Connection timeout",
+            timestamp=now - timedelta(minutes=minutes_ago),
+        )
+
+    response = client.get(f"/websites/{test_website.id}/incidents", headers=headers)
+    assert response.status_code == 200
+    incidents = response.json()["data"]
+    assert len(incidents) == 2
+    assert incidents[0]["duration_seconds"] == 600
+    assert incidents[0]["failure_count"] == 2
+    assert incidents[0]["cause"] == "Connection timeout"
+    assert incidents[1]["ended_at"] is None
+
+    start = (now - timedelta(hours=1)).isoformat()
+    response = client.get(
+        f"/websites/{test_website.id}/incidents/stats",
+        params={"start": start, "end": now.isoformat()},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["incident_count"] == 2
+    assert stats["mttr_seconds"] == 600
+    assert 890 <= stats["downtime_seconds"] <= 910
+    assert stats["mtbf_seconds"] == pytest.approx((3600 - 900) / 2, abs=10)
+
+
+def test_get_availability(
+    client, test_db: Session, logged_in_user, test_website: Website
+):
+    headers = logged_in_user["headers"]
+    now = datetime.now(timezone.utc)
+    today = now.replace(hour=12, minute=0)
+    yesterday = today - timedelta(days=1)
+    for offset, is_up in enumerate([True, True, True, False]):
+        record_uptime_log(
+            test_db,
+            website_id=test_website.id,
+            is_up=is_up,
+            timestamp=yesterday + timedelta(minutes=5 * offset),
+        )
+    record_uptime_log(test_db, website_id=test_website.id, is_up=True, timestamp=today)
+
+    response = client.get("/websites/availability?days=3", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["data"]) == 1
+    site = data["data"][0]
+    assert site["website_id"] == str(test_website.id)
+    assert site["days"] == [None, 0.75, 1.0]
+    assert site["checks"] == 5
+    assert site["availability"] == 0.8
+
+
+def test_error_classes_are_shared_and_cached_after_commit(test_db: Session):
+    first = get_error_class_id(test_db, "DNS lookup failed for example.com")
+    assert get_error_class_id(test_db, "DNS lookup failed for other.org.") == first
+    assert get_error_class_id(test_db, "Connect to 10.0.0.1:443 refused") != first
+    assert not crud._error_class_ids  # nothing cached before the commit
+
+    test_db.rollback()
+    # the rolled back ids are forgotten
+    error_id = get_error_class_id(test_db, "Domain www.example.com does not exist")
+    test_db.commit()
+    assert crud._error_class_ids == {"Domain <host> does not exist": error_id}
+    assert test_db.get(ErrorClass, error_id).message == "Domain <host> does not exist"